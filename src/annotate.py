@@ -0,0 +1,277 @@
+import json
+import re
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+from command_line_options import get_option_value
+from headword_chooser import choose_headword
+from headword_lookup import HeadwordLookup, open_headword_lookup
+from headword_ranker import rank_headwords
+from lru_cache import LRUCache
+from match_usage_sense_disambiguator import (
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    MatchingUsageHeadwordDisambiguator,
+)
+from prepared_lemma import (
+    PreparedLemma,
+    UnknownUsageEmbeddings,
+    UnknownUsageTarget,
+)
+from sense_embedding_index import SenseEmbeddingIndex
+from similarity_calculator import SimilarityCalculator
+from similarity_flattener import AverageStrategy, MaxStrategy
+
+# The `0.2/M/M/A/0.3/0.1` configuration chosen in the README.
+DEFAULT_DEFINITION_WEIGHT = 0.2
+DEFAULT_FLATTENERS = (MaxStrategy, MaxStrategy, AverageStrategy)
+DEFAULT_MIN_ACCEPTANCE = 0.3
+DEFAULT_MIN_DELTA = 0.1
+
+SENTENCE_PATTERN = re.compile(r"[^\n.!?]*[.!?]*")
+
+
+def split_into_sentences(text: str) -> List[Tuple[int, str]]:
+    """Splits `text` at line breaks and sentence-ending punctuation, returning
+    each non-blank sentence with its character offset in `text`."""
+
+    return [
+        (match.start(), match.group())
+        for match in SENTENCE_PATTERN.finditer(text)
+        if match.group().strip() != ""
+    ]
+
+
+class Annotator:
+    """Finds every dictionary lemma in a stream of documents and picks a
+    headword for each of them.
+
+    Documents are processed `documents_per_batch` at a time, so memory stays
+    bounded no matter how long the stream is, and the sentences of a batch
+    are embedded together."""
+
+    def __init__(
+        self,
+        disambiguator: MatchingUsageHeadwordDisambiguator,
+        headword_lookup: HeadwordLookup,
+        *,
+        definition_weight: float = DEFAULT_DEFINITION_WEIGHT,
+        similarity_calculator: SimilarityCalculator | None = None,
+        min_acceptance: float = DEFAULT_MIN_ACCEPTANCE,
+        min_delta: float = DEFAULT_MIN_DELTA,
+        documents_per_batch: int = 16,
+        prepared_lemma_cache_size: int = 1000,
+        sense_embedding_index: SenseEmbeddingIndex | None = None,
+    ):
+        if (
+            sense_embedding_index is not None
+            and sense_embedding_index.pretrained_model
+            != disambiguator.embedder.embedding_model_name
+        ):
+            raise ValueError(
+                f"Sense embedding index was built with "
+                f"'{sense_embedding_index.pretrained_model}', not "
+                f"'{disambiguator.embedder.embedding_model_name}'"
+            )
+
+        self.disambiguator = disambiguator
+        self.headword_lookup = headword_lookup
+        self.sense_embedding_index = sense_embedding_index
+
+        self.definition_weight = definition_weight
+        self.similarity_calculator = similarity_calculator or SimilarityCalculator(
+            *DEFAULT_FLATTENERS
+        )
+        self.min_acceptance = min_acceptance
+        self.min_delta = min_delta
+
+        self.documents_per_batch = documents_per_batch
+        self.prepared_lemmas = LRUCache(prepared_lemma_cache_size)
+
+        self.num_tokens_annotated = 0
+
+    def get_prepared_lemma(self, lemma: str) -> PreparedLemma | None:
+        """Returns the prepared headwords of `lemma`, or `None` if it is not
+        in the dictionary. Lemmas not in the dictionary are remembered too.
+
+        Lemmas in the sense embedding index are read from it instead of
+        being embedded."""
+
+        if (
+            self.sense_embedding_index is not None
+            and lemma in self.sense_embedding_index
+        ):
+            return self.sense_embedding_index.get_prepared_lemma(lemma)
+
+        cached = self.prepared_lemmas.get(lemma)
+
+        if cached is not None:
+            return cached[0]
+
+        known_headwords = self.headword_lookup.get_known_headwords(lemma)
+
+        prepared_lemma = None
+        if len(known_headwords) > 0:
+            prepared_lemma = self.disambiguator.prepare_lemma(lemma, known_headwords)
+
+        # wrapped so that lemmas without headwords are cached as well
+        self.prepared_lemmas.put(lemma, (prepared_lemma,))
+
+        return prepared_lemma
+
+    def annotate(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        """Yields each document with an "annotations" list holding the chosen
+        headword of every lemma found in its "text"."""
+
+        documents = iter(documents)
+
+        while True:
+            batch = list(islice(documents, self.documents_per_batch))
+
+            if len(batch) == 0:
+                return
+
+            yield from self._annotate_batch(batch)
+
+    def _annotate_batch(self, documents: List[Dict]) -> List[Dict]:
+        sentences_by_document = [
+            split_into_sentences(document["text"]) for document in documents
+        ]
+
+        targets_by_sentence = iter(
+            self.disambiguator.embed_all_targets_batch(
+                [
+                    sentence
+                    for sentences in sentences_by_document
+                    for _, sentence in sentences
+                ]
+            )
+        )
+
+        annotated_documents = []
+
+        for document, sentences in zip(documents, sentences_by_document):
+            annotations = []
+
+            for sentence_start, sentence in sentences:
+                for target in next(targets_by_sentence):
+                    self.num_tokens_annotated += 1
+
+                    for lemma in target.lemmas:
+                        annotation = self._annotate_target(lemma, target)
+
+                        if annotation is None:
+                            continue
+
+                        annotation["start"] = sentence_start + target.char_start
+                        annotation["end"] = sentence_start + target.char_end
+                        annotation["token"] = sentence[
+                            target.char_start : target.char_end
+                        ]
+                        annotations.append(annotation)
+
+            annotated_documents.append({**document, "annotations": annotations})
+
+        return annotated_documents
+
+    def _annotate_target(self, lemma: str, target: UnknownUsageTarget) -> Dict | None:
+        prepared_lemma = self.get_prepared_lemma(lemma)
+
+        if prepared_lemma is None:
+            return None
+
+        return {"lemma": lemma, **self.choose(prepared_lemma, target.embeddings)}
+
+    def choose(
+        self,
+        prepared_lemma: PreparedLemma,
+        unknown_usage_embeddings: UnknownUsageEmbeddings,
+    ) -> Dict:
+        """Ranks the headwords of `prepared_lemma` and chooses one, if any is
+        a confident enough match."""
+
+        ranking = rank_headwords(
+            prepared_lemma,
+            unknown_usage_embeddings,
+            self.definition_weight,
+            self.similarity_calculator,
+        )
+
+        return {
+            "headword_index": choose_headword(
+                ranking,
+                min_acceptance=self.min_acceptance,
+                min_delta=self.min_delta,
+            ),
+            "ranking": ranking,
+        }
+
+
+def read_documents(stream: TextIO) -> Iterator[Dict]:
+    """Reads one document per line. Lines holding a JSON object are used as
+    is and must have a "text" key; any other line is taken as raw text."""
+
+    for line_number, line in enumerate(stream):
+        line = line.rstrip("\n")
+
+        if line.strip() == "":
+            continue
+
+        try:
+            document = json.loads(line)
+        except json.JSONDecodeError:
+            document = None
+
+        if not isinstance(document, dict):
+            document = {"id": line_number, "text": line}
+        elif "text" not in document:
+            raise ValueError(f"Document on line {line_number + 1} has no 'text'.")
+
+        yield document
+
+
+def write_documents(documents: Iterable[Dict], stream: TextIO) -> None:
+    for document in documents:
+        print(json.dumps(document, ensure_ascii=False), file=stream, flush=True)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 3:
+        raise ValueError(
+            """Usage: `python annotate.py
+            <language>
+            <dictionary_path (test case directory or database)>
+            [--documents-per-batch <n>]
+            [--sense-index <index_dir>]` < documents.jsonl > annotations.jsonl"""
+        )
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    sense_index_dir = get_option_value(args, "--sense-index", None)
+
+    annotator = Annotator(
+        MatchingUsageHeadwordDisambiguator(
+            args[1], embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR
+        ),
+        open_headword_lookup(args[2]),
+        documents_per_batch=int(get_option_value(args, "--documents-per-batch", "16")),
+        sense_embedding_index=(
+            SenseEmbeddingIndex(sense_index_dir)
+            if sense_index_dir is not None
+            else None
+        ),
+    )
+
+    start_time = time.perf_counter()
+    write_documents(annotator.annotate(read_documents(sys.stdin)), sys.stdout)
+    elapsed_time = time.perf_counter() - start_time
+
+    print(
+        f"Annotated {annotator.num_tokens_annotated} tokens in {elapsed_time:.2f}s "
+        f"({annotator.num_tokens_annotated / max(elapsed_time, 1e-9):.1f} tokens/sec)",
+        file=sys.stderr,
+    )
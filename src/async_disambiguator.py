@@ -0,0 +1,244 @@
+import asyncio
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Tuple
+from annotate import Annotator
+from command_line_options import get_option_value
+from headword_lookup import open_headword_lookup
+from match_usage_sense_disambiguator import (
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    MatchingUsageHeadwordDisambiguator,
+)
+
+
+class AsyncDisambiguator:
+    """asyncio front end for an `Annotator`, for submitting many sentences
+    concurrently from one event loop.
+
+    Each request is lemmatized and tagged on a pool of `lemmatizer_threads`
+    threads, then queued for the inference thread, which embeds and ranks
+    whatever requests are queued in one batch. So sentences are parsed while
+    the model runs on earlier ones. The lemmatizer is allowed as many parsers
+    as there are lemmatizer threads, each a full load of its model. At most `max_queued_requests` requests
+    wait for inference; `disambiguate` waits for room beyond that.
+
+    Use as `async with AsyncDisambiguator(annotator) as disambiguator:`."""
+
+    def __init__(
+        self,
+        annotator: Annotator,
+        *,
+        lemmatizer_threads: int = 2,
+        max_batch_size: int = 32,
+        max_queued_requests: int = 256,
+    ):
+        self.annotator = annotator
+        self.max_batch_size = max_batch_size
+        self.max_queued_requests = max_queued_requests
+
+        lemmatizer = annotator.disambiguator.usage_preprocessor.lemmatizer
+        lemmatizer.max_parsers = max(lemmatizer.max_parsers, lemmatizer_threads)
+
+        self.lemmatizer_executor = ThreadPoolExecutor(
+            lemmatizer_threads, thread_name_prefix="lemmatizer"
+        )
+        # the model is only ever run from this one thread
+        self.inference_executor = ThreadPoolExecutor(1, thread_name_prefix="inference")
+
+        self.queue: asyncio.Queue | None = None
+        self.batch_task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "AsyncDisambiguator":
+        self.queue = asyncio.Queue(self.max_queued_requests)
+        self.batch_task = asyncio.create_task(self._run_batches())
+
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.queue.join()
+        self.batch_task.cancel()
+
+        try:
+            await self.batch_task
+        except asyncio.CancelledError:
+            pass
+
+        self.lemmatizer_executor.shutdown()
+        self.inference_executor.shutdown()
+
+    def _tag(self, lemma: str, sentence: str) -> str:
+        usage_preprocessor = self.annotator.disambiguator.usage_preprocessor
+
+        return usage_preprocessor.get_tagged_unknown_usage(lemma, sentence)
+
+    async def disambiguate(self, lemma: str, sentence: str) -> Dict:
+        """Returns the ranking of the headwords of `lemma` for its usage in
+        `sentence` and the chosen headword, or an "error" if the lemma is not
+        in the dictionary."""
+
+        if self.queue is None:
+            raise ValueError("AsyncDisambiguator must be used with `async with`.")
+
+        loop = asyncio.get_running_loop()
+
+        tagged_sentence = await loop.run_in_executor(
+            self.lemmatizer_executor, self._tag, lemma, sentence
+        )
+
+        response = loop.create_future()
+        await self.queue.put((lemma, sentence, tagged_sentence, response))
+
+        return await response
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                responses = await loop.run_in_executor(
+                    self.inference_executor,
+                    self._process_batch,
+                    [request[:3] for request in batch],
+                )
+            # a response is already done if its caller stopped waiting for it,
+            # as with `asyncio.wait_for`
+            except Exception as error:
+                for *_, response in batch:
+                    if not response.done():
+                        response.set_exception(error)
+            else:
+                for (*_, response), result in zip(batch, responses):
+                    if response.done():
+                        continue
+
+                    if isinstance(result, Exception):
+                        response.set_exception(result)
+                    else:
+                        response.set_result(result)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _process_batch(
+        self, requests: List[Tuple[str, str, str]]
+    ) -> List[Dict | Exception]:
+        """Answers `requests` together, or one at a time if that fails, so
+        that a request that cannot be answered only fails itself."""
+
+        try:
+            return self._process_requests(requests)
+        except Exception:
+            if len(requests) == 1:
+                raise
+
+        responses: List[Dict | Exception] = []
+
+        for request in requests:
+            try:
+                responses.extend(self._process_requests([request]))
+            except Exception as error:
+                responses.append(error)
+
+        return responses
+
+    def _process_requests(self, requests: List[Tuple[str, str, str]]) -> List[Dict]:
+        responses: List[Dict | None] = [None] * len(requests)
+        known_requests = []
+
+        for i, (lemma, sentence, tagged_sentence) in enumerate(requests):
+            prepared_lemma = self.annotator.get_prepared_lemma(lemma)
+
+            if prepared_lemma is None:
+                responses[i] = {"error": f"Unknown lemma '{lemma}'"}
+            else:
+                known_requests.append((i, prepared_lemma, sentence, tagged_sentence))
+
+        disambiguator = self.annotator.disambiguator
+        all_embeddings = disambiguator.embed_tagged_unknown_usages_batch(
+            [sentence for _, _, sentence, _ in known_requests],
+            [tagged_sentence for *_, tagged_sentence in known_requests],
+        )
+
+        for (i, prepared_lemma, *_), embeddings in zip(known_requests, all_embeddings):
+            responses[i] = self.annotator.choose(prepared_lemma, embeddings)
+
+        return responses
+
+
+async def _respond(disambiguator: AsyncDisambiguator, request: Dict) -> Dict:
+    try:
+        return await disambiguator.disambiguate(request["lemma"], request["sentence"])
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+async def main(args: List[str]) -> None:
+    annotator = Annotator(
+        MatchingUsageHeadwordDisambiguator(
+            args[1], embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR
+        ),
+        open_headword_lookup(args[2]),
+    )
+
+    max_batch_size = int(get_option_value(args, "--max-batch-size", "32"))
+    max_requests_in_flight = int(
+        get_option_value(args, "--max-requests-in-flight", str(4 * max_batch_size))
+    )
+
+    loop = asyncio.get_running_loop()
+
+    async with AsyncDisambiguator(
+        annotator,
+        lemmatizer_threads=int(get_option_value(args, "--lemmatizer-threads", "2")),
+        max_batch_size=max_batch_size,
+    ) as disambiguator:
+        # requests are read as room frees up and answered in the order read
+        in_flight: Deque[Tuple[Dict, asyncio.Task]] = deque()
+
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+
+            if line == "":
+                break
+
+            if line.strip() == "":
+                continue
+
+            request = json.loads(line)
+            in_flight.append(
+                (request, asyncio.create_task(_respond(disambiguator, request)))
+            )
+
+            if len(in_flight) >= max_requests_in_flight:
+                request, task = in_flight.popleft()
+                print(json.dumps({**request, **await task}, ensure_ascii=False))
+
+        for request, task in in_flight:
+            print(json.dumps({**request, **await task}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 3:
+        raise ValueError(
+            """Usage: `python async_disambiguator.py
+            <language>
+            <dictionary_path (test case directory or database)>
+            [--lemmatizer-threads <n>]
+            [--max-batch-size <n>]
+            [--max-requests-in-flight <n>]` < requests.jsonl > responses.jsonl"""
+        )
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    asyncio.run(main(args))
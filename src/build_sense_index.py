@@ -0,0 +1,65 @@
+import sys
+import time
+from command_line_options import get_option_value
+from headword_lookup import open_headword_lookup
+from match_usage_sense_disambiguator import (
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    MatchingUsageHeadwordDisambiguator,
+)
+from sense_embedding_index import (
+    DEFAULT_MIN_USAGES_FOR_CLUSTERS,
+    SenseEmbeddingIndexWriter,
+)
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 4:
+        raise ValueError(
+            """Usage: `python build_sense_index.py
+            <language>
+            <dictionary_path (test case directory or database)>
+            <index_dir>
+            [--min-usages-for-clusters <n>]
+            [--dtype <float32|float16>]`"""
+        )
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    disambiguator = MatchingUsageHeadwordDisambiguator(
+        args[1], embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR
+    )
+    headword_lookup = open_headword_lookup(args[2])
+
+    writer = SenseEmbeddingIndexWriter(
+        args[3],
+        disambiguator.embedder.embedding_model_name,
+        disambiguator.embedder.model.config.hidden_size,
+        min_usages_for_clusters=int(
+            get_option_value(
+                args,
+                "--min-usages-for-clusters",
+                str(DEFAULT_MIN_USAGES_FOR_CLUSTERS),
+            )
+        ),
+        dtype=get_option_value(args, "--dtype", "float32"),
+    )
+
+    start_time = time.perf_counter()
+
+    for lemma in headword_lookup.iterate_lemmas():
+        writer.add(
+            disambiguator.prepare_lemma(
+                lemma, headword_lookup.get_known_headwords(lemma)
+            )
+        )
+
+    writer.close()
+
+    print(
+        f"Indexed {len(writer.lemmas)} lemmas in "
+        f"{time.perf_counter() - start_time:.2f}s.",
+        file=sys.stderr,
+    )
@@ -0,0 +1,31 @@
+import sys
+from match_usage_sense_disambiguator import MatchingUsageHeadwordDisambiguator
+from model_bundle import save_model_bundle
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 3:
+        raise ValueError(
+            """Usage: `python bundle_model.py
+            <language>
+            <bundle_dir>`"""
+        )
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    disambiguator = MatchingUsageHeadwordDisambiguator(args[1])
+    embedder = disambiguator.embedder
+
+    save_model_bundle(
+        args[2],
+        args[1],
+        embedder.pretrained_model,
+        embedder.tokenizer,
+        embedder.model,
+        getattr(disambiguator.usage_preprocessor.lemmatizer, "dictionary_path", None),
+    )
+
+    print(f"Saved the {embedder.pretrained_model} bundle to {args[2]}")
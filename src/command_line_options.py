@@ -0,0 +1,16 @@
+from typing import List
+
+
+def get_option_value(args: List[str], option: str, default: str | None) -> str | None:
+    """Returns the value following `option` in `args`, or `default` if the
+    option was not passed."""
+
+    if option not in args:
+        return default
+
+    index_of_value = args.index(option) + 1
+
+    if index_of_value >= len(args):
+        raise ValueError(f"{option} must be followed by a value.")
+
+    return args[index_of_value]
@@ -0,0 +1,125 @@
+import sys
+import time
+from typing import Dict, List, Tuple
+import torch
+from command_line_options import get_option_value
+from embedder import Embedder
+from inference_backends import (
+    DEFAULT_EXPORT_DIR,
+    EXPORT_TOLERANCE,
+    INFERENCE_BACKENDS,
+    create_inference_backend,
+)
+from match_usage_sense_disambiguator import MatchingUsageHeadwordDisambiguator
+from run_all_tests import iterate_test_cases_in_dir
+
+
+def get_texts_of_test_cases(
+    dir: str, disambiguator: MatchingUsageHeadwordDisambiguator
+) -> Tuple[List[str], List[str]]:
+    """Definitions and tagged known usages of every test case in `dir`."""
+
+    definitions = []
+    tagged_usages = []
+
+    for test_case in iterate_test_cases_in_dir(dir):
+        definitions.extend(
+            sense["definition"]
+            for headword in test_case.known_headwords
+            for sense in headword["known_senses"]
+        )
+        tagged_usages.extend(
+            usage
+            for senses in disambiguator.usage_preprocessor.tag_known_usages(
+                test_case.lemma, test_case.known_headwords
+            )
+            for usages in senses
+            for usage in usages
+        )
+
+    return definitions, tagged_usages
+
+
+def get_timed_embeddings(
+    embedder: Embedder, definitions: List[str], tagged_usages: List[str]
+) -> Dict[str, torch.Tensor]:
+    """The average token embeddings of `definitions` and the target span
+    embeddings of `tagged_usages`, which are what headwords are ranked by.
+    `embedder` must not have an embedding cache, or the backend would not
+    run for texts embedded before."""
+
+    start_time = time.perf_counter()
+    embeddings = {
+        "average token": embedder.get_average_token_embeddings(definitions),
+        "target span": embedder.get_embeddings_from_tgt_marked_texts(tagged_usages),
+    }
+    print(
+        f"{type(embedder.inference_backend).__name__}: "
+        f"{time.perf_counter() - start_time:.2f}s for "
+        f"{len(definitions) + len(tagged_usages)} texts"
+    )
+
+    return {
+        name: torch.stack([embedding.reshape(-1) for embedding in mode_embeddings])
+        for name, mode_embeddings in embeddings.items()
+        if len(mode_embeddings) > 0
+    }
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 4:
+        raise ValueError(
+            """Usage: `python compare_backends.py
+            <language>
+            <backend>
+            <test_case_dir>
+            [--tolerance <max absolute difference>]`"""
+        )
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    if args[2] not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{args[2]}'")
+
+    tolerance = float(get_option_value(args, "--tolerance", str(EXPORT_TOLERANCE)))
+
+    disambiguator = MatchingUsageHeadwordDisambiguator(
+        args[1], embedding_cache_dir=None
+    )
+    embedder = disambiguator.embedder
+
+    definitions, tagged_usages = get_texts_of_test_cases(args[3], disambiguator)
+
+    reference_embeddings = get_timed_embeddings(embedder, definitions, tagged_usages)
+
+    # The candidate runs the same model, since the added special tokens are
+    # initialized randomly whenever a model is loaded.
+    embedder.inference_backend = create_inference_backend(
+        args[2], embedder.model, embedder.pretrained_model, DEFAULT_EXPORT_DIR
+    )
+    candidate_embeddings = get_timed_embeddings(embedder, definitions, tagged_usages)
+
+    max_difference = 0.0
+
+    for name, reference in reference_embeddings.items():
+        candidate = candidate_embeddings[name]
+
+        difference = (reference - candidate).abs().max().item()
+        min_cosine_similarity = (
+            torch.cosine_similarity(reference, candidate).min().item()
+        )
+
+        print(f"{name} embeddings:")
+        print(f"  Max absolute difference: {difference:.2e}")
+        print(f"  Min cosine similarity: {min_cosine_similarity:.6f}")
+
+        max_difference = max(max_difference, difference)
+
+    if max_difference > tolerance:
+        raise ValueError(
+            f"Embeddings of the {args[2]} backend differ by more than {tolerance}"
+        )
@@ -0,0 +1,123 @@
+import multiprocessing
+import sys
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from run_all_tests import run_all_in_dir
+from test_types import Language
+
+INPUT_DIRS: Dict[str, str] = {"korean": "inputs/kor", "english": "inputs/eng"}
+
+# The `0.2/M/M/A/0.3/0.1` configuration chosen in the README.
+CHOSEN_CONFIG = {
+    "definition_weight": 0.2,
+    "known_usage_similarity_flattener": "MaxStrategy",
+    "known_usage_second_similarity_flattener": "MaxStrategy",
+    "definition_similarity_flattener": "AverageStrategy",
+    "min_acceptance": 0.3,
+    "min_delta": 0.1,
+}
+
+
+def _run_in_dir(
+    dir: str, language: Language, quantize: bool
+) -> Tuple[Dict[str, np.ndarray], float]:
+    start_time = time.perf_counter()
+
+    # Nothing is read from the embedding cache, so both runs embed every
+    # text and their times are comparable.
+    results, _ = run_all_in_dir(
+        dir,
+        language,
+        disambiguator_options={"embedding_cache_dir": None, "quantize": quantize},
+    )
+
+    return results, time.perf_counter() - start_time
+
+
+def run_in_fresh_process(
+    dir: str, language: Language, quantize: bool
+) -> Tuple[Dict[str, np.ndarray], float]:
+    """Runs every test case in `dir` in a new process, so that neither model
+    is timed or measured with the other one still loaded. Both get the same
+    embeddings of the added special tokens, since `Embedder` initializes
+    them with `torch.manual_seed` inside `torch.random.fork_rng` on every
+    load."""
+
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_in_dir, (dir, language, quantize))
+
+
+def get_choice_summary(results: Dict[str, np.ndarray], rows: np.ndarray) -> str:
+    choice_results = results["choice_result"][rows]
+    num_chosen = np.count_nonzero(choice_results)
+    num_correct = np.count_nonzero(choice_results == 1)
+
+    return (
+        f"{num_correct / max(num_chosen, 1):.1%} correct of "
+        f"{num_chosen / max(len(choice_results), 1):.1%} chosen"
+    )
+
+
+def print_comparison(
+    language: Language,
+    full_precision: Tuple[Dict[str, np.ndarray], float],
+    quantized: Tuple[Dict[str, np.ndarray], float],
+) -> None:
+    (full_results, full_time), (quantized_results, quantized_time) = (
+        full_precision,
+        quantized,
+    )
+
+    num_rows = len(full_results["choice_result"])
+    chosen_config_rows = np.ones(num_rows, dtype=bool)
+    for column, value in CHOSEN_CONFIG.items():
+        chosen_config_rows &= full_results[column] == value
+
+    difference = (
+        quantized_results["correct_minus_best_incorrect"]
+        - full_results["correct_minus_best_incorrect"]
+    )
+    is_same_choice = quantized_results["choice_result"] == full_results["choice_result"]
+
+    print(f"=== {language} ===")
+    print(
+        f"Time: {full_time:.2f}s full precision, {quantized_time:.2f}s quantized "
+        f"({full_time / max(quantized_time, 1e-9):.2f}x)"
+    )
+    print(
+        "correct_minus_best_incorrect change: "
+        f"mean {difference.mean():+.4f}, "
+        f"mean absolute {np.abs(difference).mean():.4f}, "
+        f"max absolute {np.abs(difference).max():.4f}"
+    )
+    print(f"Same choice result: {is_same_choice.mean():.1%} of configurations")
+    print(
+        "Chosen configuration: "
+        f"{get_choice_summary(full_results, chosen_config_rows)} full precision, "
+        f"{get_choice_summary(quantized_results, chosen_config_rows)} quantized"
+    )
+    print(
+        "All configurations: "
+        f"{get_choice_summary(full_results, np.arange(num_rows))} full precision, "
+        f"{get_choice_summary(quantized_results, np.arange(num_rows))} quantized"
+    )
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 2 or args[1] not in ["english", "korean", "all"]:
+        raise ValueError(
+            "language passed must be one of 'english', 'korean', or 'all'."
+        )
+
+    languages: List[Language] = ["korean", "english"] if args[1] == "all" else [args[1]]
+
+    for language in languages:
+        print_comparison(
+            language,
+            run_in_fresh_process(INPUT_DIRS[language], language, False),
+            run_in_fresh_process(INPUT_DIRS[language], language, True),
+        )
@@ -0,0 +1,170 @@
+import sqlite3
+from typing import Dict, Iterator, List
+from headword_lookup import HeadwordLookup
+from test_types import KnownHeadwordInformation
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS headwords (
+    id INTEGER PRIMARY KEY,
+    lemma TEXT NOT NULL,
+    headword_index INTEGER NOT NULL,
+    source_id TEXT
+);
+CREATE TABLE IF NOT EXISTS senses (
+    id INTEGER PRIMARY KEY,
+    headword_id INTEGER NOT NULL REFERENCES headwords(id),
+    sense_index INTEGER NOT NULL,
+    definition TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usages (
+    sense_id INTEGER NOT NULL REFERENCES senses(id),
+    usage_index INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+"""
+
+# Created after bulk imports, since filling indexed tables row by row is
+# much slower than indexing them once.
+INDEXES = """
+CREATE INDEX IF NOT EXISTS headwords_by_lemma ON headwords(lemma, headword_index);
+CREATE INDEX IF NOT EXISTS senses_by_headword ON senses(headword_id, sense_index);
+CREATE INDEX IF NOT EXISTS usages_by_sense ON usages(sense_id, usage_index);
+"""
+
+DROP_INDEXES = """
+DROP INDEX IF EXISTS headwords_by_lemma;
+DROP INDEX IF EXISTS senses_by_headword;
+DROP INDEX IF EXISTS usages_by_sense;
+"""
+
+
+class DictionaryStore(HeadwordLookup):
+    """On-disk dictionary in an SQLite database.
+
+    Headwords are indexed by lemma, so looking one lemma up is a B-tree
+    search that only reads the senses and usages of that lemma's headwords,
+    and the dictionary never has to be loaded into memory."""
+
+    def __init__(self, path: str):
+        # Lookups may come from a different thread than the one that opened
+        # the store, as in the server, but never from two at once.
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def create_indexes(self) -> None:
+        self.connection.executescript(INDEXES)
+        self.connection.commit()
+
+    def clear(self) -> None:
+        """Removes every headword, and the indexes, which are created again
+        by `create_indexes` once the store is filled."""
+
+        self.connection.executescript(DROP_INDEXES)
+        self.connection.execute("DELETE FROM usages")
+        self.connection.execute("DELETE FROM senses")
+        self.connection.execute("DELETE FROM headwords")
+        self.connection.commit()
+
+    def add_lemma(
+        self,
+        lemma: str,
+        known_headwords: List[KnownHeadwordInformation],
+        source_ids: List[str] | None = None,
+        first_headword_index: int | None = None,
+    ) -> None:
+        """Appends the headwords of `lemma` after any it already has. Does not
+        commit, so that bulk imports can add many lemmas per transaction.
+
+        Bulk imports pass `first_headword_index`, the number of headwords the
+        lemma already has, since counting them scans the whole table until
+        the indexes are created."""
+
+        cursor = self.connection.cursor()
+
+        if first_headword_index is None:
+            first_headword_index = cursor.execute(
+                "SELECT COUNT(*) FROM headwords WHERE lemma = ?", (lemma,)
+            ).fetchone()[0]
+
+        for i, headword in enumerate(known_headwords):
+            cursor.execute(
+                "INSERT INTO headwords (lemma, headword_index, source_id) "
+                "VALUES (?, ?, ?)",
+                (
+                    lemma,
+                    first_headword_index + i,
+                    source_ids[i] if source_ids is not None else None,
+                ),
+            )
+            headword_id = cursor.lastrowid
+
+            for sense_index, sense in enumerate(headword["known_senses"]):
+                cursor.execute(
+                    "INSERT INTO senses (headword_id, sense_index, definition) "
+                    "VALUES (?, ?, ?)",
+                    (headword_id, sense_index, sense["definition"]),
+                )
+                sense_id = cursor.lastrowid
+
+                cursor.executemany(
+                    "INSERT INTO usages (sense_id, usage_index, text) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (sense_id, usage_index, usage)
+                        for usage_index, usage in enumerate(sense["known_usages"])
+                    ],
+                )
+
+    def get_num_headwords_by_lemma(self) -> Dict[str, int]:
+        return dict(
+            self.connection.execute(
+                "SELECT lemma, COUNT(*) FROM headwords GROUP BY lemma"
+            )
+        )
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def get_known_headwords(self, lemma: str) -> List[KnownHeadwordInformation]:
+        rows = self.connection.execute(
+            """
+            SELECT headwords.headword_index, senses.id, senses.definition,
+                usages.text
+            FROM headwords
+            JOIN senses ON senses.headword_id = headwords.id
+            LEFT JOIN usages ON usages.sense_id = senses.id
+            WHERE headwords.lemma = ?
+            ORDER BY headwords.headword_index, senses.sense_index,
+                usages.usage_index
+            """,
+            (lemma,),
+        )
+
+        known_headwords = []
+        last_headword_index = None
+        last_sense_id = None
+
+        for headword_index, sense_id, definition, usage in rows:
+            if headword_index != last_headword_index:
+                known_headwords.append({"known_senses": []})
+                last_headword_index = headword_index
+
+            if sense_id != last_sense_id:
+                known_headwords[-1]["known_senses"].append(
+                    {"definition": definition, "known_usages": []}
+                )
+                last_sense_id = sense_id
+
+            if usage is not None:
+                known_headwords[-1]["known_senses"][-1]["known_usages"].append(usage)
+
+        return known_headwords
+
+    def iterate_lemmas(self) -> Iterator[str]:
+        for (lemma,) in self.connection.execute(
+            "SELECT DISTINCT lemma FROM headwords ORDER BY lemma"
+        ):
+            yield lemma
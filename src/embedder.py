@@ -1,8 +1,17 @@
-from typing import List
-from transformers import BertTokenizer, BertModel
-from test_types import KnownHeadwordInformation
+from typing import Dict, Iterator, List, Tuple
+from transformers import BertTokenizerFast, BertModel
+from embedding_cache import EmbeddingCache
+from embedding_scheduler import PaddingStatistics, schedule_length_bucketed_batches
+from inference_backends import (
+    DEFAULT_EXPORT_DIR,
+    MODEL_INPUT_NAMES,
+    create_inference_backend,
+)
+from model_bundle import read_model_bundle_info
 import torch
+import os
 import random
+import time
 import numpy as np
 
 seed_val = 77
@@ -12,96 +21,615 @@ torch.manual_seed(seed_val)
 if torch.cuda.is_available():
     torch.cuda.manual_seed_all(seed_val)
 
+# Subword tokens shared by consecutive windows of a text too long for the
+# model, so that no token is embedded without context on one side. Models
+# with short inputs overlap by at most half a window, so windows advance.
+SLIDING_WINDOW_OVERLAP = 128
+
 
 class Embedder:
 
-    def __init__(self, pretrained_model):
+    def __init__(
+        self,
+        pretrained_model,
+        max_batch_size: int = 32,
+        embedding_cache_dir: str | None = None,
+        *,
+        inference_backend: str = "pytorch",
+        export_dir: str = DEFAULT_EXPORT_DIR,
+        quantize: bool = False,
+        layers: List[int] | None = None,
+        context_window: int | None = None,
+        max_batch_tokens: int | None = None,
+        bundle_dir: str | None = None,
+        embedding_cache_dtype: str = "float32",
+    ):
+        """`bundle_dir` loads the tokenizer and model from a bundle of
+        `pretrained_model` saved by `save_model_bundle`, which already has the
+        target word tokens, instead of from `pretrained_model` itself.
+
+        `max_batch_tokens` limits the tokens of each batch, counting
+        padding, in addition to its `max_batch_size` texts.
+
+        `embedding_cache_dtype` is the dtype embeddings are stored in by the
+        embedding cache. float16 halves the size of the cache, and embeddings
+        read back from it are rounded to float16.
+
+        `quantize` runs every Linear layer of the model in int8, with
+        activations quantized dynamically. It is only supported by the
+        pytorch backend.
+
+        `layers` takes embeddings from the mean hidden state of those encoder
+        layers, counted from 1, instead of the last one. Layers after the
+        highest of them are removed from the model, so they are never run.
+
+        `context_window` embeds [TGT] marked texts from at most that many
+        subword tokens on each side of the target instead of the whole text.
+        Texts longer than the model's maximum sequence length are always
+        trimmed around the target, and untagged ones are embedded in
+        overlapping windows."""
+
+        if context_window is not None and context_window < 0:
+            raise ValueError("The context window must not be negative.")
+
+        self.pretrained_model = pretrained_model
+        self.target_word_tokens = ["[TGT]", "[/TGT]"]
+
+        # seconds spent on each step of loading, for profiling startup
+        self.startup_times: Dict[str, float] = {}
+        start_time = time.perf_counter()
+
+        if bundle_dir is not None:
+            bundled_model = read_model_bundle_info(bundle_dir)["pretrained_model"]
+
+            if bundled_model != pretrained_model:
+                raise ValueError(
+                    f"The bundle in '{bundle_dir}' is of {bundled_model}, not "
+                    f"{pretrained_model}."
+                )
+
+            self.tokenizer = BertTokenizerFast.from_pretrained(bundle_dir)
+            self.startup_times["load tokenizer"] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            self.model = BertModel.from_pretrained(bundle_dir, low_cpu_mem_usage=True)
+            self.startup_times["load model"] = time.perf_counter() - start_time
+        else:
+            self.tokenizer = BertTokenizerFast.from_pretrained(pretrained_model)
+
+            added_target_word_tokens = {
+                "additional_special_tokens": self.target_word_tokens
+            }
+            self.tokenizer.add_special_tokens(added_target_word_tokens)
+            self.startup_times["load tokenizer"] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
 
-        self.tokenizer = BertTokenizer.from_pretrained(pretrained_model)
+            self.model = BertModel.from_pretrained(
+                pretrained_model, low_cpu_mem_usage=True
+            )
 
-        added_target_word_tokens = {"additional_special_tokens": ["[TGT]", "[/TGT]"]}
-        self.tokenizer.add_special_tokens(added_target_word_tokens)
+            # The embeddings of the added special tokens are initialized
+            # randomly, so every embedder of a model gets the same ones from
+            # the seed. Seeding after loading keeps them independent of how
+            # much of the random state loading used.
+            with torch.random.fork_rng():
+                torch.manual_seed(seed_val)
+
+                self.model.resize_token_embeddings(
+                    len(self.tokenizer), mean_resizing=False
+                )
+
+            self.startup_times["load model"] = time.perf_counter() - start_time
 
-        self.model = BertModel.from_pretrained(pretrained_model)
-        self.model.resize_token_embeddings(len(self.tokenizer), mean_resizing=False)
         self.model.eval()
 
-    def get_embedding_from_tgt_marked_text(self, text: str) -> torch.Tensor:
-        inputs = self.tokenizer(text, return_tensors="pt", add_special_tokens=True)
-        tokens = self.tokenizer.tokenize(text)
+        # Names the embeddings this embedder produces, for the embedding
+        # cache and sense embedding indexes. Embeddings of the quantized model
+        # or of other layers differ, so they get a different name.
+        self.embedding_model_name = pretrained_model
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        averaged_layers = None
 
-        start_idx = tokens.index("[TGT]") + 1
-        end_idx = tokens.index("[/TGT]")
+        if layers is not None:
+            layers = sorted(set(layers))
+            num_layers = self.model.config.num_hidden_layers
 
-        hidden_states = outputs.last_hidden_state[0]
-        tagged_embeddings = hidden_states[start_idx:end_idx]
+            if len(layers) == 0 or layers[0] < 1 or layers[-1] > num_layers:
+                raise ValueError(f"Layers must be between 1 and {num_layers}.")
 
-        return torch.mean(tagged_embeddings, dim=0)
+            self.model.encoder.layer = self.model.encoder.layer[: layers[-1]]
+            self.model.config.num_hidden_layers = layers[-1]
 
-    def get_all_embeddings_for_known_usages(
-        self, known_usages: List[List[str]]
-    ) -> List[List[torch.Tensor]]:
-        return [
-            [
-                self.get_embedding_from_tgt_marked_text(known_usage_text)
-                for known_usage_text in set_of_usages
-            ]
-            for set_of_usages in known_usages
-        ]
+            # the last remaining layer is the last hidden state
+            if len(layers) > 1:
+                averaged_layers = layers
 
-    def get_average_token_embedding(self, text: str) -> torch.Tensor:
+            self.embedding_model_name += f" (layers {','.join(map(str, layers))})"
+
+        if quantize:
+            if inference_backend != "pytorch":
+                raise ValueError(
+                    f"Quantization is not supported by the {inference_backend} "
+                    f"backend"
+                )
+
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            self.embedding_model_name += " (dynamic int8)"
 
-        inputs = self.tokenizer(
-            text, return_tensors="pt", padding=True, truncation=True
+        start_time = time.perf_counter()
+        self.inference_backend = create_inference_backend(
+            inference_backend,
+            self.model,
+            pretrained_model,
+            export_dir,
+            averaged_layers,
         )
+        self.startup_times["create inference backend"] = (
+            time.perf_counter() - start_time
+        )
+
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.padding_statistics = PaddingStatistics()
+        self.max_sequence_length = min(
+            self.tokenizer.model_max_length,
+            self.model.config.max_position_embeddings,
+        )
+        if self.max_sequence_length <= 2:
+            raise ValueError(
+                f"{pretrained_model} takes {self.max_sequence_length} tokens, "
+                f"which leaves no room for text after [CLS] and [SEP]."
+            )
+        self.sliding_window_overlap = min(
+            SLIDING_WINDOW_OVERLAP, (self.max_sequence_length - 2) // 2
+        )
+        self.context_window = context_window
+
+        # the embedding cache mode of [TGT] marked texts
+        self.tgt_span_mode = "tgt_span"
+        if context_window is not None:
+            self.tgt_span_mode += f" (context window {context_window})"
+        self.tgt_token_id = self.tokenizer.convert_tokens_to_ids("[TGT]")
+        self.end_tgt_token_id = self.tokenizer.convert_tokens_to_ids("[/TGT]")
+
+        self.embedding_cache = None
+        if embedding_cache_dir is not None:
+            # a cache holds embeddings of one dtype, so other dtypes are kept
+            # apart from the float32 ones in the same directory
+            if embedding_cache_dtype != "float32":
+                embedding_cache_dir = os.path.join(
+                    embedding_cache_dir, embedding_cache_dtype
+                )
+
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_dir,
+                self.model.config.hidden_size,
+                embedding_cache_dtype,
+            )
 
-        with torch.no_grad():
-            embeddings = self.model(**inputs)
+    def _get_embeddings_through_cache(
+        self, texts: List[str], mode: str, compute_embeddings
+    ) -> List[torch.Tensor]:
+        """Looks up the embedding of each text in the embedding cache and only
+        runs `compute_embeddings` on the texts that are not stored yet."""
+
+        if self.embedding_cache is None:
+            return compute_embeddings(texts)
+
+        keys = [
+            EmbeddingCache.make_key(
+                self.embedding_model_name,
+                self.target_word_tokens,
+                mode,
+                text,
+            )
+            for text in texts
+        ]
 
-        last_hidden_state = embeddings.last_hidden_state
+        embeddings = [None] * len(texts)
+        indices_of_missing_text = {}
 
-        mask = inputs["attention_mask"].unsqueeze(-1)
+        for i, key in enumerate(keys):
+            cached_embedding = self.embedding_cache.get(key)
 
-        weighted_embeddings = last_hidden_state * mask
+            if cached_embedding is not None:
+                embeddings[i] = cached_embedding
+            else:
+                indices_of_missing_text.setdefault(texts[i], []).append(i)
 
-        sum_embeddings = weighted_embeddings.sum(dim=1)
-        sum_weights = mask.sum(dim=1)
+        missing_texts = list(indices_of_missing_text.keys())
+        computed_embeddings = compute_embeddings(missing_texts)
 
-        return sum_embeddings / sum_weights
+        self.embedding_cache.put_many(
+            [keys[indices_of_missing_text[text][0]] for text in missing_texts],
+            np.array(
+                [embedding.reshape(-1).numpy() for embedding in computed_embeddings]
+            ),
+        )
+
+        for text, embedding in zip(missing_texts, computed_embeddings):
+            for i in indices_of_missing_text[text]:
+                embeddings[i] = embedding
+
+        shape_of_embedding = self._get_shape_of_embedding(mode)
 
-    def get_average_token_embeddings_for_headword_sense_definitions(
-        self, known_headwords: List[KnownHeadwordInformation]
-    ) -> List[List[torch.Tensor]]:
         return [
-            [
-                self.get_average_token_embedding(known_sense["definition"])
-                for known_sense in headword["known_senses"]
-            ]
-            for headword in known_headwords
+            (
+                torch.from_numpy(embedding).reshape(shape_of_embedding)
+                if isinstance(embedding, np.ndarray)
+                else embedding
+            )
+            for embedding in embeddings
         ]
 
-    def _get_embeddings_for_known_usages(
-        self, known_usages: List[str]
+    def _get_shape_of_embedding(self, mode: str) -> Tuple[int, ...]:
+        if mode == "mean":
+            return (1, self.model.config.hidden_size)
+
+        return (self.model.config.hidden_size,)
+
+    def _tokenize(
+        self, texts: List[str], *, return_offsets_mapping: bool = False
+    ) -> Dict[str, List[List]]:
+        """Tokenizes `texts` without truncation or padding. If
+        `return_offsets_mapping` is set, the encodings also hold the character
+        span of every token as "offset_mapping"."""
+
+        # texts longer than the model takes are trimmed or windowed afterwards
+        return dict(
+            self.tokenizer(
+                texts,
+                add_special_tokens=True,
+                truncation=False,
+                return_offsets_mapping=return_offsets_mapping,
+                verbose=False,
+            )
+        )
+
+    def _get_target_window(self, input_ids: List[int]) -> slice | None:
+        """The subword tokens of `input_ids`, besides [CLS] and [SEP], to keep
+        around its [TGT] ... [/TGT] span, or None to keep all of them."""
+
+        if self.tgt_token_id not in input_ids or self.end_tgt_token_id not in input_ids:
+            raise ValueError("Every text must contain [TGT] followed by [/TGT].")
+
+        span_start = input_ids.index(self.tgt_token_id)
+        span_end = input_ids.index(self.end_tgt_token_id) + 1
+
+        budget = self.max_sequence_length - 2 - (span_end - span_start)
+        if budget < 0:
+            raise ValueError(
+                f"The target span is longer than the maximum sequence length of "
+                f"{self.max_sequence_length} tokens."
+            )
+
+        # [CLS] and [SEP] are the first and last tokens
+        left = span_start - 1
+        right = len(input_ids) - 1 - span_end
+
+        if self.context_window is not None:
+            left = min(left, self.context_window)
+            right = min(right, self.context_window)
+
+        if left + right > budget:
+            # split the budget evenly unless one side is shorter than its half
+            left = min(left, max(budget // 2, budget - right))
+            right = min(right, budget - left)
+
+        if span_start - left == 1 and span_end + right == len(input_ids) - 1:
+            return None
+
+        return slice(span_start - left, span_end + right)
+
+    def _trim_around_targets(
+        self, encodings: Dict[str, List[List]]
+    ) -> Dict[str, List[List]]:
+        """Keeps at most `context_window` subword tokens on each side of the
+        target span of every text, and fewer if the text would still be longer
+        than `max_sequence_length`. Trimming keeps the target span centered
+        unless it is near either end of the text."""
+
+        trimmed_encodings = {key: [] for key in encodings}
+
+        for i, input_ids in enumerate(encodings["input_ids"]):
+            window = self._get_target_window(input_ids)
+
+            for key, values in encodings.items():
+                trimmed_encodings[key].append(
+                    values[i]
+                    if window is None
+                    else [values[i][0], *values[i][window], values[i][-1]]
+                )
+
+        return trimmed_encodings
+
+    def _split_into_windows(
+        self, encodings: Dict[str, List[List]]
+    ) -> Tuple[Dict[str, List[List]], List[int]]:
+        """Splits every text longer than `max_sequence_length` into windows of
+        that length, each overlapping the next by `sliding_window_overlap`
+        subword tokens. Texts that fit are kept as one window.
+
+        Returns the windows and the index of the text of each. Every token of
+        a text is counted by exactly one of its windows, the one in which it
+        is furthest from the edges, as marked by the "counted_mask" of the
+        windows, so summing the counted tokens of all windows of a text sums
+        each of its tokens once."""
+
+        body_length = self.max_sequence_length - 2
+        context = self.sliding_window_overlap // 2
+        stride = body_length - 2 * context
+
+        windows = {key: [] for key in [*encodings, "counted_mask"]}
+        text_indices = []
+
+        for i, input_ids in enumerate(encodings["input_ids"]):
+            num_body_tokens = len(input_ids) - 2
+            window_start = 0
+
+            while True:
+                is_first = window_start == 0
+                is_last = window_start + body_length >= num_body_tokens
+                window_end = min(window_start + body_length, num_body_tokens)
+
+                for key, values in encodings.items():
+                    windows[key].append(
+                        [
+                            values[i][0],
+                            *values[i][1 + window_start : 1 + window_end],
+                            values[i][-1],
+                        ]
+                    )
+
+                counted_start = 0 if is_first else context
+                counted_end = window_end - window_start if is_last else stride + context
+                windows["counted_mask"].append(
+                    [int(is_first)]
+                    + [
+                        int(counted_start <= position < counted_end)
+                        for position in range(window_end - window_start)
+                    ]
+                    + [int(is_last)]
+                )
+                text_indices.append(i)
+
+                if is_last:
+                    break
+
+                window_start += stride
+
+        return windows, text_indices
+
+    def _pad_batch(
+        self, encodings: Dict[str, List[List]], batch_indices: List[int]
+    ) -> Dict[str, torch.Tensor]:
+        """Right-pads the already tokenized texts at `batch_indices` to the
+        longest of them."""
+
+        max_length = max(len(encodings["input_ids"][i]) for i in batch_indices)
+        pad_values = {
+            "input_ids": self.tokenizer.pad_token_id,
+            "token_type_ids": self.tokenizer.pad_token_type_id,
+            "attention_mask": 0,
+            "offset_mapping": (0, 0),
+            "counted_mask": 0,
+        }
+
+        return {
+            key: torch.tensor(
+                [
+                    encodings[key][i]
+                    + [pad_value] * (max_length - len(encodings[key][i]))
+                    for i in batch_indices
+                ]
+            )
+            for key, pad_value in pad_values.items()
+            if key in encodings
+        }
+
+    def _run_length_bucketed_batches(
+        self, encodings: Dict[str, List[List]]
+    ) -> Iterator[Tuple[List[int], Dict[str, torch.Tensor], torch.Tensor]]:
+        """Runs the tokenized texts in `encodings` through the model in padded
+        batches of texts of similar token length, as scheduled by
+        `schedule_length_bucketed_batches`, and records the padding of each
+        batch in `padding_statistics`.
+
+        Yields the indices into `encodings` of each batch alongside its padded
+        encodings and last hidden state, so callers can put the results back
+        in the original order."""
+
+        lengths = [len(input_ids) for input_ids in encodings["input_ids"]]
+
+        for batch_indices in schedule_length_bucketed_batches(
+            lengths,
+            max_batch_size=self.max_batch_size,
+            max_batch_tokens=self.max_batch_tokens,
+        ):
+            self.padding_statistics.record_batch([lengths[i] for i in batch_indices])
+
+            inputs = self._pad_batch(encodings, batch_indices)
+
+            last_hidden_state = self.inference_backend.get_last_hidden_state(
+                {name: inputs[name] for name in MODEL_INPUT_NAMES}
+            )
+
+            yield batch_indices, inputs, last_hidden_state
+
+    def get_embedding_from_tgt_marked_text(self, text: str) -> torch.Tensor:
+        return self._compute_embeddings_from_tgt_marked_texts([text])[0]
+
+    def get_embeddings_from_tgt_marked_texts(
+        self, texts: List[str]
+    ) -> List[torch.Tensor]:
+        """Batched version of `get_embedding_from_tgt_marked_text`."""
+
+        return self._get_embeddings_through_cache(
+            texts, self.tgt_span_mode, self._compute_embeddings_from_tgt_marked_texts
+        )
+
+    def _compute_embeddings_from_tgt_marked_texts(
+        self, texts: List[str]
     ) -> List[torch.Tensor]:
 
-        if len(known_usages) == 0:
+        embeddings = [None] * len(texts)
+
+        if len(texts) == 0:
+            return embeddings
+
+        encodings = self._trim_around_targets(self._tokenize(texts))
+
+        for (
+            batch_indices,
+            inputs,
+            last_hidden_state,
+        ) in self._run_length_bucketed_batches(encodings):
+            span_mask = self._get_target_span_mask(inputs["input_ids"])
+
+            tagged_embeddings = last_hidden_state * span_mask.unsqueeze(-1)
+            span_embeddings = tagged_embeddings.sum(dim=1) / span_mask.sum(
+                dim=1, keepdim=True
+            )
+
+            for row, text_index in enumerate(batch_indices):
+                embeddings[text_index] = span_embeddings[row]
+
+        return embeddings
+
+    def _get_target_span_mask(self, input_ids: torch.Tensor) -> torch.Tensor:
+        """Marks the tokens strictly between the first [TGT] and the first
+        [/TGT] of each row of `input_ids`. A row with nothing between them,
+        as from an empty target, marks its [TGT] instead, so that its
+        embedding is that of the [TGT] token rather than NaN."""
+
+        is_tgt = input_ids == self.tgt_token_id
+        is_end_tgt = input_ids == self.end_tgt_token_id
+
+        if not torch.all(is_tgt.any(dim=1) & is_end_tgt.any(dim=1)):
+            raise ValueError("Every text must contain [TGT] followed by [/TGT].")
+
+        # argmax returns the first position of the largest value
+        tgt_positions = is_tgt.int().argmax(dim=1, keepdim=True)
+        end_tgt_positions = is_end_tgt.int().argmax(dim=1, keepdim=True)
+
+        positions = torch.arange(input_ids.shape[1]).unsqueeze(0)
+        is_empty = end_tgt_positions <= tgt_positions + 1
+
+        return (
+            (positions > tgt_positions) & (positions < end_tgt_positions)
+            | (positions == tgt_positions) & is_empty
+        ).to(torch.float32)
+
+    def get_average_token_embedding(self, text: str) -> torch.Tensor:
+        return self._compute_average_token_embeddings([text])[0]
+
+    def get_average_token_embeddings(self, texts: List[str]) -> List[torch.Tensor]:
+        """Batched version of `get_average_token_embedding`. Each embedding
+        keeps the leading batch dimension of size 1 that the unbatched
+        version returns."""
+
+        return self._get_embeddings_through_cache(
+            texts, "mean", self._compute_average_token_embeddings
+        )
+
+    def _compute_average_token_embeddings(self, texts: List[str]) -> List[torch.Tensor]:
+
+        if len(texts) == 0:
             return []
 
+        sum_embeddings = [0] * len(texts)
+        sum_weights = [0] * len(texts)
+
+        windows, text_indices = self._split_into_windows(self._tokenize(texts))
+
+        for (
+            batch_indices,
+            inputs,
+            last_hidden_state,
+        ) in self._run_length_bucketed_batches(windows):
+            mask = inputs["counted_mask"].unsqueeze(-1)
+
+            batch_sum_embeddings = (last_hidden_state * mask).sum(dim=1)
+            batch_sum_weights = mask.sum(dim=1)
+
+            for row, window_index in enumerate(batch_indices):
+                text_index = text_indices[window_index]
+                sum_embeddings[text_index] += batch_sum_embeddings[row]
+                sum_weights[text_index] += batch_sum_weights[row]
+
         return [
-            self.get_embedding_from_tgt_marked_text(known_usage)
-            for known_usage in known_usages
+            (sum_embedding / sum_weight).unsqueeze(0)
+            for sum_embedding, sum_weight in zip(sum_embeddings, sum_weights)
         ]
 
-    def get_lemma_embeddings_for_headword_sense_known_usages(
-        self, known_headwords: List[KnownHeadwordInformation]
-    ) -> List[List[List[torch.Tensor]]]:
+    def get_sentence_and_token_span_embeddings(
+        self, texts: List[str], token_char_spans: List[List[Tuple[int, int]]]
+    ) -> List[Tuple[torch.Tensor, List[torch.Tensor | None]]]:
+        """Embeds every token of each untagged text from a single forward pass.
+
+        `token_char_spans[i]` holds the (start, end) character offsets of the
+        tokens of `texts[i]` to embed. Each token's embedding is the average
+        of the subword tokens overlapping its characters, or None if no
+        subword does, as for tokens of characters the tokenizer drops, such
+        as zero-width spaces. For each text, the average token embedding of
+        the whole text (as from `get_average_token_embedding`) is returned
+        with its token embeddings."""
+
+        if len(texts) == 0:
+            return []
+
+        windows, text_indices = self._split_into_windows(
+            self._tokenize(texts, return_offsets_mapping=True)
+        )
+
+        sum_embeddings = [0] * len(texts)
+        sum_weights = [0] * len(texts)
+        sum_span_embeddings = [0] * len(texts)
+        sum_span_weights = [0] * len(texts)
+
+        for (
+            batch_indices,
+            inputs,
+            last_hidden_state,
+        ) in self._run_length_bucketed_batches(windows):
+            mask = inputs["counted_mask"].unsqueeze(-1)
+            batch_sum_embeddings = (last_hidden_state * mask).sum(dim=1)
+            batch_sum_weights = mask.sum(dim=1)
+
+            subword_starts = inputs["offset_mapping"][:, :, 0]
+            subword_ends = inputs["offset_mapping"][:, :, 1]
+
+            for row, window_index in enumerate(batch_indices):
+                text_index = text_indices[window_index]
+                spans = torch.tensor(
+                    token_char_spans[text_index], dtype=torch.long
+                ).reshape(-1, 2)
+
+                # special and padding tokens have empty (0, 0) offsets
+                is_in_span = (
+                    (subword_starts[row].unsqueeze(0) < spans[:, 1:])
+                    & (subword_ends[row].unsqueeze(0) > spans[:, :1])
+                    & (subword_ends[row] > subword_starts[row]).unsqueeze(0)
+                    & inputs["counted_mask"][row].bool().unsqueeze(0)
+                ).to(torch.float32)
+
+                sum_embeddings[text_index] += batch_sum_embeddings[row]
+                sum_weights[text_index] += batch_sum_weights[row]
+                sum_span_embeddings[text_index] += is_in_span @ last_hidden_state[row]
+                sum_span_weights[text_index] += is_in_span.sum(dim=1, keepdim=True)
+
         return [
-            [
-                self._get_embeddings_for_known_usages(known_sense["known_usages"])
-                for known_sense in headword["known_senses"]
-            ]
-            for headword in known_headwords
+            (
+                (sum_embeddings[i] / sum_weights[i]).unsqueeze(0),
+                [
+                    span_embedding / span_weight if span_weight > 0 else None
+                    for span_embedding, span_weight in zip(
+                        sum_span_embeddings[i], sum_span_weights[i]
+                    )
+                ],
+            )
+            for i in range(len(texts))
         ]
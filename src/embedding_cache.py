@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, List
+import numpy as np
+
+KEY_SIZE_IN_BYTES = hashlib.sha256().digest_size
+
+
+@contextmanager
+def _exclusive_file_lock(lock_path: str):
+    """Holds an exclusive lock on `lock_path` so that several processes can
+    append to the same cache."""
+
+    with open(lock_path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """Content-addressed store of embeddings kept in `cache_dir`.
+
+    Embeddings are appended as rows of `dtype` to `embeddings.bin`, which is
+    read back through a memory map. `keys.bin` holds the sha256 key of every
+    row in the same order, so the index is rebuilt by reading it once and
+    both files are only ever appended to. Appends are done under a file lock,
+    so worker processes can share one cache."""
+
+    def __init__(self, cache_dir: str, hidden_size: int, dtype: str = "float32"):
+        if dtype not in ["float16", "float32"]:
+            raise ValueError(f"Unsupported embedding cache dtype '{dtype}'")
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.hidden_size = hidden_size
+        self.dtype = np.dtype(dtype)
+        self.row_size_in_bytes = self.hidden_size * self.dtype.itemsize
+
+        self.keys_path = os.path.join(cache_dir, "keys.bin")
+        self.embeddings_path = os.path.join(cache_dir, "embeddings.bin")
+        self.lock_path = os.path.join(cache_dir, "lock")
+
+        with _exclusive_file_lock(self.lock_path):
+            self._check_metadata(os.path.join(cache_dir, "meta.json"))
+            self.row_for_key: Dict[bytes, int] = self._read_keys()
+            self._truncate_unindexed_rows()
+
+        self._mapped_embeddings = None
+
+    def _check_metadata(self, metadata_path: str) -> None:
+        metadata = {"hidden_size": self.hidden_size, "dtype": self.dtype.name}
+
+        if not os.path.exists(metadata_path):
+            with open(metadata_path, "w", encoding="utf-8") as file:
+                json.dump(metadata, file)
+            return
+
+        with open(metadata_path, "r", encoding="utf-8") as file:
+            existing_metadata = json.load(file)
+
+        if existing_metadata != metadata:
+            raise ValueError(
+                f"Embedding cache at {metadata_path} was written with "
+                f"{existing_metadata}, which does not match {metadata}"
+            )
+
+    def _read_keys(self) -> Dict[bytes, int]:
+        if not os.path.exists(self.keys_path):
+            return {}
+
+        with open(self.keys_path, "rb") as file:
+            all_keys = file.read()
+
+        # a partially written key at the end is dropped
+        num_keys = len(all_keys) // KEY_SIZE_IN_BYTES
+
+        return {
+            all_keys[row * KEY_SIZE_IN_BYTES : (row + 1) * KEY_SIZE_IN_BYTES]: row
+            for row in range(num_keys)
+        }
+
+    def _truncate_unindexed_rows(self) -> None:
+        """Embeddings are written before their keys, so an interrupted write
+        can leave rows without a key. They are dropped so that row numbers
+        stay aligned with the keys file."""
+
+        num_rows = len(self.row_for_key)
+
+        with open(self.embeddings_path, "ab") as file:
+            if file.tell() > num_rows * self.row_size_in_bytes:
+                file.truncate(num_rows * self.row_size_in_bytes)
+
+        with open(self.keys_path, "ab") as file:
+            if file.tell() > num_rows * KEY_SIZE_IN_BYTES:
+                file.truncate(num_rows * KEY_SIZE_IN_BYTES)
+
+    @staticmethod
+    def make_key(
+        model_name: str, special_tokens: List[str], mode: str, text: str
+    ) -> bytes:
+        key_parts = [model_name, " ".join(special_tokens), mode, text]
+
+        return hashlib.sha256("\0".join(key_parts).encode("utf-8")).digest()
+
+    def __len__(self) -> int:
+        return len(self.row_for_key)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self.row_for_key
+
+    def _get_mapped_embeddings(self, needed_rows: int) -> np.memmap:
+        if (
+            self._mapped_embeddings is None
+            or self._mapped_embeddings.shape[0] < needed_rows
+        ):
+            num_rows = os.path.getsize(self.embeddings_path) // self.row_size_in_bytes
+
+            self._mapped_embeddings = np.memmap(
+                self.embeddings_path,
+                dtype=self.dtype,
+                mode="r",
+                shape=(num_rows, self.hidden_size),
+            )
+
+        return self._mapped_embeddings
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        """Returns a float32 copy of the embedding stored for `key`, or `None`
+        if it has not been stored."""
+
+        row = self.row_for_key.get(key)
+
+        if row is None:
+            return None
+
+        return np.array(self._get_mapped_embeddings(row + 1)[row], dtype=np.float32)
+
+    def put_many(self, keys: List[bytes], embeddings: np.ndarray) -> None:
+        """Appends one row of `embeddings` per key. Keys that are already
+        stored are skipped."""
+
+        new_rows = {}
+        for key, embedding in zip(keys, embeddings):
+            if key not in self.row_for_key and key not in new_rows:
+                new_rows[key] = embedding
+
+        if len(new_rows) == 0:
+            return
+
+        new_embeddings = np.asarray(list(new_rows.values()), dtype=self.dtype)
+        new_embeddings = new_embeddings.reshape(len(new_rows), self.hidden_size)
+
+        with _exclusive_file_lock(self.lock_path):
+            # Other processes may have appended since this one last did, so
+            # the rows are numbered from the current end of the keys file.
+            first_row = os.path.getsize(self.keys_path) // KEY_SIZE_IN_BYTES
+
+            with open(self.embeddings_path, "r+b") as file:
+                file.seek(first_row * self.row_size_in_bytes)
+                file.write(new_embeddings.tobytes())
+
+            with open(self.keys_path, "ab") as file:
+                file.write(b"".join(new_rows.keys()))
+
+        for row, key in enumerate(new_rows.keys(), start=first_row):
+            self.row_for_key[key] = row
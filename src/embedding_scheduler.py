@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from typing import Dict, List
+import numpy as np
+
+
+def schedule_length_bucketed_batches(
+    lengths: List[int], *, max_batch_size: int, max_batch_tokens: int | None = None
+) -> List[List[int]]:
+    """Groups the indices of texts with token lengths `lengths` into batches
+    of texts of similar length, so that little of each batch is padding.
+
+    Texts are taken shortest first. A batch holds at most `max_batch_size`
+    texts and, if `max_batch_tokens` is given, at most that many tokens once
+    padded to its longest text, so batches of short texts hold more texts
+    than batches of long ones. A text longer than `max_batch_tokens` gets a
+    batch of its own."""
+
+    batches = []
+    batch = []
+
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # texts are sorted, so text i is the longest of the batch it joins
+        is_over_budget = (
+            max_batch_tokens is not None
+            and (len(batch) + 1) * lengths[i] > max_batch_tokens
+        )
+
+        if len(batch) > 0 and (len(batch) == max_batch_size or is_over_budget):
+            batches.append(batch)
+            batch = []
+
+        batch.append(i)
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+class PaddingStatistics:
+    """Sizes and padding of the last `window_size` batches run through the
+    model, for tuning the batch size and token budget. Safe to update from
+    several threads."""
+
+    def __init__(self, window_size: int = 10000):
+        self.batch_sizes = deque(maxlen=window_size)
+        self.padded_tokens = deque(maxlen=window_size)
+        self.padding_ratios = deque(maxlen=window_size)
+        self.lock = threading.Lock()
+
+    def record_batch(self, lengths: List[int]) -> None:
+        """Records a batch of texts with token lengths `lengths`, all padded
+        to the longest of them."""
+
+        padded_tokens = len(lengths) * max(lengths)
+
+        with self.lock:
+            self.batch_sizes.append(len(lengths))
+            self.padded_tokens.append(padded_tokens)
+            self.padding_ratios.append(1 - sum(lengths) / padded_tokens)
+
+    def get_summary(self) -> Dict[str, float | int | None]:
+        with self.lock:
+            batch_sizes = np.array(self.batch_sizes)
+            padded_tokens = np.array(self.padded_tokens)
+            padding_ratios = np.array(self.padding_ratios)
+
+        if len(batch_sizes) == 0:
+            return {
+                "num_batches": 0,
+                "mean_batch_size": None,
+                "mean_padded_tokens": None,
+                "padding_ratio": None,
+                "padding_ratio_p50": None,
+                "padding_ratio_max": None,
+            }
+
+        return {
+            "num_batches": len(batch_sizes),
+            "mean_batch_size": float(batch_sizes.mean()),
+            "mean_padded_tokens": float(padded_tokens.mean()),
+            # the share of all tokens run that were padding
+            "padding_ratio": float((padding_ratios * padded_tokens).sum())
+            / float(padded_tokens.sum()),
+            "padding_ratio_p50": float(np.percentile(padding_ratios, 50)),
+            "padding_ratio_max": float(padding_ratios.max()),
+        }
@@ -0,0 +1,237 @@
+from typing import Dict, List, Tuple
+import numpy as np
+from prepared_lemma import PreparedLemma, UnknownUsageEmbeddings
+from similarity_calculator import get_cosine_similarities
+from similarity_flattener import SimilarityFlatteningStrategy
+
+columns_in_results = [
+    "lemma",
+    "definition_weight",
+    "known_usage_similarity_flattener",
+    "known_usage_second_similarity_flattener",
+    "definition_similarity_flattener",
+    "correct_minus_average_incorrect",
+    "correct_minus_best_incorrect",
+    "min_acceptance",
+    "min_delta",
+    "choice_result",
+]
+
+# The columns that tell which configuration and choice values a row is for.
+unit_columns_in_results = [
+    "definition_weight",
+    "known_usage_similarity_flattener",
+    "known_usage_second_similarity_flattener",
+    "definition_similarity_flattener",
+    "min_acceptance",
+    "min_delta",
+]
+
+
+class GridEvaluator:
+    """Scores an unknown usage under every configuration and choice value
+    combination at once.
+
+    Raw similarities are computed once per example, headword scores once per
+    flattener, all definition weights as one broadcast array and all
+    (min_acceptance, min_delta) thresholds as one comparison. Results are
+    columns with one row per (configuration, choice values) pair, in the
+    same order as nested loops over `config_combinations` then
+    `choice_values_combinations` would produce them."""
+
+    def __init__(
+        self,
+        config_combinations: List[Tuple],
+        choice_values_combinations: List[Tuple[float, float]],
+    ):
+        self.config_combinations = config_combinations
+
+        self.definition_weights = np.array(
+            [config[0] for config in config_combinations], dtype=np.float64
+        )
+        self.min_acceptances = np.array(
+            [choice_values[0] for choice_values in choice_values_combinations],
+            dtype=np.float64,
+        )
+        self.min_deltas = np.array(
+            [choice_values[1] for choice_values in choice_values_combinations],
+            dtype=np.float64,
+        )
+
+        self.flatteners: Dict[type, SimilarityFlatteningStrategy] = {
+            flattener_class: flattener_class()
+            for config in config_combinations
+            for flattener_class in config[1:]
+        }
+
+        self.num_configs = len(config_combinations)
+        self.num_choice_values = len(choice_values_combinations)
+
+        self.config_columns = {
+            "definition_weight": np.repeat(
+                self.definition_weights, self.num_choice_values
+            ),
+            "known_usage_similarity_flattener": self._repeat_flattener_names(1),
+            "known_usage_second_similarity_flattener": (
+                self._repeat_flattener_names(2)
+            ),
+            "definition_similarity_flattener": self._repeat_flattener_names(3),
+            "min_acceptance": np.tile(self.min_acceptances, self.num_configs),
+            "min_delta": np.tile(self.min_deltas, self.num_configs),
+        }
+
+    def _repeat_flattener_names(self, index_in_config: int) -> np.ndarray:
+        return np.repeat(
+            np.array(
+                [
+                    config[index_in_config].__name__
+                    for config in self.config_combinations
+                ],
+                dtype=object,
+            ),
+            self.num_choice_values,
+        )
+
+    def get_headword_scores(
+        self,
+        prepared_lemma: PreparedLemma,
+        unknown_usage_embeddings: UnknownUsageEmbeddings,
+    ) -> np.ndarray:
+        """Returns a (num_configs x num_headwords) array of weighted headword
+        similarities, one row per configuration."""
+
+        definition_similarities = get_cosine_similarities(
+            unknown_usage_embeddings.average_token_embedding,
+            prepared_lemma.definition_embeddings,
+        )
+        usage_similarities = get_cosine_similarities(
+            unknown_usage_embeddings.lemma_embedding,
+            prepared_lemma.usage_embeddings,
+        )
+
+        definition_scores_by_flattener = {}
+        sense_scores_by_flattener = {}
+        usage_scores_by_flatteners = {}
+
+        definition_scores = []
+        usage_scores = []
+
+        for config in self.config_combinations:
+            (
+                _,
+                known_usage_flattener,
+                known_usage_second_flattener,
+                definition_flattener,
+            ) = config
+
+            if definition_flattener not in definition_scores_by_flattener:
+                definition_scores_by_flattener[definition_flattener] = self.flatteners[
+                    definition_flattener
+                ].flatten_segments(
+                    definition_similarities, prepared_lemma.headword_sense_offsets
+                )
+
+            if known_usage_flattener not in sense_scores_by_flattener:
+                sense_scores_by_flattener[known_usage_flattener] = self.flatteners[
+                    known_usage_flattener
+                ].flatten_segments(
+                    usage_similarities, prepared_lemma.sense_usage_offsets
+                )
+
+            usage_flatteners = (known_usage_flattener, known_usage_second_flattener)
+            if usage_flatteners not in usage_scores_by_flatteners:
+                usage_scores_by_flatteners[usage_flatteners] = self.flatteners[
+                    known_usage_second_flattener
+                ].flatten_segments(
+                    sense_scores_by_flattener[known_usage_flattener],
+                    prepared_lemma.headword_sense_offsets,
+                )
+
+            definition_scores.append(
+                definition_scores_by_flattener[definition_flattener]
+            )
+            usage_scores.append(usage_scores_by_flatteners[usage_flatteners])
+
+        weights = self.definition_weights[:, np.newaxis]
+
+        return np.array(definition_scores) * weights + np.array(usage_scores) * (
+            1 - weights
+        )
+
+    def evaluate(
+        self,
+        lemma: str,
+        prepared_lemma: PreparedLemma,
+        unknown_usage_embeddings: UnknownUsageEmbeddings,
+        index_of_correct_headword: int,
+    ) -> Dict[str, np.ndarray]:
+
+        scores = self.get_headword_scores(prepared_lemma, unknown_usage_embeddings)
+        num_headwords = scores.shape[1]
+
+        correct_scores = scores[:, index_of_correct_headword]
+
+        if num_headwords >= 2:
+            incorrect_scores = np.delete(scores, index_of_correct_headword, axis=1)
+            average_incorrect = incorrect_scores.mean(axis=1)
+            best_incorrect = incorrect_scores.max(axis=1)
+        else:
+            average_incorrect = np.zeros(self.num_configs)
+            best_incorrect = np.zeros(self.num_configs)
+
+        choice_results = self._get_choice_results(scores, index_of_correct_headword)
+
+        num_rows = self.num_configs * self.num_choice_values
+
+        return {
+            "lemma": np.full(num_rows, lemma, dtype=object),
+            **self.config_columns,
+            "correct_minus_average_incorrect": np.repeat(
+                correct_scores - average_incorrect, self.num_choice_values
+            ),
+            "correct_minus_best_incorrect": np.repeat(
+                correct_scores - best_incorrect, self.num_choice_values
+            ),
+            "choice_result": choice_results.reshape(-1),
+        }
+
+    def _get_choice_results(
+        self, scores: np.ndarray, index_of_correct_headword: int
+    ) -> np.ndarray:
+        """Vectorized `choose_headword` over every configuration and choice
+        values pair. Returns a (num_configs x num_choice_values) array of 1
+        for a correct choice, -1 for an incorrect one and 0 for no choice."""
+
+        num_headwords = scores.shape[1]
+
+        if num_headwords == 1:
+            chosen_result = 1 if index_of_correct_headword == 0 else -1
+            return np.full((self.num_configs, self.num_choice_values), chosen_result)
+
+        # argmax picks the first of tied scores, like the stable sort in
+        # `rank_headwords`.
+        top_indices = np.argmax(scores, axis=1)
+        descending_scores = -np.sort(-scores, axis=1)
+        top_scores = descending_scores[:, 0]
+        deltas = top_scores - descending_scores[:, 1]
+
+        is_choice_made = (
+            top_scores[:, np.newaxis] >= self.min_acceptances[np.newaxis, :]
+        ) & (deltas[:, np.newaxis] >= self.min_deltas[np.newaxis, :])
+
+        is_choice_correct = (top_indices == index_of_correct_headword)[:, np.newaxis]
+
+        return np.where(is_choice_made, np.where(is_choice_correct, 1, -1), 0)
+
+
+def concatenate_results(
+    results: List[Dict[str, np.ndarray]],
+) -> Dict[str, np.ndarray]:
+
+    if len(results) == 0:
+        return {column: np.array([]) for column in columns_in_results}
+
+    return {
+        column: np.concatenate([result[column] for result in results])
+        for column in columns_in_results
+    }
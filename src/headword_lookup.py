@@ -0,0 +1,48 @@
+from abc import ABC, abstractmethod
+import os
+from typing import Dict, Iterator, List
+from test_types import KnownHeadwordInformation
+
+
+class HeadwordLookup(ABC):
+
+    @abstractmethod
+    def get_known_headwords(self, lemma: str) -> List[KnownHeadwordInformation]:
+        """Returns the headwords of `lemma`, or an empty list if it is not in
+        the dictionary."""
+        pass
+
+    @abstractmethod
+    def iterate_lemmas(self) -> Iterator[str]:
+        pass
+
+
+class TestCaseDirectoryHeadwordLookup(HeadwordLookup):
+    """Looks up headwords from the known headwords of the test case files in
+    a directory, as read by `iterate_test_cases_in_dir`."""
+
+    def __init__(self, dir: str):
+        from run_all_tests import iterate_test_cases_in_dir
+
+        self.known_headwords_by_lemma: Dict[str, List[KnownHeadwordInformation]] = {}
+
+        for test_case in iterate_test_cases_in_dir(dir):
+            self.known_headwords_by_lemma[test_case.lemma] = test_case.known_headwords
+
+    def get_known_headwords(self, lemma: str) -> List[KnownHeadwordInformation]:
+        return self.known_headwords_by_lemma.get(lemma, [])
+
+    def iterate_lemmas(self) -> Iterator[str]:
+        return iter(sorted(self.known_headwords_by_lemma))
+
+
+def open_headword_lookup(path: str) -> HeadwordLookup:
+    """Opens a directory of test case files, a .jsonl file of test cases or a
+    dictionary database."""
+
+    if os.path.isdir(path) or os.path.splitext(path)[1] == ".jsonl":
+        return TestCaseDirectoryHeadwordLookup(path)
+
+    from dictionary_store import DictionaryStore
+
+    return DictionaryStore(path)
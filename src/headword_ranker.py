@@ -1,45 +1,45 @@
+from prepared_lemma import PreparedLemma, UnknownUsageEmbeddings
 from similarity_calculator import SimilarityCalculator
+import numpy as np
 
 
 def rank_headwords(
-    num_headwords,
-    result_tensors,
+    prepared_lemma: PreparedLemma,
+    unknown_usage_embeddings: UnknownUsageEmbeddings,
     definition_weight: float,
     similarity_calculator: SimilarityCalculator,
 ):
-    (
-        average_token_embedding_for_unknown_usage,
-        average_token_embeddings_for_headword_sense_definitions,
-        lemma_embedding_for_unknown_usage,
-        lemma_embeddings_for_headword_sense_known_usages,
-    ) = result_tensors
+    num_headwords = prepared_lemma.num_headwords
 
-    definition_similarities = [0] * num_headwords
+    definition_similarities = np.zeros(num_headwords)
     if definition_weight > 0.0:
         definition_similarities = (
             similarity_calculator.get_similarities_of_sense_definitions(
-                average_token_embedding_for_unknown_usage,
-                average_token_embeddings_for_headword_sense_definitions,
+                unknown_usage_embeddings.average_token_embedding,
+                prepared_lemma.definition_embeddings,
+                prepared_lemma.headword_sense_offsets,
             )
         )
 
-    usage_similarities = [0] * num_headwords
+    usage_similarities = np.zeros(num_headwords)
     if 1 - definition_weight > 0.0:
         usage_similarities = (
             similarity_calculator.get_similarities_of_sense_known_usages(
-                lemma_embedding_for_unknown_usage,
-                lemma_embeddings_for_headword_sense_known_usages,
+                unknown_usage_embeddings.lemma_embedding,
+                prepared_lemma.usage_embeddings,
+                prepared_lemma.sense_usage_offsets,
+                prepared_lemma.headword_sense_offsets,
+                prepared_lemma.usage_clusters,
             )
         )
 
-    weighted_similarities = [
-        definition_similarities[index] * definition_weight
-        + usage_similarities[index] * (1 - definition_weight)
-        for index in range(num_headwords)
-    ]
+    weighted_similarities = (
+        definition_similarities * definition_weight
+        + usage_similarities * (1 - definition_weight)
+    )
 
     indices_with_sim = [
-        (index, weighted_similarities[index])
+        (index, float(weighted_similarities[index]))
         for index in range(len(weighted_similarities))
     ]
     indices_with_sim.sort(key=lambda t: t[1], reverse=True)
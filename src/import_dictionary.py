@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Dict, Iterator, List, Tuple
+from command_line_options import get_option_value
+from dictionary_store import DictionaryStore
+from run_single_test import delete_sources_from_usages
+
+LEMMAS_PER_TRANSACTION = 10000
+SENSES_PER_INSERT = 10000
+
+
+def get_lemma_from_urimalsaem_word(word: str) -> str:
+    """Urimalsaem words mark morpheme boundaries with '-', spaces with '^'
+    and may end in a homonym number."""
+
+    return re.sub(r"\d+$", "", word).replace("-", "").replace("^", " ").strip()
+
+
+def _get_urimalsaem_items(export_path: str) -> Iterator[Dict]:
+    if os.path.isdir(export_path):
+        filenames = [
+            os.path.join(export_path, filename)
+            for filename in sorted(os.listdir(export_path))
+            if os.path.splitext(filename)[1] == ".json"
+        ]
+    else:
+        filenames = [export_path]
+
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as file:
+            yield from json.load(file)["channel"]["item"]
+
+
+def _get_urimalsaem_sense_rows(
+    export_path: str,
+) -> Iterator[Tuple[str, str, str, int, str, str]]:
+    for item in _get_urimalsaem_items(export_path):
+        word_info = item.get("wordinfo") or item.get("word_info") or {}
+        sense_info = item.get("senseinfo") or item.get("sense_info") or {}
+
+        word = word_info.get("word")
+        definition = sense_info.get("definition")
+
+        if word is None or definition is None:
+            continue
+
+        headword_id = str(item.get("group_code") or word_info.get("sup_no") or word)
+
+        yield (
+            get_lemma_from_urimalsaem_word(word),
+            word,
+            headword_id,
+            int(sense_info.get("sense_no") or 0),
+            definition,
+            json.dumps(
+                [
+                    example_info["example"]
+                    for example_info in sense_info.get("example_info", [])
+                    if "example" in example_info
+                ],
+                ensure_ascii=False,
+            ),
+        )
+
+
+def read_urimalsaem_export(
+    export_path: str,
+) -> Iterator[Tuple[str, List[Dict], List[str]]]:
+    """Reads a JSON export of Urimalsaem (one file, or a directory of them),
+    where every item is one sense. Senses are grouped into headwords by their
+    word and group code.
+
+    The senses of a headword can be spread over the whole export, so they are
+    first written to a temporary SQLite database, `SENSES_PER_INSERT` at a
+    time, and read back grouped. Only one file of the export and one lemma
+    are held in memory at once.
+
+    Yields each lemma with its headwords and their source ids, in the order
+    of the lemmas."""
+
+    with tempfile.TemporaryDirectory() as staging_dir:
+        connection = sqlite3.connect(os.path.join(staging_dir, "senses.sqlite"))
+
+        try:
+            connection.execute(
+                "CREATE TABLE senses (id INTEGER PRIMARY KEY, lemma TEXT, "
+                "word TEXT, headword_id TEXT, sense_no INTEGER, definition TEXT, "
+                "known_usages TEXT)"
+            )
+
+            rows = _get_urimalsaem_sense_rows(export_path)
+
+            while len(chunk := list(islice(rows, SENSES_PER_INSERT))) > 0:
+                connection.executemany(
+                    "INSERT INTO senses (lemma, word, headword_id, sense_no, "
+                    "definition, known_usages) VALUES (?, ?, ?, ?, ?, ?)",
+                    chunk,
+                )
+
+            connection.commit()
+
+            # headwords keep the order in which they first appear in the export
+            sorted_rows = connection.execute("""
+                SELECT lemma, word, headword_id, definition, known_usages
+                FROM (
+                    SELECT *, MIN(id) OVER (PARTITION BY word, headword_id)
+                        AS first_id
+                    FROM senses
+                )
+                ORDER BY lemma, first_id, sense_no, id
+                """)
+
+            for lemma, lemma_rows in groupby(sorted_rows, key=itemgetter(0)):
+                headwords = []
+                headword_ids = []
+
+                for (_, headword_id), headword_rows in groupby(
+                    lemma_rows, key=itemgetter(1, 2)
+                ):
+                    headwords.append(
+                        {
+                            "known_senses": [
+                                {
+                                    "definition": definition,
+                                    "known_usages": json.loads(known_usages),
+                                }
+                                for *_, definition, known_usages in headword_rows
+                            ]
+                        }
+                    )
+                    headword_ids.append(headword_id)
+
+                yield lemma, headwords, headword_ids
+        finally:
+            connection.close()
+
+
+def read_test_case_files(
+    dir: str,
+) -> Iterator[Tuple[str, List[Dict], List[str] | None]]:
+    from run_all_tests import iterate_test_cases_in_dir
+
+    for test_case in iterate_test_cases_in_dir(dir):
+        yield test_case.lemma, test_case.known_headwords, None
+
+
+def import_dictionary(
+    store: DictionaryStore,
+    lemmas_with_headwords: Iterator[Tuple[str, List[Dict], List[str] | None]],
+) -> int:
+    """Replaces the contents of `store` with `lemmas_with_headwords`, so that
+    running an import again does not add every headword a second time."""
+
+    store.clear()
+
+    num_lemmas = 0
+    num_headwords_by_lemma = store.get_num_headwords_by_lemma()
+
+    for lemma, known_headwords, source_ids in lemmas_with_headwords:
+        delete_sources_from_usages(known_headwords)
+        store.add_lemma(
+            lemma,
+            known_headwords,
+            source_ids,
+            first_headword_index=num_headwords_by_lemma.get(lemma, 0),
+        )
+        num_headwords_by_lemma[lemma] = num_headwords_by_lemma.get(lemma, 0) + len(
+            known_headwords
+        )
+
+        num_lemmas += 1
+        if num_lemmas % LEMMAS_PER_TRANSACTION == 0:
+            store.commit()
+
+    store.commit()
+    store.create_indexes()
+
+    return num_lemmas
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 3:
+        raise ValueError(
+            """Usage: `python import_dictionary.py
+            <database_path>
+            <export_path>
+            [--format urimalsaem|test-cases]`"""
+        )
+
+    input_format = get_option_value(args, "--format", "urimalsaem")
+
+    if input_format == "urimalsaem":
+        lemmas_with_headwords = read_urimalsaem_export(args[2])
+    elif input_format == "test-cases":
+        lemmas_with_headwords = read_test_case_files(args[2])
+    else:
+        raise ValueError(f"Unknown format supplied '{input_format}'")
+
+    store = DictionaryStore(args[1])
+    num_lemmas = import_dictionary(store, lemmas_with_headwords)
+    store.close()
+
+    print(f"Imported {num_lemmas} lemmas into {args[1]}.")
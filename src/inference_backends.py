@@ -0,0 +1,305 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List
+import numpy as np
+import torch
+from transformers import BertModel
+
+DEFAULT_EXPORT_DIR = "exported_models"
+
+# Largest absolute difference from the PyTorch model's last hidden state that
+# an exported model may have on the check input.
+EXPORT_TOLERANCE = 1e-4
+
+MODEL_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+class LastHiddenStateModel(torch.nn.Module):
+    """Wraps `BertModel` to take its inputs positionally and return only the
+    last hidden state, which is what tracing and ONNX export need.
+
+    If `averaged_layers` is given, the mean hidden state of those layers is
+    returned instead, where layer 1 is the first encoder layer."""
+
+    def __init__(self, model: BertModel, averaged_layers: List[int] | None = None):
+        super().__init__()
+        self.model = model
+        self.averaged_layers = averaged_layers
+
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        token_type_ids: torch.Tensor,
+    ) -> torch.Tensor:
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+            output_hidden_states=self.averaged_layers is not None,
+        )
+
+        if self.averaged_layers is None:
+            return outputs.last_hidden_state
+
+        return torch.stack(
+            [outputs.hidden_states[layer] for layer in self.averaged_layers]
+        ).mean(dim=0)
+
+
+class InferenceBackend(ABC):
+
+    @abstractmethod
+    def get_last_hidden_state(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Runs the model on a padded batch of `MODEL_INPUT_NAMES`, returning
+        the hidden state `LastHiddenStateModel` does."""
+        pass
+
+
+class PyTorchBackend(InferenceBackend):
+
+    def __init__(self, model: BertModel, averaged_layers: List[int] | None = None):
+        self.model = LastHiddenStateModel(model, averaged_layers)
+
+    def get_last_hidden_state(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(*[inputs[name] for name in MODEL_INPUT_NAMES])
+
+
+def _get_check_inputs(model: BertModel) -> Dict[str, torch.Tensor]:
+    """Two padded sequences of different lengths, so that exports do not
+    specialize on one batch shape. Both hold the last two tokens of the
+    vocabulary, which are the added special tokens."""
+
+    input_ids = torch.randint(
+        0, model.config.vocab_size, (2, 16), generator=torch.Generator().manual_seed(0)
+    )
+    input_ids[:, 1] = model.config.vocab_size - 2
+    input_ids[:, 2] = model.config.vocab_size - 1
+    attention_mask = torch.ones_like(input_ids)
+    attention_mask[1, 10:] = 0
+
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "token_type_ids": torch.zeros_like(input_ids),
+    }
+
+
+def get_export_path(
+    export_dir: str,
+    pretrained_model: str,
+    model: BertModel,
+    averaged_layers: List[int] | None,
+    extension: str,
+) -> str:
+    """Exports are keyed by the model, its resized vocabulary and the layers
+    it runs, so adding special tokens or changing layers never reuses a
+    stale export."""
+
+    key = hashlib.sha256(
+        "\0".join(
+            [
+                pretrained_model,
+                str(model.config.vocab_size),
+                str(model.config.num_hidden_layers),
+                str(averaged_layers),
+            ]
+        ).encode("utf-8")
+    )
+    model_name = pretrained_model.strip("/").replace("/", "--")
+
+    return os.path.join(export_dir, f"{model_name}-{key.hexdigest()[:16]}.{extension}")
+
+
+def get_max_difference(
+    backend: InferenceBackend,
+    model: BertModel,
+    averaged_layers: List[int] | None = None,
+) -> float:
+    """Largest absolute difference between the last hidden states of
+    `backend` and the PyTorch `model` on the check input."""
+
+    inputs = _get_check_inputs(model)
+    mask = inputs["attention_mask"].unsqueeze(-1).bool()
+
+    expected = PyTorchBackend(model, averaged_layers).get_last_hidden_state(inputs)
+    actual = backend.get_last_hidden_state(inputs)
+
+    # padded positions are never read, so they may differ
+    return float((expected - actual).abs().masked_fill(~mask, 0).max().item())
+
+
+class ExportedBackend(InferenceBackend):
+    """A backend running a copy of the model exported to `export_path`.
+
+    An existing export is reused if it still matches the model within
+    `EXPORT_TOLERANCE`, which it does not if the added special tokens were
+    initialized differently, and is exported again otherwise."""
+
+    def __init__(
+        self,
+        model: BertModel,
+        export_path: str,
+        averaged_layers: List[int] | None = None,
+    ):
+        self.averaged_layers = averaged_layers
+
+        if os.path.exists(export_path):
+            self._load(export_path)
+
+            if get_max_difference(self, model, averaged_layers) <= EXPORT_TOLERANCE:
+                return
+
+        os.makedirs(os.path.dirname(export_path) or ".", exist_ok=True)
+        self._export(model, export_path + ".tmp")
+        os.replace(export_path + ".tmp", export_path)
+
+        self._load(export_path)
+
+        max_difference = get_max_difference(self, model, averaged_layers)
+        if max_difference > EXPORT_TOLERANCE:
+            raise ValueError(
+                f"{type(self).__name__} differs from PyTorch by {max_difference}, "
+                f"more than the tolerance of {EXPORT_TOLERANCE}"
+            )
+
+    @abstractmethod
+    def _export(self, model: BertModel, export_path: str) -> None:
+        pass
+
+    @abstractmethod
+    def _load(self, export_path: str) -> None:
+        pass
+
+
+class TorchScriptBackend(ExportedBackend):
+    """Runs a traced and frozen copy of the model."""
+
+    def __init__(
+        self,
+        model: BertModel,
+        pretrained_model: str,
+        export_dir: str,
+        averaged_layers: List[int] | None = None,
+    ):
+        super().__init__(
+            model,
+            get_export_path(export_dir, pretrained_model, model, averaged_layers, "pt"),
+            averaged_layers,
+        )
+
+    def _export(self, model: BertModel, export_path: str) -> None:
+        check_inputs = _get_check_inputs(model)
+
+        with torch.no_grad():
+            traced_model = torch.jit.trace(
+                LastHiddenStateModel(model, self.averaged_layers).eval(),
+                tuple(check_inputs[name] for name in MODEL_INPUT_NAMES),
+            )
+
+        torch.jit.save(torch.jit.freeze(traced_model), export_path)
+
+    def _load(self, export_path: str) -> None:
+        self.traced_model = torch.jit.optimize_for_inference(
+            torch.jit.load(export_path)
+        )
+
+    def get_last_hidden_state(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        with torch.no_grad():
+            return self.traced_model(*[inputs[name] for name in MODEL_INPUT_NAMES])
+
+
+class OnnxRuntimeBackend(ExportedBackend):
+    """Runs the model in ONNX Runtime with every graph optimization enabled.
+    The graph ONNX Runtime optimized is saved next to the export."""
+
+    def __init__(
+        self,
+        model: BertModel,
+        pretrained_model: str,
+        export_dir: str,
+        averaged_layers: List[int] | None = None,
+        *,
+        num_threads: int | None = None,
+    ):
+        import onnxruntime
+
+        self.onnxruntime = onnxruntime
+        self.num_threads = num_threads
+
+        super().__init__(
+            model,
+            get_export_path(
+                export_dir, pretrained_model, model, averaged_layers, "onnx"
+            ),
+            averaged_layers,
+        )
+
+    def _export(self, model: BertModel, export_path: str) -> None:
+        check_inputs = _get_check_inputs(model)
+        dynamic_axes = {0: "batch", 1: "sequence"}
+
+        torch.onnx.export(
+            LastHiddenStateModel(model, self.averaged_layers).eval(),
+            tuple(check_inputs[name] for name in MODEL_INPUT_NAMES),
+            export_path,
+            input_names=MODEL_INPUT_NAMES,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                name: dynamic_axes for name in MODEL_INPUT_NAMES + ["last_hidden_state"]
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+
+    def _load(self, export_path: str) -> None:
+        session_options = self.onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = (
+            self.onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        session_options.optimized_model_filepath = export_path.replace(
+            ".onnx", ".optimized.onnx"
+        )
+        if self.num_threads is not None:
+            session_options.intra_op_num_threads = self.num_threads
+
+        self.session = self.onnxruntime.InferenceSession(
+            export_path, session_options, providers=["CPUExecutionProvider"]
+        )
+
+    def get_last_hidden_state(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        (last_hidden_state,) = self.session.run(
+            ["last_hidden_state"],
+            {name: inputs[name].numpy().astype(np.int64) for name in MODEL_INPUT_NAMES},
+        )
+
+        return torch.from_numpy(last_hidden_state)
+
+
+INFERENCE_BACKENDS: List[str] = ["pytorch", "torchscript", "onnx"]
+
+
+def create_inference_backend(
+    backend: str,
+    model: BertModel,
+    pretrained_model: str,
+    export_dir: str,
+    averaged_layers: List[int] | None = None,
+) -> InferenceBackend:
+
+    if backend == "pytorch":
+        return PyTorchBackend(model, averaged_layers)
+    if backend == "torchscript":
+        return TorchScriptBackend(model, pretrained_model, export_dir, averaged_layers)
+    if backend == "onnx":
+        return OnnxRuntimeBackend(
+            model,
+            pretrained_model,
+            export_dir,
+            averaged_layers,
+            num_threads=torch.get_num_threads(),
+        )
+
+    raise ValueError(f"Unknown inference backend '{backend}'")
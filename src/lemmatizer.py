@@ -1,21 +1,139 @@
+import queue
+import re
+import threading
 from abc import ABC, abstractmethod
-from typing import List
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+from lru_cache import LRUCache
+
+DEFAULT_LEMMA_CACHE_SIZE = 10000
+DEFAULT_MAX_PARSERS = 1
+
+
+def find_index_of_lemma(lemmas: List[List[str]], target_lemma: str) -> int:
+    """Returns the index of the first token among `lemmas`, as returned by
+    `get_lemmas`, that has `target_lemma` as a lemma, or -1 if none does."""
+
+    for i, lemma_list_for_token in enumerate(lemmas):
+        if target_lemma in lemma_list_for_token:
+            return i
+
+    return -1
 
 
 class Lemmatizer(ABC):
+    """Parsers are not safe to share between threads, so a thread borrows a
+    parser for as long as it parses and returns it afterwards. Each parser is
+    a full load of the model or dictionary, so at most `max_parsers` are
+    created, and threads beyond that wait for one to be returned. Raise
+    `max_parsers` to parse on that many threads at once. The lemma cache is
+    shared, guarded by a lock."""
+
+    def __init__(
+        self,
+        cache_size: int = DEFAULT_LEMMA_CACHE_SIZE,
+        max_parsers: int = DEFAULT_MAX_PARSERS,
+    ):
+        self.lemma_cache = LRUCache(cache_size)
+        self.lock = threading.RLock()
+        self.max_parsers = max_parsers
+        self.num_parsers = 0
+        self.idle_parsers: queue.SimpleQueue = queue.SimpleQueue()
 
     @abstractmethod
-    def get_lemmas(self, text: str) -> List[List[str]]:
+    def _create_parser(self):
         pass
 
-    def find_index_of_lemma(self, context: str, target_lemma: str) -> int:
-        lemmas = self.get_lemmas(context)
+    @contextmanager
+    def _borrow_parser(self) -> Iterator:
+        try:
+            parser = self.idle_parsers.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                is_creating = self.num_parsers < self.max_parsers
+
+                if is_creating:
+                    self.num_parsers += 1
+
+            if not is_creating:
+                parser = self.idle_parsers.get()
+            else:
+                try:
+                    parser = self._create_parser()
+                except BaseException:
+                    with self.lock:
+                        self.num_parsers -= 1
+                    raise
+
+        try:
+            yield parser
+        finally:
+            self.idle_parsers.put(parser)
+
+    @abstractmethod
+    def _compute_lemmas(self, text: str) -> List[List[str]]:
+        pass
+
+    def _compute_lemmas_batch(self, texts: List[str]) -> List[List[List[str]]]:
+        return [self._compute_lemmas(text) for text in texts]
+
+    def _freeze_lemmas(self, lemmas: List[List[str]]) -> Tuple[Tuple[str, ...], ...]:
+        return tuple(tuple(lemma_list) for lemma_list in lemmas)
+
+    def _thaw_lemmas(self, lemmas: Tuple[Tuple[str, ...], ...]) -> List[List[str]]:
+        return [list(lemma_list) for lemma_list in lemmas]
+
+    def get_lemmas(self, text: str) -> List[List[str]]:
+        """Returns the lemmas of each whitespace separated token of `text`.
+        Results are cached, so the same text is only parsed once while it
+        stays in the cache."""
 
-        for i, lemma_list_for_token in enumerate(lemmas):
-            if target_lemma in lemma_list_for_token:
-                return i
+        with self.lock:
+            cached_lemmas = self.lemma_cache.get(text)
 
-        return -1
+        if cached_lemmas is None:
+            cached_lemmas = self._freeze_lemmas(self._compute_lemmas(text))
+
+            with self.lock:
+                self.lemma_cache.put(text, cached_lemmas)
+
+        return self._thaw_lemmas(cached_lemmas)
+
+    def get_lemmas_batch(self, texts: List[str]) -> List[List[List[str]]]:
+        """`get_lemmas` for every text in `texts`, parsing the texts that are
+        not cached together."""
+
+        lemmas_by_text = {}
+
+        with self.lock:
+            for text in texts:
+                if text not in lemmas_by_text:
+                    lemmas_by_text[text] = self.lemma_cache.get(text)
+
+        uncached_texts = [
+            text for text, lemmas in lemmas_by_text.items() if lemmas is None
+        ]
+
+        for text, lemmas in zip(
+            uncached_texts, self._compute_lemmas_batch(uncached_texts)
+        ):
+            lemmas_by_text[text] = self._freeze_lemmas(lemmas)
+
+        with self.lock:
+            for text in uncached_texts:
+                self.lemma_cache.put(text, lemmas_by_text[text])
+
+        return [self._thaw_lemmas(lemmas_by_text[text]) for text in texts]
+
+    def get_cache_info(self) -> Dict[str, int]:
+        with self.lock:
+            return self.lemma_cache.get_info()
+
+    def get_token_char_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Returns the (start, end) character offsets of the tokens whose
+        lemmas `get_lemmas` returns, in the same order."""
+
+        return [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]
 
     def get_lemma_at_index(self, context: str, index: int) -> str:
         lemmas = self.get_lemmas(context)
@@ -28,25 +146,72 @@ class Lemmatizer(ABC):
 
 class EnglishLemmatizer(Lemmatizer):
 
-    def __init__(self):
-        import spacy
+    def __init__(
+        self,
+        cache_size: int = DEFAULT_LEMMA_CACHE_SIZE,
+        max_parsers: int = DEFAULT_MAX_PARSERS,
+    ):
+        super().__init__(cache_size, max_parsers)
 
-        self.nlp = spacy.load("en_core_web_sm")
+        # loaded here, so that a missing model fails on construction
+        with self._borrow_parser():
+            pass
 
-    def get_lemmas(self, text: str) -> List[List[str]]:
-        doc = self.nlp(text)
+    def _create_parser(self):
+        import spacy
+
+        return spacy.load("en_core_web_sm")
 
+    def _get_lemmas_from_doc(self, doc) -> List[List[str]]:
         return [[token.lemma_] for token in doc]
 
+    def _compute_lemmas(self, text: str) -> List[List[str]]:
+        with self._borrow_parser() as parser:
+            return self._get_lemmas_from_doc(parser(text))
+
+    def _compute_lemmas_batch(self, texts: List[str]) -> List[List[List[str]]]:
+        with self._borrow_parser() as parser:
+            return [self._get_lemmas_from_doc(doc) for doc in parser.pipe(texts)]
+
+    def get_token_char_spans(self, text: str) -> List[Tuple[int, int]]:
+        with self._borrow_parser() as parser:
+            return [
+                (token.idx, token.idx + len(token)) for token in parser.tokenizer(text)
+            ]
+
 
 class KoreanLemmatizer(Lemmatizer):
 
-    def __init__(self, *, attach_다_to_verbs: bool):
-        from mecab import MeCab
+    def __init__(
+        self,
+        *,
+        attach_다_to_verbs: bool,
+        cache_size: int = DEFAULT_LEMMA_CACHE_SIZE,
+        max_parsers: int = DEFAULT_MAX_PARSERS,
+        dictionary_path: str | None = None,
+    ):
+        """`dictionary_path` is the MeCab system dictionary to use, by
+        default the one of mecab-ko-dic."""
+
+        super().__init__(cache_size, max_parsers)
+
+        if dictionary_path is None:
+            import mecab_ko_dic
+
+            dictionary_path = str(mecab_ko_dic.dictionary_path)
 
-        self.mecab = MeCab()
+        self.dictionary_path = dictionary_path
         self.attach_다_to_verbs = attach_다_to_verbs
 
+        # loaded here, so that a missing dictionary fails on construction
+        with self._borrow_parser():
+            pass
+
+    def _create_parser(self):
+        from mecab import MeCab
+
+        return MeCab(dictionary_path=self.dictionary_path)
+
     def _group_morphs_by_token(self, parsed_morphs: List) -> List[List]:
 
         spans = [morph.span for morph in parsed_morphs]
@@ -114,8 +279,9 @@ class KoreanLemmatizer(Lemmatizer):
             for morph_list in trimmed_grouped_morphs
         ]
 
-    def get_lemmas(self, text: str) -> List[List[str]]:
-        parsed_morphs = self.mecab.parse(text)
+    def _compute_lemmas(self, text: str) -> List[List[str]]:
+        with self._borrow_parser() as parser:
+            parsed_morphs = parser.parse(text)
 
         grouped_morphs = self._group_morphs_by_token(parsed_morphs)
         trimmed_grouped_morphs = self._trim_morphs(grouped_morphs)
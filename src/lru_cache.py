@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from typing import Dict
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key once more than
+    `max_size` keys are stored, counting hits and misses of `get`."""
+
+    def __init__(self, max_size: int):
+        if max_size < 0:
+            raise ValueError("max_size of an LRUCache cannot be negative.")
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value) -> None:
+        if self.max_size == 0:
+            return
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_info(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
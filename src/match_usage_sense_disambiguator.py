@@ -1,71 +1,276 @@
+import time
 from typing import List
+import numpy as np
+import torch
 from embedder import Embedder
+from model_bundle import read_model_bundle_info
+from prepared_lemma import (
+    PreparedLemma,
+    UnknownUsageEmbeddings,
+    UnknownUsageTarget,
+)
+from similarity_calculator import normalize_embeddings
 from test_types import KnownHeadwordInformation, Language
 from usage_preprocessor import UsagePreprocessor
 
+DEFAULT_EMBEDDING_CACHE_DIR = "embedding_cache"
+
 
 class MatchingUsageHeadwordDisambiguator:
 
     def __init__(
         self,
         language: Language,
+        *,
+        embedding_batch_size: int = 32,
+        embedding_batch_tokens: int | None = None,
+        embedding_cache_dir: str | None = None,
+        inference_backend: str = "pytorch",
+        quantize: bool = False,
+        layers: List[int] | None = None,
+        context_window: int | None = None,
+        model_bundle_dir: str | None = None,
+        embedding_dtype: str = "float32",
+        embedding_cache_dtype: str = "float32",
     ):
+        """`model_bundle_dir` loads the model and the lemmatizer configuration
+        from a bundle saved by `bundle_model.py` instead of from the
+        pretrained model.
+
+        `embedding_dtype` is the dtype of the embeddings of prepared lemmas.
+        float16 halves their memory, at the cost of similarities that are
+        only accurate to about 1e-3. `embedding_cache_dtype` is that of the
+        embeddings stored in the embedding cache."""
+
+        if embedding_dtype not in ["float16", "float32"]:
+            raise ValueError(f"Unsupported embedding dtype '{embedding_dtype}'")
+
+        self.embedding_dtype = np.dtype(embedding_dtype)
+
+        bundle_info = {}
+        if model_bundle_dir is not None:
+            bundle_info = read_model_bundle_info(model_bundle_dir)
+
+            if bundle_info["language"] != language:
+                raise ValueError(
+                    f"The bundle in '{model_bundle_dir}' is for "
+                    f"{bundle_info['language']}, not {language}."
+                )
+
+        self.embedder = Embedder(
+            "klue/bert-base" if language == "korean" else "bert-base-uncased",
+            embedding_batch_size,
+            embedding_cache_dir,
+            inference_backend=inference_backend,
+            quantize=quantize,
+            layers=layers,
+            context_window=context_window,
+            max_batch_tokens=embedding_batch_tokens,
+            bundle_dir=model_bundle_dir,
+            embedding_cache_dtype=embedding_cache_dtype,
+        )
+
+        start_time = time.perf_counter()
 
         if language == "korean":
-            self.embedder = Embedder("klue/bert-base")
             from lemmatizer import KoreanLemmatizer
 
             self.usage_preprocessor = UsagePreprocessor(
-                KoreanLemmatizer(attach_다_to_verbs=True)
+                KoreanLemmatizer(
+                    attach_다_to_verbs=True,
+                    dictionary_path=bundle_info.get("mecab_dictionary_path"),
+                )
             )
         else:
-            self.embedder = Embedder("bert-base-uncased")
             from lemmatizer import EnglishLemmatizer
 
             self.usage_preprocessor = UsagePreprocessor(EnglishLemmatizer())
 
-    def get_all_embeddings(
+        # seconds spent on each step of loading, for profiling startup
+        self.startup_times = {
+            **self.embedder.startup_times,
+            "load lemmatizer": time.perf_counter() - start_time,
+        }
+
+    def _stack_and_normalize_embeddings(
+        self, embeddings: List[torch.Tensor]
+    ) -> np.ndarray:
+        if len(embeddings) == 0:
+            return np.zeros(
+                (0, self.embedder.model.config.hidden_size), dtype=self.embedding_dtype
+            )
+
+        return normalize_embeddings(
+            torch.stack([embedding.reshape(-1) for embedding in embeddings]).numpy()
+        ).astype(self.embedding_dtype, copy=False)
+
+    def prepare_lemma(
         self,
         target_lemma: str,
-        unknown_usage: str,
         known_headwords: List[KnownHeadwordInformation],
-    ):
+    ) -> PreparedLemma:
+        """Tags and embeds the definitions and known usages of every headword
+        of `target_lemma`. This only needs to be done once per lemma no
+        matter how many unknown usages are disambiguated against it."""
 
-        # Process the unknown usage and the known usages to add [TGT], [/TGT]
-        # around the target word before getting embeddings.
+        # Process the known usages to add [TGT], [/TGT] around the target word
+        # before getting embeddings.
 
-        tagged_unknown_usage = self.usage_preprocessor.get_tagged_unknown_usage(
-            target_lemma, unknown_usage
+        tagged_known_usages = self.usage_preprocessor.tag_known_usages(
+            target_lemma, known_headwords
         )
+        definitions = [
+            sense["definition"]
+            for headword in known_headwords
+            for sense in headword["known_senses"]
+        ]
+        known_usages = [
+            usage
+            for senses in tagged_known_usages
+            for usages in senses
+            for usage in usages
+        ]
 
-        self.usage_preprocessor.tag_headwords_with_targets(
-            target_lemma, known_headwords
+        num_senses_by_headword = [len(senses) for senses in tagged_known_usages]
+        num_usages_by_sense = [
+            len(usages) for senses in tagged_known_usages for usages in senses
+        ]
+
+        return PreparedLemma(
+            lemma=target_lemma,
+            tagged_known_usages=tagged_known_usages,
+            definition_embeddings=self._stack_and_normalize_embeddings(
+                self.embedder.get_average_token_embeddings(definitions)
+            ),
+            usage_embeddings=self._stack_and_normalize_embeddings(
+                self.embedder.get_embeddings_from_tgt_marked_texts(known_usages)
+            ),
+            headword_sense_offsets=np.concatenate(
+                [[0], np.cumsum(num_senses_by_headword)], dtype=np.int32
+            ),
+            sense_usage_offsets=np.concatenate(
+                [[0], np.cumsum(num_usages_by_sense)], dtype=np.int32
+            ),
         )
 
-        # Get embeddings
+    def embed_unknown_usage(
+        self, prepared_lemma: PreparedLemma, unknown_usage: str
+    ) -> UnknownUsageEmbeddings:
 
-        average_token_embedding_for_unknown_usage = (
-            self.embedder.get_average_token_embedding(unknown_usage)
+        tagged_unknown_usage = self.usage_preprocessor.get_tagged_unknown_usage(
+            prepared_lemma.lemma, unknown_usage
         )
-        average_token_embeddings_for_headword_sense_definitions = (
-            self.embedder.get_average_token_embeddings_for_headword_sense_definitions(
-                known_headwords
-            )
+
+        average_token_embedding = self.embedder.get_average_token_embedding(
+            unknown_usage
+        )
+        lemma_embedding = self.embedder.get_embedding_from_tgt_marked_text(
+            tagged_unknown_usage
         )
 
-        lemma_embedding_for_unknown_usage = (
-            self.embedder.get_embedding_from_tgt_marked_text(tagged_unknown_usage)
+        return UnknownUsageEmbeddings(
+            average_token_embedding=normalize_embeddings(
+                average_token_embedding.reshape(-1).numpy()
+            ),
+            lemma_embedding=normalize_embeddings(lemma_embedding.reshape(-1).numpy()),
         )
 
-        lemma_embeddings_for_headword_sense_known_usages = (
-            self.embedder.get_lemma_embeddings_for_headword_sense_known_usages(
-                known_headwords
-            )
+    def embed_unknown_usages_batch(
+        self, target_lemmas: List[str], unknown_usages: List[str]
+    ) -> List[UnknownUsageEmbeddings]:
+        """Batched version of `embed_unknown_usage`, where unknown usage `i` is
+        disambiguated for `target_lemmas[i]`."""
+
+        return self.embed_tagged_unknown_usages_batch(
+            unknown_usages,
+            self.usage_preprocessor.get_tagged_unknown_usages_batch(
+                target_lemmas, unknown_usages
+            ),
         )
 
-        return (
-            average_token_embedding_for_unknown_usage,
-            average_token_embeddings_for_headword_sense_definitions,
-            lemma_embedding_for_unknown_usage,
-            lemma_embeddings_for_headword_sense_known_usages,
+    def embed_tagged_unknown_usages_batch(
+        self, unknown_usages: List[str], tagged_unknown_usages: List[str]
+    ) -> List[UnknownUsageEmbeddings]:
+        """Embeds unknown usages that were already tagged with
+        `get_tagged_unknown_usage`, without lemmatizing anything."""
+
+        average_token_embeddings = self.embedder.get_average_token_embeddings(
+            unknown_usages
+        )
+        lemma_embeddings = self.embedder.get_embeddings_from_tgt_marked_texts(
+            tagged_unknown_usages
         )
+
+        return [
+            UnknownUsageEmbeddings(
+                average_token_embedding=normalize_embeddings(
+                    average_token_embedding.reshape(-1).numpy()
+                ),
+                lemma_embedding=normalize_embeddings(
+                    lemma_embedding.reshape(-1).numpy()
+                ),
+            )
+            for average_token_embedding, lemma_embedding in zip(
+                average_token_embeddings, lemma_embeddings
+            )
+        ]
+
+    def embed_all_targets(self, unknown_usage: str) -> List[UnknownUsageTarget]:
+        return self.embed_all_targets_batch([unknown_usage])[0]
+
+    def embed_all_targets_batch(
+        self, unknown_usages: List[str]
+    ) -> List[List[UnknownUsageTarget]]:
+        """Embeds every token that has a lemma in each unknown usage with one
+        forward pass per usage instead of one per target. Tokens without any
+        subword tokens cannot be embedded and are left out. Each target's
+        embeddings can be ranked against the `PreparedLemma` of any of its
+        lemmas."""
+
+        lemmatizer = self.usage_preprocessor.lemmatizer
+
+        lemmas_by_usage = lemmatizer.get_lemmas_batch(unknown_usages)
+        token_char_spans_by_usage = [
+            lemmatizer.get_token_char_spans(unknown_usage)
+            for unknown_usage in unknown_usages
+        ]
+
+        sentence_and_token_embeddings = (
+            self.embedder.get_sentence_and_token_span_embeddings(
+                unknown_usages, token_char_spans_by_usage
+            )
+        )
+
+        all_targets = []
+
+        for lemmas, token_char_spans, (average_token_embedding, span_embeddings) in zip(
+            lemmas_by_usage, token_char_spans_by_usage, sentence_and_token_embeddings
+        ):
+            normalized_average_token_embedding = normalize_embeddings(
+                average_token_embedding.reshape(-1).numpy()
+            )
+
+            all_targets.append(
+                [
+                    UnknownUsageTarget(
+                        token_index=token_index,
+                        char_start=char_start,
+                        char_end=char_end,
+                        lemmas=token_lemmas,
+                        embeddings=UnknownUsageEmbeddings(
+                            average_token_embedding=normalized_average_token_embedding,
+                            lemma_embedding=normalize_embeddings(
+                                span_embedding.numpy()
+                            ),
+                        ),
+                    )
+                    for token_index, (
+                        token_lemmas,
+                        (char_start, char_end),
+                        span_embedding,
+                    ) in enumerate(zip(lemmas, token_char_spans, span_embeddings))
+                    if len(token_lemmas) > 0 and span_embedding is not None
+                ]
+            )
+
+        return all_targets
@@ -0,0 +1,56 @@
+import os
+from typing import Dict, List, Tuple
+
+MEBIBYTE = 1024 * 1024
+
+
+def get_memory_usage(pid: int | None = None) -> Dict[str, int] | None:
+    """Memory of process `pid`, this process by default, in bytes:
+    - "rss": resident set size, counting shared pages in full
+    - "pss": proportional set size, splitting shared pages between the
+      processes sharing them
+    - "uss": unique set size, the private pages that would be freed if the
+      process exited
+
+    Read from /proc/<pid>/smaps_rollup, so None where that does not exist."""
+
+    path = f"/proc/{pid if pid is not None else os.getpid()}/smaps_rollup"
+
+    if not os.path.exists(path):
+        return None
+
+    fields = {}
+
+    with open(path) as file:
+        for line in file:
+            name, _, value = line.partition(":")
+
+            # values are in kB
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0]) * 1024
+
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def format_memory_report(usages: List[Tuple[str, Dict[str, int] | None]]) -> str:
+    """A table of the memory usage of each named process, in MiB."""
+
+    lines = [f"{'Memory (MiB)':<20}{'RSS':>10}{'PSS':>10}{'USS':>10}"]
+
+    for name, usage in usages:
+        if usage is None:
+            lines.append(f"  {name:<18}{'unavailable':>30}")
+            continue
+
+        lines.append(
+            f"  {name:<18}"
+            + "".join(
+                f"{usage[field] / MEBIBYTE:10.1f}" for field in ["rss", "pss", "uss"]
+            )
+        )
+
+    return "\n".join(lines)
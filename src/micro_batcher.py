@@ -0,0 +1,174 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, List, TypeVar
+import numpy as np
+
+Request = TypeVar("Request")
+Response = TypeVar("Response")
+
+
+class LatencyMetrics:
+    """Latencies of the last `window_size` requests and sizes of the last
+    `window_size` batches. Safe to update from several threads."""
+
+    def __init__(self, window_size: int = 10000):
+        self.latencies = deque(maxlen=window_size)
+        self.batch_sizes = deque(maxlen=window_size)
+        self.num_requests = 0
+        self.num_errors = 0
+        self.lock = threading.Lock()
+
+    def record_batch(self, latencies: List[float], num_errors: int) -> None:
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+            self.num_requests += len(latencies)
+            self.num_errors += num_errors
+
+    def get_summary(self) -> Dict[str, float | int | None]:
+        with self.lock:
+            latencies = np.array(self.latencies)
+            batch_sizes = np.array(self.batch_sizes)
+            num_requests = self.num_requests
+            num_errors = self.num_errors
+
+        if len(latencies) == 0:
+            p50, p99, mean_batch_size = None, None, None
+        else:
+            p50, p99 = np.percentile(latencies, [50, 99]).tolist()
+            mean_batch_size = float(batch_sizes.mean())
+
+        return {
+            "num_requests": num_requests,
+            "num_errors": num_errors,
+            "latency_p50_ms": p50 * 1000 if p50 is not None else None,
+            "latency_p99_ms": p99 * 1000 if p99 is not None else None,
+            "mean_batch_size": mean_batch_size,
+        }
+
+
+class MicroBatcher(Generic[Request, Response]):
+    """Coalesces requests submitted from any number of threads into batches
+    for `process_batch`, which runs on a single worker thread.
+
+    A batch is processed once it has `max_batch_size` requests, or once its
+    first request has waited `max_wait_seconds`, whichever comes first.
+    `process_batch` must return one response per request, in order. A
+    response may be an exception, which is raised for that request alone,
+    while an exception raised by `process_batch` is raised for all of them.
+
+    Requests whose future was cancelled before their batch started are
+    left out of it."""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Request]], List[Response]],
+        *,
+        max_batch_size: int = 32,
+        max_wait_seconds: float = 0.01,
+        max_queued_requests: int = 0,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.metrics = LatencyMetrics()
+
+        # 0 means the queue is unbounded
+        self.requests: queue.Queue = queue.Queue(max_queued_requests)
+        self.is_closing = False
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, request: Request) -> "Future[Response]":
+        """Queues `request`, blocking while the queue is full."""
+
+        future: "Future[Response]" = Future()
+        self.requests.put((request, future, time.perf_counter()))
+
+        return future
+
+    def __call__(self, request: Request) -> Response:
+        return self.submit(request).result()
+
+    def close(self) -> None:
+        """Processes every request queued so far, then stops the worker."""
+
+        self.requests.put(None)
+        self.worker.join()
+
+    def _get_batch(self) -> List:
+        """Waits for the next batch. `None`, which `close` queues, ends the
+        batch and sets `is_closing`."""
+
+        first_request = self.requests.get()
+
+        if first_request is None:
+            self.is_closing = True
+            return []
+
+        batch = [first_request]
+        deadline = time.perf_counter() + self.max_wait_seconds
+
+        while len(batch) < self.max_batch_size:
+            remaining_time = deadline - time.perf_counter()
+
+            try:
+                request = (
+                    self.requests.get(timeout=remaining_time)
+                    if remaining_time > 0
+                    else self.requests.get_nowait()
+                )
+            except queue.Empty:
+                break
+
+            if request is None:
+                self.is_closing = True
+                break
+
+            batch.append(request)
+
+        return batch
+
+    def _run(self) -> None:
+        while not self.is_closing:
+            batch = self._get_batch()
+
+            # futures that are running can no longer be cancelled, so setting
+            # their results below cannot fail
+            batch = [
+                (request, future, submit_time)
+                for request, future, submit_time in batch
+                if future.set_running_or_notify_cancel()
+            ]
+
+            if len(batch) == 0:
+                continue
+
+            requests = [request for request, _, _ in batch]
+
+            try:
+                responses = self.process_batch(requests)
+
+                if len(responses) != len(requests):
+                    raise ValueError(
+                        f"Got {len(responses)} responses to {len(requests)} requests."
+                    )
+            except Exception as error:
+                responses = [error] * len(requests)
+
+            end_time = time.perf_counter()
+
+            for (_, future, _), response in zip(batch, responses):
+                if isinstance(response, Exception):
+                    future.set_exception(response)
+                else:
+                    future.set_result(response)
+
+            self.metrics.record_batch(
+                [end_time - submit_time for _, _, submit_time in batch],
+                sum(isinstance(response, Exception) for response in responses),
+            )
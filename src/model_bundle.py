@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+from typing import Dict
+
+BUNDLE_INFO_FILENAME = "bundle.json"
+MECAB_DICTIONARY_DIRNAME = "mecab_dictionary"
+
+
+def save_model_bundle(
+    bundle_dir: str,
+    language: str,
+    pretrained_model: str,
+    tokenizer,
+    model,
+    mecab_dictionary_path: str | None = None,
+) -> None:
+    """Saves `tokenizer` and `model` of `pretrained_model`, after the target
+    word tokens were added to them, so that `Embedder` can load them from
+    `bundle_dir` without adding the tokens and resizing the model again.
+
+    The model is saved as safetensors, which are memory-mapped when loaded.
+    The MeCab dictionary of the Korean lemmatizer is copied into the bundle
+    as well, so a bundle always runs with the dictionary it was made with,
+    wherever it is moved to."""
+
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    tokenizer.save_pretrained(bundle_dir)
+    model.save_pretrained(bundle_dir)
+
+    if mecab_dictionary_path is not None:
+        shutil.copytree(
+            mecab_dictionary_path,
+            os.path.join(bundle_dir, MECAB_DICTIONARY_DIRNAME),
+            dirs_exist_ok=True,
+        )
+
+    with open(os.path.join(bundle_dir, BUNDLE_INFO_FILENAME), "w") as file:
+        json.dump(
+            {
+                "language": language,
+                "pretrained_model": pretrained_model,
+                # relative to the bundle
+                "mecab_dictionary_path": (
+                    MECAB_DICTIONARY_DIRNAME
+                    if mecab_dictionary_path is not None
+                    else None
+                ),
+            },
+            file,
+            indent=2,
+        )
+
+
+def read_model_bundle_info(bundle_dir: str) -> Dict[str, str | None]:
+    """Returns the information saved with the bundle, with the path of its
+    MeCab dictionary, if it has one, joined to `bundle_dir`."""
+
+    path = os.path.join(bundle_dir, BUNDLE_INFO_FILENAME)
+
+    if not os.path.exists(path):
+        raise ValueError(f"'{bundle_dir}' is not a model bundle.")
+
+    with open(path) as file:
+        bundle_info = json.load(file)
+
+    if bundle_info["mecab_dictionary_path"] is not None:
+        bundle_info["mecab_dictionary_path"] = os.path.join(
+            bundle_dir, bundle_info["mecab_dictionary_path"]
+        )
+
+    return bundle_info
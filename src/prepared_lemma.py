@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import List
+import numpy as np
+from usage_preprocessor import TaggedKnownUsages
+
+DEFAULT_NUM_PROBES = 4
+
+
+@dataclass(frozen=True, slots=True)
+class UsageClusters:
+    """Inverted file index over the known usage embeddings of one lemma.
+
+    The usages of cluster `i` are rows `members[member_offsets[i]]` up to
+    `members[member_offsets[i + 1]]` of the lemma's `usage_embeddings`,
+    `centroids` holds the L2-normalized mean of each cluster and `sums` the
+    sum of its usage embeddings, from which the mean similarity of its
+    usages to any embedding follows exactly."""
+
+    centroids: np.ndarray
+    sums: np.ndarray
+    member_offsets: np.ndarray
+    members: np.ndarray
+    num_probes: int = DEFAULT_NUM_PROBES
+
+    @property
+    def num_clusters(self) -> int:
+        return len(self.centroids)
+
+
+@dataclass(frozen=True, slots=True)
+class PreparedLemma:
+    """Everything about a lemma's known headwords that does not depend on the
+    unknown usage being disambiguated, so it is built once per lemma.
+
+    Sense definition embeddings are stacked in headword then sense order, and
+    known usage embeddings in headword, sense, then usage order. Both are
+    L2-normalized. The senses of headword `i` are rows
+    `headword_sense_offsets[i]` up to `headword_sense_offsets[i + 1]` of
+    `definition_embeddings`, and the known usages of sense `j` are rows
+    `sense_usage_offsets[j]` up to `sense_usage_offsets[j + 1]` of
+    `usage_embeddings`.
+
+    Embeddings are float32 or float16 and offsets are int32, so that many
+    prepared lemmas can be held in memory at once.
+
+    `usage_clusters` is only set for lemmas loaded from a sense embedding
+    index with enough usages to be worth searching approximately."""
+
+    lemma: str
+    tagged_known_usages: TaggedKnownUsages
+    definition_embeddings: np.ndarray
+    usage_embeddings: np.ndarray
+    headword_sense_offsets: np.ndarray
+    sense_usage_offsets: np.ndarray
+    usage_clusters: UsageClusters | None = None
+
+    @property
+    def num_headwords(self) -> int:
+        return len(self.headword_sense_offsets) - 1
+
+
+@dataclass(frozen=True, slots=True)
+class UnknownUsageEmbeddings:
+    """L2-normalized embeddings of an unknown usage."""
+
+    average_token_embedding: np.ndarray
+    lemma_embedding: np.ndarray
+
+
+@dataclass(frozen=True, slots=True)
+class UnknownUsageTarget:
+    """A token of an unknown usage that lemmatizes to one or more lemmas,
+    embedded without marking it with [TGT] and [/TGT]. `char_start` and
+    `char_end` are its offsets in the unknown usage."""
+
+    token_index: int
+    char_start: int
+    char_end: int
+    lemmas: List[str]
+    embeddings: UnknownUsageEmbeddings
@@ -0,0 +1,152 @@
+import json
+import os
+from typing import Dict, Iterator, List, Set, Tuple
+import numpy as np
+import pandas as pd
+from grid_evaluator import unit_columns_in_results
+
+MANIFEST_FILENAME = "manifest.jsonl"
+PARTS_DIRNAME = "parts"
+
+
+class ResultStore:
+    """Results of a run of the tests in `results_dir`, appended one lemma at
+    a time so that an interrupted run can be resumed where it stopped.
+
+    Each call to `write` saves its rows to a new Parquet file in `parts/`
+    and then appends a line to `manifest.jsonl` naming the file and the
+    units it completed. A unit is one lemma under one configuration: the
+    run, which names the options of the model such as its layers, and the
+    values of `unit_columns_in_results`. A part only counts once its
+    manifest line is written, so a run killed while writing loses nothing
+    but the lemma being written.
+
+    With `resume`, the units of an earlier run in `results_dir` are kept and
+    `is_completed` tells which lemmas need not be run again. Otherwise the
+    results of any earlier run are removed. Lemmas are assumed to be unique
+    within a run, as they are in the plots of each lemma."""
+
+    def __init__(
+        self, results_dir: str, columns_in_results: List[str], *, resume: bool = False
+    ):
+        self.columns_in_results = columns_in_results
+        self.manifest_path = os.path.join(results_dir, MANIFEST_FILENAME)
+        self.parts_dir = os.path.join(results_dir, PARTS_DIRNAME)
+
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+        self.records: List[Dict] = self._read_manifest() if resume else []
+
+        for record in self.records:
+            if record["columns"] != columns_in_results:
+                raise ValueError(
+                    f"The results in '{results_dir}' have the columns "
+                    f"{record['columns']}, not {columns_in_results}, so they "
+                    "cannot be resumed."
+                )
+
+        # a part without a manifest line was never completed
+        parts_in_manifest = {record["part"] for record in self.records}
+        for filename in os.listdir(self.parts_dir):
+            if filename not in parts_in_manifest:
+                os.remove(os.path.join(self.parts_dir, filename))
+
+        self._rewrite_manifest()
+
+        self.completed_units: Dict[Tuple[str, str], Set[Tuple]] = {}
+        for record in self.records:
+            self.completed_units.setdefault(
+                (record["run"], record["lemma"]), set()
+            ).update(tuple(unit) for unit in record["units"])
+
+    def _read_manifest(self) -> List[Dict]:
+        if not os.path.exists(self.manifest_path):
+            return []
+
+        with open(self.manifest_path, encoding="utf-8") as file:
+            lines = file.readlines()
+
+        # a last line without its newline was cut off while being written
+        if len(lines) > 0 and not lines[-1].endswith("\n"):
+            lines.pop()
+
+        return [json.loads(line) for line in lines]
+
+    def _rewrite_manifest(self) -> None:
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as file:
+            for record in self.records:
+                file.write(
+                    json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                )
+
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def is_completed(self, run: str, lemma: str, units: List[Tuple]) -> bool:
+        """Whether every one of `units` of `lemma` was written under `run`."""
+
+        return set(units) <= self.completed_units.get((run, lemma), set())
+
+    def write(self, run: str, results: Dict[str, np.ndarray]) -> None:
+        """Saves the rows of `results`, which are all of one lemma, except
+        for those of units that were already written under `run`."""
+
+        if len(results["lemma"]) == 0:
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        lemma = str(results["lemma"][0])
+        completed_units = self.completed_units.get((run, lemma), set())
+
+        units = list(
+            zip(*(results[column].tolist() for column in unit_columns_in_results))
+        )
+        is_new = np.array([unit not in completed_units for unit in units], dtype=bool)
+
+        if not is_new.any():
+            return
+
+        part = f"part-{len(self.records):06d}.parquet"
+        part_path = os.path.join(self.parts_dir, part)
+
+        pq.write_table(
+            pa.table(
+                {column: results[column][is_new] for column in self.columns_in_results}
+            ),
+            part_path + ".tmp",
+        )
+        os.replace(part_path + ".tmp", part_path)
+
+        new_units = list(dict.fromkeys(unit for unit, new in zip(units, is_new) if new))
+        record = {
+            "part": part,
+            "run": run,
+            "lemma": lemma,
+            "columns": self.columns_in_results,
+            "units": [list(unit) for unit in new_units],
+        }
+
+        with open(self.manifest_path, "a", encoding="utf-8") as file:
+            file.write(
+                json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            )
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.records.append(record)
+        self.completed_units.setdefault((run, lemma), set()).update(new_units)
+
+    def iterate_results(self, runs: List[str]) -> Iterator[pd.DataFrame]:
+        """Yields the rows written under any of `runs` in the order they were
+        written, leaving out those of other runs kept in the store."""
+
+        import pyarrow.parquet as pq
+
+        for record in self.records:
+            if record["run"] not in runs:
+                continue
+
+            yield pq.read_table(
+                os.path.join(self.parts_dir, record["part"])
+            ).to_pandas()
@@ -1,16 +1,24 @@
-from headword_chooser import choose_headword
-from headword_ranker import rank_headwords
-from match_usage_sense_disambiguator import MatchingUsageHeadwordDisambiguator
-from similarity_calculator import SimilarityCalculator
+from grid_evaluator import GridEvaluator, columns_in_results, concatenate_results
 from similarity_flattener import MaxStrategy, AverageStrategy
 from test_types import Language, TestCaseForMatchingKnownUsages
+import json
+import multiprocessing
 import sys
-from typing import List
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple
 import os
-from run_single_test import read_from_file
+import numpy as np
+from command_line_options import get_option_value
+from memory_usage import format_memory_report, get_memory_usage
+from run_single_test import read_from_file, read_from_jsonl_file
 from itertools import product
-from write_result_files import write_csv
-from get_score import get_correct_minus_avg_incorrect, get_correct_minus_best_incorrect
+
+# torch and transformers are only imported once a model is loaded, and
+# pandas and pyarrow once results are written, so that importing this module
+# is fast
+if TYPE_CHECKING:
+    from match_usage_sense_disambiguator import MatchingUsageHeadwordDisambiguator
 
 all_configs = [
     # Definition weights tested
@@ -34,123 +42,492 @@ GREEN = "\033[32m"
 RESET = "\033[0m"
 
 
-def run_all_examples_with_all_configs(
-    test_cases: List[TestCaseForMatchingKnownUsages],
-    language: Language,
-):
+def run_test_case_with_all_configs(
+    test_case: TestCaseForMatchingKnownUsages,
+    sense_disambiguator: "MatchingUsageHeadwordDisambiguator",
+    grid_evaluator: GridEvaluator,
+) -> Dict[str, np.ndarray]:
+
     results = []
 
-    sense_disambiguator = MatchingUsageHeadwordDisambiguator(language)
-
-    columns_in_results = [
-        "lemma",
-        "definition_weight",
-        "known_usage_similarity_flattener",
-        "known_usage_second_similarity_flattener",
-        "definition_similarity_flattener",
-        "correct_minus_average_incorrect",
-        "correct_minus_best_incorrect",
-        "min_acceptance",
-        "min_delta",
-        "choice_result",
+    prepared_lemma = sense_disambiguator.prepare_lemma(
+        test_case.lemma, test_case.known_headwords
+    )
+
+    for unknown_usage_example in test_case.unknown_usage_examples:
+
+        this_example_embeddings = sense_disambiguator.embed_unknown_usage(
+            prepared_lemma, unknown_usage_example.usage
+        )
+
+        results.append(
+            grid_evaluator.evaluate(
+                test_case.lemma,
+                prepared_lemma,
+                this_example_embeddings,
+                unknown_usage_example.index_of_correct_headword,
+            )
+        )
+
+    return concatenate_results(results)
+
+
+# Set by --profile-startup to print how long loading the model took.
+profile_startup = False
+
+
+def print_startup_times(language: Language, startup_times: Dict[str, float]) -> None:
+    lines = [f"Startup times for {language}:"] + [
+        f"  {step:<28}{seconds:8.3f}s"
+        for step, seconds in [
+            *startup_times.items(),
+            ("total", sum(startup_times.values())),
+        ]
     ]
 
+    # one print, so the lines of several workers do not interleave
+    print("\n".join(lines), flush=True)
+
+
+def _create_sense_disambiguator(
+    language: Language, disambiguator_options: Dict | None
+) -> "MatchingUsageHeadwordDisambiguator":
+    """`disambiguator_options` are keyword arguments of
+    `MatchingUsageHeadwordDisambiguator`, such as `quantize`."""
+
+    start_time = time.perf_counter()
+
+    from match_usage_sense_disambiguator import (
+        DEFAULT_EMBEDDING_CACHE_DIR,
+        MatchingUsageHeadwordDisambiguator,
+    )
+
+    import_time = time.perf_counter() - start_time
+
+    sense_disambiguator = MatchingUsageHeadwordDisambiguator(
+        language,
+        **{
+            "embedding_cache_dir": DEFAULT_EMBEDDING_CACHE_DIR,
+            **(disambiguator_options or {}),
+        },
+    )
+
+    if profile_startup:
+        print_startup_times(
+            language,
+            {
+                "import torch, transformers": import_time,
+                **sense_disambiguator.startup_times,
+            },
+        )
+
+    return sense_disambiguator
+
+
+def iterate_results_of_all_examples(
+    test_cases: Iterable[TestCaseForMatchingKnownUsages],
+    language: Language,
+    disambiguator_options: Dict | None = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the results of each test case as soon as it has run, reading
+    `test_cases` only as far as needed."""
+
+    sense_disambiguator = _create_sense_disambiguator(language, disambiguator_options)
+
+    grid_evaluator = GridEvaluator(config_combinations, choice_values_combinations)
+
     for test_case in test_cases:
 
-        for unknown_usage_example in test_case.unknown_usage_examples:
+        yield run_test_case_with_all_configs(
+            test_case, sense_disambiguator, grid_evaluator
+        )
 
-            this_example_embeddings = sense_disambiguator.get_all_embeddings(
-                test_case.lemma, unknown_usage_example.usage, test_case.known_headwords
-            )
+        print(
+            f"{GREEN}Finished running simulations for lemma {test_case.lemma}.{RESET}"
+        )
 
-            for config_combination in config_combinations:
+    if report_memory:
+        print(format_memory_report([("main", get_memory_usage())]))
 
-                this_examples_similarities = rank_headwords(
-                    len(test_case.known_headwords),
-                    this_example_embeddings,
-                    config_combination[0],
-                    SimilarityCalculator(*config_combination[1:]),
-                )
 
-                correct_minus_avg_incorrect = get_correct_minus_avg_incorrect(
-                    unknown_usage_example.index_of_correct_headword,
-                    this_examples_similarities,
+def run_all_examples_with_all_configs(
+    test_cases: Iterable[TestCaseForMatchingKnownUsages],
+    language: Language,
+    disambiguator_options: Dict | None = None,
+):
+    return (
+        concatenate_results(
+            list(
+                iterate_results_of_all_examples(
+                    test_cases, language, disambiguator_options
                 )
-                correct_minus_best_incorrect = get_correct_minus_best_incorrect(
-                    unknown_usage_example.index_of_correct_headword,
-                    this_examples_similarities,
+            )
+        ),
+        columns_in_results,
+    )
+
+
+# Each worker process loads its own model once in `_initialize_worker`, or
+# inherits the one the parent loaded if the model is shared, and keeps it
+# here for every file it is given.
+_worker_sense_disambiguator = None
+_worker_grid_evaluator = None
+
+
+def _initialize_worker(
+    language: Language,
+    num_threads_per_worker: int,
+    disambiguator_options: Dict | None,
+    should_profile_startup: bool,
+    is_model_shared: bool,
+):
+    global _worker_sense_disambiguator, _worker_grid_evaluator, profile_startup
+
+    profile_startup = should_profile_startup
+
+    import torch
+
+    torch.set_num_threads(num_threads_per_worker)
+
+    if not is_model_shared:
+        _worker_sense_disambiguator = _create_sense_disambiguator(
+            language, disambiguator_options
+        )
+    _worker_grid_evaluator = GridEvaluator(
+        config_combinations, choice_values_combinations
+    )
+
+
+def _run_test_case_in_worker(
+    test_case: TestCaseForMatchingKnownUsages,
+) -> Tuple[str, Dict[str, np.ndarray], int, Dict[str, int] | None]:
+    results = run_test_case_with_all_configs(
+        test_case, _worker_sense_disambiguator, _worker_grid_evaluator
+    )
+
+    return test_case.lemma, results, os.getpid(), get_memory_usage()
+
+
+# Test cases sent to the pool ahead of the result being waited for, so that
+# workers never wait for work while only a few test cases are in memory.
+TASKS_IN_FLIGHT_PER_WORKER = 2
+
+# Set by --share-model to load the model once in the parent process and fork
+# the workers from it, and by --memory-report to print how much memory the
+# workers use.
+share_model = False
+report_memory = False
+
+
+def iterate_results_in_parallel(
+    test_cases: Iterable[TestCaseForMatchingKnownUsages],
+    language: Language,
+    num_workers: int,
+    disambiguator_options: Dict | None = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Runs every test case in its own task on a pool of `num_workers`
+    processes. Results are yielded in the order of `test_cases` no matter
+    which worker finishes first, and at most `TASKS_IN_FLIGHT_PER_WORKER`
+    test cases per worker are read ahead of the results.
+
+    If `share_model` is set, the workers are forked after the parent loaded
+    the model and moved its weights to shared memory, so all workers read
+    the one copy instead of each loading their own."""
+
+    global _worker_sense_disambiguator
+
+    num_threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+
+    if share_model:
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Sharing the model needs processes to be forked.")
+
+        # Sessions of ONNX Runtime are not safe to use in forked processes.
+        if (disambiguator_options or {}).get("inference_backend") == "onnx":
+            raise ValueError("The onnx backend cannot share its model.")
+
+        _worker_sense_disambiguator = _create_sense_disambiguator(
+            language, disambiguator_options
+        )
+        _worker_sense_disambiguator.embedder.model.share_memory()
+
+    worker_memory_usages = {}
+
+    def get_next_result(pending_tasks: deque) -> Dict[str, np.ndarray]:
+        lemma, lemma_results, pid, memory_usage = pending_tasks.popleft().get()
+        worker_memory_usages[pid] = memory_usage
+
+        print(f"{GREEN}Finished running simulations for lemma {lemma}.{RESET}")
+
+        return lemma_results
+
+    try:
+        with multiprocessing.get_context("fork" if share_model else None).Pool(
+            num_workers,
+            initializer=_initialize_worker,
+            initargs=(
+                language,
+                num_threads_per_worker,
+                disambiguator_options,
+                profile_startup,
+                share_model,
+            ),
+        ) as pool:
+
+            pending_tasks = deque()
+
+            for test_case in test_cases:
+                pending_tasks.append(
+                    pool.apply_async(_run_test_case_in_worker, (test_case,))
                 )
 
-                for choice_values in choice_values_combinations:
-                    chosen_index = choose_headword(
-                        this_examples_similarities,
-                        min_acceptance=choice_values[0],
-                        min_delta=choice_values[1],
-                    )
-
-                    if chosen_index is None:
-                        choice_result = 0
-                    elif (
-                        chosen_index == unknown_usage_example.index_of_correct_headword
-                    ):
-                        choice_result = 1
-                    else:
-                        choice_result = -1
-
-                    results.append(
-                        [
-                            test_case.lemma,
-                            config_combination[0],
-                            config_combination[1].__name__,
-                            config_combination[2].__name__,
-                            config_combination[3].__name__,
-                            correct_minus_avg_incorrect,
-                            correct_minus_best_incorrect,
-                            choice_values[0],
-                            choice_values[1],
-                            choice_result,
-                        ]
-                    )
+                if len(pending_tasks) >= num_workers * TASKS_IN_FLIGHT_PER_WORKER:
+                    yield get_next_result(pending_tasks)
 
+            while len(pending_tasks) > 0:
+                yield get_next_result(pending_tasks)
+    finally:
+        _worker_sense_disambiguator = None
+
+    if report_memory:
         print(
-            f"{GREEN}Finished running simulations for lemma {test_case.lemma}.{RESET}"
+            format_memory_report(
+                [("parent", get_memory_usage())]
+                + [
+                    (f"worker {pid}", memory_usage)
+                    for pid, memory_usage in sorted(worker_memory_usages.items())
+                ]
+            )
         )
 
-    return results, columns_in_results
-
 
 def get_all_files_starting_in_dir(dir: str):
     all_files = []
 
-    for file_or_dir in os.listdir(dir):
+    for file_or_dir in sorted(os.listdir(dir)):
 
         joined_with_path = os.path.join(dir, file_or_dir)
 
         if os.path.isdir(joined_with_path):
             all_files.extend(get_all_files_starting_in_dir(joined_with_path))
-        elif os.path.splitext(file_or_dir)[1] == ".json":
+        elif os.path.splitext(file_or_dir)[1] in [".json", ".jsonl"]:
             all_files.append(joined_with_path)
 
     return all_files
 
 
-def run_all_in_dir(dir: str, language: Language):
+def iterate_test_cases_in_dir(dir: str) -> Iterator[TestCaseForMatchingKnownUsages]:
+    """Reads the test cases of every .json file, which holds one test case,
+    and every .jsonl file, which holds one per line, in `dir` one at a time.
+    `dir` may also be a single such file."""
+
+    filenames = [dir] if os.path.isfile(dir) else get_all_files_starting_in_dir(dir)
+
+    for filename in filenames:
+        if os.path.splitext(filename)[1] == ".jsonl":
+            yield from read_from_jsonl_file(filename)
+        else:
+            yield read_from_file(filename)
+
+
+def iterate_results_of_test_cases(
+    test_cases: Iterable[TestCaseForMatchingKnownUsages],
+    language: Language,
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    if num_workers > 1:
+        return iterate_results_in_parallel(
+            test_cases, language, num_workers, disambiguator_options
+        )
+
+    return iterate_results_of_all_examples(test_cases, language, disambiguator_options)
+
+
+def iterate_results_in_dir(
+    dir: str,
+    language: Language,
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the results of the test cases in `dir` one lemma at a time,
+    while the test cases are read one at a time."""
+
+    return iterate_results_of_test_cases(
+        iterate_test_cases_in_dir(dir), language, num_workers, disambiguator_options
+    )
+
+
+def run_all_in_dir(
+    dir: str,
+    language: Language,
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+):
+    return (
+        concatenate_results(
+            list(
+                iterate_results_in_dir(
+                    dir, language, num_workers, disambiguator_options
+                )
+            )
+        ),
+        columns_in_results,
+    )
+
+
+def parse_layers(layers: str) -> List[int] | None:
+    """Parses comma separated layer numbers, or "last" for the last layer."""
+
+    if layers == "last":
+        return None
+
+    try:
+        return [int(layer) for layer in layers.split(",")]
+    except ValueError:
+        raise ValueError(
+            f"Layers must be comma separated layer numbers or 'last', not "
+            f"'{layers}'"
+        )
 
-    all_files = get_all_files_starting_in_dir(dir)
 
-    list_of_test_cases = [read_from_file(filename) for filename in all_files]
+def format_layers(layers: List[int] | None) -> str:
+    return "last" if layers is None else ",".join(str(layer) for layer in layers)
 
-    return run_all_examples_with_all_configs(list_of_test_cases, language)
+
+# Options that change how fast results are produced but not the results, so
+# resuming with other values of them still skips the units already run.
+options_not_changing_results = [
+    "embedding_batch_size",
+    "embedding_batch_tokens",
+    "embedding_cache_dir",
+    "model_bundle_dir",
+]
 
 
-def run_korean_tests():
-    results, columns_in_results = run_all_in_dir("inputs/kor", "korean")
-    write_csv(results, columns_in_results, "test_results/kor")
+def get_run_label(disambiguator_options: Dict | None) -> str:
+    """Identifies the model a lemma was run with among the results of a
+    run, so that units run with other options are not skipped on resume."""
 
+    return json.dumps(
+        {
+            option: value
+            for option, value in (disambiguator_options or {}).items()
+            if option not in options_not_changing_results
+        },
+        sort_keys=True,
+    )
+
+
+def get_all_units() -> List[Tuple]:
+    """The values of `unit_columns_in_results` of every configuration and
+    choice values combination a lemma is run with."""
+
+    return [
+        (
+            definition_weight,
+            *(flattener.__name__ for flattener in flatteners),
+            *choice_values,
+        )
+        for definition_weight, *flatteners in config_combinations
+        for choice_values in choice_values_combinations
+    ]
+
+
+def run_tests(
+    dir: str,
+    language: Language,
+    results_dir: str,
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+    layer_choices: List[List[int] | None] | None = None,
+    resume: bool = False,
+):
+    """Runs the test cases in `dir`, appending the results of each lemma to
+    the result store in `results_dir` as soon as it has run, and then writes
+    every result of these options, old and new, to its `aggregated.csv`.
+
+    If `layer_choices` is given, every test case is run once per choice of
+    embedding layers, treating the layers as one more configuration in a
+    "layers" column. With `resume`, lemmas whose units are all in the store
+    from an earlier run are skipped, and only the units missing from the
+    store are added for the others."""
+
+    from result_store import ResultStore
+    from write_result_files import CsvResultWriter
+
+    if layer_choices is None:
+        runs = [(None, disambiguator_options)]
+        columns = columns_in_results
+    else:
+        runs = [
+            (layers, {**(disambiguator_options or {}), "layers": layers})
+            for layers in layer_choices
+        ]
+        columns = columns_in_results + ["layers"]
+
+    store = ResultStore(results_dir, columns, resume=resume)
+    all_units = get_all_units()
+
+    for layers, run_options in runs:
+        run = get_run_label(run_options)
+
+        test_cases = (
+            test_case
+            for test_case in iterate_test_cases_in_dir(dir)
+            if not store.is_completed(run, test_case.lemma, all_units)
+        )
+
+        for results in iterate_results_of_test_cases(
+            test_cases, language, num_workers, run_options
+        ):
+            if layer_choices is not None:
+                results["layers"] = np.full(
+                    len(results["lemma"]), format_layers(layers), dtype=object
+                )
 
-def run_english_tests():
-    results, columns_in_results = run_all_in_dir("inputs/eng", "english")
-    write_csv(results, columns_in_results, "test_results/eng")
+            store.write(run, results)
+
+    writer = CsvResultWriter(results_dir, columns)
+
+    for results in store.iterate_results(
+        [get_run_label(run_options) for _, run_options in runs]
+    ):
+        writer.write(results)
+
+
+def run_korean_tests(
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+    layer_choices: List[List[int] | None] | None = None,
+    resume: bool = False,
+):
+    run_tests(
+        "inputs/kor",
+        "korean",
+        "test_results/kor",
+        num_workers,
+        disambiguator_options,
+        layer_choices,
+        resume,
+    )
+
+
+def run_english_tests(
+    num_workers: int = 1,
+    disambiguator_options: Dict | None = None,
+    layer_choices: List[List[int] | None] | None = None,
+    resume: bool = False,
+):
+    run_tests(
+        "inputs/eng",
+        "english",
+        "test_results/eng",
+        num_workers,
+        disambiguator_options,
+        layer_choices,
+        resume,
+    )
 
 
 if __name__ == "__main__":
@@ -166,8 +543,51 @@ if __name__ == "__main__":
             "language passed must be one of 'english', 'korean', or 'all'."
         )
 
+    num_workers = int(get_option_value(args, "--workers", "1"))
+    if num_workers < 1:
+        raise ValueError("--workers must be at least 1.")
+
+    disambiguator_options = {
+        "quantize": "--quantize" in args,
+        "layers": parse_layers(get_option_value(args, "--layers", "last")),
+    }
+
+    batch_tokens = get_option_value(args, "--batch-tokens", None)
+    if batch_tokens is not None:
+        disambiguator_options["embedding_batch_tokens"] = int(batch_tokens)
+
+    embedding_dtype = get_option_value(args, "--embedding-dtype", None)
+    if embedding_dtype is not None:
+        disambiguator_options["embedding_dtype"] = embedding_dtype
+
+    embedding_cache_dtype = get_option_value(args, "--embedding-cache-dtype", None)
+    if embedding_cache_dtype is not None:
+        disambiguator_options["embedding_cache_dtype"] = embedding_cache_dtype
+
+    model_bundle_dir = get_option_value(args, "--bundle", None)
+    if model_bundle_dir is not None:
+        disambiguator_options["model_bundle_dir"] = model_bundle_dir
+
+    profile_startup = "--profile-startup" in args
+    share_model = "--share-model" in args
+    report_memory = "--memory-report" in args
+
+    context_window = get_option_value(args, "--context-window", None)
+    if context_window is not None:
+        disambiguator_options["context_window"] = int(context_window)
+
+    # e.g. --layer-sweep "last;8;4;9,10,11,12"
+    layer_sweep = get_option_value(args, "--layer-sweep", None)
+    layer_choices = (
+        [parse_layers(layers) for layers in layer_sweep.split(";")]
+        if layer_sweep is not None
+        else None
+    )
+
+    resume = "--resume" in args
+
     if lang == "english":
-        run_english_tests()
+        run_english_tests(num_workers, disambiguator_options, layer_choices, resume)
 
     elif lang == "korean":
-        run_korean_tests()
+        run_korean_tests(num_workers, disambiguator_options, layer_choices, resume)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, Iterator, List
 from headword_ranker import rank_headwords
 from similarity_calculator import SimilarityCalculator
 from test_types import (
@@ -27,6 +27,24 @@ def delete_sources_from_usages(
             ]
 
 
+def _make_test_case(json_data: Dict) -> TestCaseForMatchingKnownUsages:
+
+    delete_sources_from_usages(json_data["known_headwords"])
+
+    return TestCaseForMatchingKnownUsages(
+        lemma=json_data["lemma"],
+        unknown_usage_examples=[
+            UnknownUsageExample(
+                usage=object["usage"],
+                source=object["source"],
+                index_of_correct_headword=object["index_of_correct_headword"],
+            )
+            for object in json_data["unknown_usage_examples"]
+        ],
+        known_headwords=json_data["known_headwords"],
+    )
+
+
 def read_from_file(
     json_filename: str,
 ) -> TestCaseForMatchingKnownUsages:
@@ -43,39 +61,61 @@ def read_from_file(
     except json.JSONDecodeError:
         raise Exception(f"JSON could not properly decode data in file {json_filename}")
 
-    delete_sources_from_usages(json_data["known_headwords"])
+    return _make_test_case(json_data)
 
-    return TestCaseForMatchingKnownUsages(
-        lemma=json_data["lemma"],
-        unknown_usage_examples=[
-            UnknownUsageExample(
-                usage=object["usage"],
-                source=object["source"],
-                index_of_correct_headword=object["index_of_correct_headword"],
-            )
-            for object in json_data["unknown_usage_examples"]
-        ],
-        known_headwords=json_data["known_headwords"],
-    )
+
+def read_from_jsonl_file(
+    jsonl_filename: str,
+) -> Iterator[TestCaseForMatchingKnownUsages]:
+    """Reads a file holding one test case, in the format of the files
+    `read_from_file` reads, per line. Test cases are read as they are
+    iterated, so only one is in memory at a time. Blank lines are skipped."""
+
+    try:
+        with open(jsonl_filename, "r", encoding="utf-8") as file:
+            for line_number, line in enumerate(file, start=1):
+                if line.strip() == "":
+                    continue
+
+                try:
+                    json_data = json.loads(line)
+                except json.JSONDecodeError:
+                    raise Exception(
+                        f"JSON could not properly decode line {line_number} of "
+                        f"file {jsonl_filename}"
+                    )
+
+                yield _make_test_case(json_data)
+    except IOError:
+        raise Exception(
+            f"IOError occurred while reading from jsonl file {jsonl_filename}"
+        )
 
 
 def do_matching_usage_algorithm(
     disambiguator_args, test_case_data: TestCaseForMatchingKnownUsages
 ):
-    from match_usage_sense_disambiguator import MatchingUsageHeadwordDisambiguator
+    from match_usage_sense_disambiguator import (
+        DEFAULT_EMBEDDING_CACHE_DIR,
+        MatchingUsageHeadwordDisambiguator,
+    )
 
-    sd = MatchingUsageHeadwordDisambiguator(disambiguator_args[0])
+    sd = MatchingUsageHeadwordDisambiguator(
+        disambiguator_args[0], embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR
+    )
+
+    prepared_lemma = sd.prepare_lemma(
+        test_case_data.lemma, test_case_data.known_headwords
+    )
 
     for unknown_usage_example in test_case_data.unknown_usage_examples:
 
-        embeddings = sd.get_all_embeddings(
-            test_case_data.lemma,
-            unknown_usage_example.usage,
-            test_case_data.known_headwords,
+        embeddings = sd.embed_unknown_usage(
+            prepared_lemma, unknown_usage_example.usage
         )
 
         headword_rankings = rank_headwords(
-            len(test_case_data.known_headwords),
+            prepared_lemma,
             embeddings,
             disambiguator_args[1],
             SimilarityCalculator(*disambiguator_args[2:]),
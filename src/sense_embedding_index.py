@@ -0,0 +1,270 @@
+import json
+import os
+from typing import Dict, List
+import numpy as np
+from prepared_lemma import DEFAULT_NUM_PROBES, PreparedLemma, UsageClusters
+from usage_clusters import build_usage_clusters
+
+METADATA_FILENAME = "meta.json"
+LEMMAS_FILENAME = "lemmas.json"
+
+# Row matrices, written incrementally and memory-mapped when read.
+DEFINITIONS_FILENAME = "definitions.bin"
+USAGES_FILENAME = "usages.bin"
+CENTROIDS_FILENAME = "centroids.bin"
+CLUSTER_SUMS_FILENAME = "cluster_sums.bin"
+
+# Offset tables, written once at the end and read into memory. Each lemma
+# is a range of headwords, each headword a range of senses (definition rows),
+# each sense a range of usages, and each lemma a range of usage clusters
+# whose members are ranges of `cluster_members`.
+OFFSET_FILENAMES = [
+    "lemma_headword_offsets",
+    "headword_sense_offsets",
+    "sense_usage_offsets",
+    "lemma_cluster_offsets",
+    "cluster_member_offsets",
+    "cluster_members",
+]
+
+DEFAULT_MIN_USAGES_FOR_CLUSTERS = 1024
+
+
+class SenseEmbeddingIndexWriter:
+    """Builds a `SenseEmbeddingIndex` in `index_dir` from prepared lemmas
+    added one at a time, so the whole dictionary never has to fit in memory.
+
+    Lemmas with at least `min_usages_for_clusters` known usages also get
+    their usages clustered, so that they can be searched approximately."""
+
+    def __init__(
+        self,
+        index_dir: str,
+        pretrained_model: str,
+        hidden_size: int,
+        *,
+        min_usages_for_clusters: int = DEFAULT_MIN_USAGES_FOR_CLUSTERS,
+        dtype: str = "float32",
+    ):
+        if dtype not in ["float16", "float32"]:
+            raise ValueError(f"Unsupported sense embedding index dtype '{dtype}'")
+
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.index_dir = index_dir
+        self.dtype = np.dtype(dtype)
+        self.metadata = {
+            "pretrained_model": pretrained_model,
+            "hidden_size": hidden_size,
+            "dtype": dtype,
+        }
+        self.min_usages_for_clusters = min_usages_for_clusters
+
+        self.lemmas: List[str] = []
+        self.offsets: Dict[str, List[int]] = {
+            name: [0] for name in OFFSET_FILENAMES if name != "cluster_members"
+        }
+        self.cluster_members: List[np.ndarray] = []
+
+        self.files = {
+            filename: open(os.path.join(index_dir, filename), "wb")
+            for filename in [
+                DEFINITIONS_FILENAME,
+                USAGES_FILENAME,
+                CENTROIDS_FILENAME,
+                CLUSTER_SUMS_FILENAME,
+            ]
+        }
+
+    def _append_offsets(self, name: str, local_offsets: np.ndarray) -> None:
+        self.offsets[name].extend((self.offsets[name][-1] + local_offsets[1:]).tolist())
+
+    def add(self, prepared_lemma: PreparedLemma) -> None:
+        self.lemmas.append(prepared_lemma.lemma)
+
+        self.files[DEFINITIONS_FILENAME].write(
+            prepared_lemma.definition_embeddings.astype(self.dtype).tobytes()
+        )
+        self.files[USAGES_FILENAME].write(
+            prepared_lemma.usage_embeddings.astype(self.dtype).tobytes()
+        )
+
+        self._append_offsets(
+            "headword_sense_offsets", prepared_lemma.headword_sense_offsets
+        )
+        self._append_offsets("sense_usage_offsets", prepared_lemma.sense_usage_offsets)
+        self.offsets["lemma_headword_offsets"].append(
+            len(self.offsets["headword_sense_offsets"]) - 1
+        )
+
+        num_usages = len(prepared_lemma.usage_embeddings)
+
+        if num_usages >= self.min_usages_for_clusters:
+            usage_clusters = build_usage_clusters(
+                prepared_lemma.usage_embeddings, int(np.sqrt(num_usages))
+            )
+
+            self.files[CENTROIDS_FILENAME].write(usage_clusters.centroids.tobytes())
+            self.files[CLUSTER_SUMS_FILENAME].write(usage_clusters.sums.tobytes())
+            self._append_offsets(
+                "cluster_member_offsets", usage_clusters.member_offsets
+            )
+            self.cluster_members.append(usage_clusters.members)
+
+        self.offsets["lemma_cluster_offsets"].append(
+            len(self.offsets["cluster_member_offsets"]) - 1
+        )
+
+    def close(self) -> None:
+        for file in self.files.values():
+            file.close()
+
+        for name, offsets in self.offsets.items():
+            np.save(
+                os.path.join(self.index_dir, f"{name}.npy"),
+                np.array(offsets, dtype=np.int32),
+            )
+
+        np.save(
+            os.path.join(self.index_dir, "cluster_members.npy"),
+            np.concatenate([np.zeros(0, dtype=np.int32), *self.cluster_members]),
+        )
+
+        with open(
+            os.path.join(self.index_dir, LEMMAS_FILENAME), "w", encoding="utf-8"
+        ) as file:
+            json.dump(self.lemmas, file, ensure_ascii=False)
+
+        # written last, so an interrupted build is never mistaken for an index
+        with open(
+            os.path.join(self.index_dir, METADATA_FILENAME), "w", encoding="utf-8"
+        ) as file:
+            json.dump(self.metadata, file)
+
+
+class SenseEmbeddingIndex:
+    """Precomputed definition and known usage embeddings of every lemma in a
+    dictionary, as written by `SenseEmbeddingIndexWriter`.
+
+    Embeddings are memory-mapped, so a lemma's prepared headwords are slices
+    of the mapped matrices and only the pages of the lemmas actually looked
+    up are read from disk."""
+
+    def __init__(self, index_dir: str, *, num_probes: int = DEFAULT_NUM_PROBES):
+        with open(
+            os.path.join(index_dir, METADATA_FILENAME), "r", encoding="utf-8"
+        ) as file:
+            metadata = json.load(file)
+
+        with open(
+            os.path.join(index_dir, LEMMAS_FILENAME), "r", encoding="utf-8"
+        ) as file:
+            self.index_of_lemma = {
+                lemma: index for index, lemma in enumerate(json.load(file))
+            }
+
+        self.pretrained_model: str = metadata["pretrained_model"]
+        self.hidden_size: int = metadata["hidden_size"]
+        self.num_probes = num_probes
+
+        embedding_dtype = np.dtype(metadata["dtype"])
+
+        self.offsets = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"))
+            for name in OFFSET_FILENAMES
+        }
+
+        self.definition_embeddings = self._map_rows(
+            index_dir, DEFINITIONS_FILENAME, embedding_dtype
+        )
+        self.usage_embeddings = self._map_rows(
+            index_dir, USAGES_FILENAME, embedding_dtype
+        )
+        # clusters are few, so their centroids and sums are always float32
+        self.centroids = self._map_rows(
+            index_dir, CENTROIDS_FILENAME, np.dtype(np.float32)
+        )
+        self.cluster_sums = self._map_rows(
+            index_dir, CLUSTER_SUMS_FILENAME, np.dtype(np.float32)
+        )
+
+    def _map_rows(self, index_dir: str, filename: str, dtype: np.dtype) -> np.ndarray:
+        path = os.path.join(index_dir, filename)
+        num_rows = os.path.getsize(path) // (self.hidden_size * dtype.itemsize)
+
+        if num_rows == 0:
+            return np.zeros((0, self.hidden_size), dtype=dtype)
+
+        return np.memmap(
+            path, dtype=dtype, mode="r", shape=(num_rows, self.hidden_size)
+        )
+
+    def __len__(self) -> int:
+        return len(self.index_of_lemma)
+
+    def __contains__(self, lemma: str) -> bool:
+        return lemma in self.index_of_lemma
+
+    def _get_range(self, name: str, start: int, end: int) -> np.ndarray:
+        """Offsets `start` up to and including `end` of the table `name`,
+        shifted to start from 0."""
+
+        offsets = self.offsets[name][start : end + 1]
+
+        return offsets - offsets[0]
+
+    def get_prepared_lemma(self, lemma: str) -> PreparedLemma | None:
+        """Returns the prepared headwords of `lemma`, or `None` if it is not
+        in the index. Since known usages are not stored, its
+        `tagged_known_usages` is empty."""
+
+        index = self.index_of_lemma.get(lemma)
+
+        if index is None:
+            return None
+
+        first_headword, end_headword = self.offsets["lemma_headword_offsets"][
+            index : index + 2
+        ]
+        first_sense, end_sense = self.offsets["headword_sense_offsets"][
+            [first_headword, end_headword]
+        ]
+        first_usage, end_usage = self.offsets["sense_usage_offsets"][
+            [first_sense, end_sense]
+        ]
+
+        return PreparedLemma(
+            lemma=lemma,
+            tagged_known_usages=(),
+            definition_embeddings=self.definition_embeddings[first_sense:end_sense],
+            usage_embeddings=self.usage_embeddings[first_usage:end_usage],
+            headword_sense_offsets=self._get_range(
+                "headword_sense_offsets", first_headword, end_headword
+            ),
+            sense_usage_offsets=self._get_range(
+                "sense_usage_offsets", first_sense, end_sense
+            ),
+            usage_clusters=self._get_usage_clusters(index),
+        )
+
+    def _get_usage_clusters(self, index: int) -> UsageClusters | None:
+        first_cluster, end_cluster = self.offsets["lemma_cluster_offsets"][
+            index : index + 2
+        ]
+
+        if first_cluster == end_cluster:
+            return None
+
+        first_member, end_member = self.offsets["cluster_member_offsets"][
+            [first_cluster, end_cluster]
+        ]
+
+        return UsageClusters(
+            centroids=self.centroids[first_cluster:end_cluster],
+            sums=self.cluster_sums[first_cluster:end_cluster],
+            member_offsets=self._get_range(
+                "cluster_member_offsets", first_cluster, end_cluster
+            ),
+            members=self.offsets["cluster_members"][first_member:end_member],
+            num_probes=self.num_probes,
+        )
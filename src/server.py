@@ -0,0 +1,228 @@
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from annotate import Annotator
+from command_line_options import get_option_value
+from headword_lookup import open_headword_lookup
+from match_usage_sense_disambiguator import (
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    MatchingUsageHeadwordDisambiguator,
+)
+from micro_batcher import MicroBatcher
+from sense_embedding_index import SenseEmbeddingIndex
+
+
+class DisambiguationService:
+    """Answers disambiguation requests in micro-batches, so that the model
+    is loaded once and concurrent requests share forward passes.
+
+    A request is either `{"lemma": ..., "sentence": ...}`, answered with the
+    ranking of the lemma's headwords and the chosen headword, or
+    `{"text": ...}`, answered with the annotations of every lemma found in
+    the text."""
+
+    def __init__(
+        self,
+        annotator: Annotator,
+        *,
+        max_batch_size: int = 32,
+        max_wait_seconds: float = 0.01,
+    ):
+        self.annotator = annotator
+        self.batcher = MicroBatcher(
+            self.process_batch,
+            max_batch_size=max_batch_size,
+            max_wait_seconds=max_wait_seconds,
+        )
+
+    def __call__(self, request: Dict) -> Dict:
+        if "text" in request:
+            if not isinstance(request["text"], str):
+                raise ValueError("'text' must be a string.")
+        elif not (
+            isinstance(request.get("lemma"), str)
+            and isinstance(request.get("sentence"), str)
+        ):
+            raise ValueError("Requests need a 'text', or a 'lemma' and 'sentence'.")
+
+        return self.batcher(request)
+
+    def process_batch(self, requests: List[Dict]) -> List[Dict | Exception]:
+        """Answers `requests` together, or one at a time if that fails, so
+        that a request that cannot be answered only fails itself."""
+
+        try:
+            return self._process_requests(requests)
+        except Exception:
+            if len(requests) == 1:
+                raise
+
+        responses: List[Dict | Exception] = []
+
+        for request in requests:
+            try:
+                responses.extend(self._process_requests([request]))
+            except Exception as error:
+                responses.append(error)
+
+        return responses
+
+    def _process_requests(self, requests: List[Dict]) -> List[Dict]:
+        responses: List[Dict | None] = [None] * len(requests)
+
+        text_indices = [i for i, request in enumerate(requests) if "text" in request]
+        annotated_documents = self.annotator.annotate(
+            [{"text": requests[i]["text"]} for i in text_indices]
+        )
+
+        for i, document in zip(text_indices, annotated_documents):
+            responses[i] = {"annotations": document["annotations"]}
+
+        lemma_requests = []
+
+        for i, request in enumerate(requests):
+            if "text" in request:
+                continue
+
+            prepared_lemma = self.annotator.get_prepared_lemma(request["lemma"])
+
+            if prepared_lemma is None:
+                responses[i] = {"error": f"Unknown lemma '{request['lemma']}'"}
+            else:
+                lemma_requests.append((i, prepared_lemma, request["sentence"]))
+
+        all_embeddings = self.annotator.disambiguator.embed_unknown_usages_batch(
+            [prepared_lemma.lemma for _, prepared_lemma, _ in lemma_requests],
+            [sentence for _, _, sentence in lemma_requests],
+        )
+
+        for (i, prepared_lemma, _), embeddings in zip(lemma_requests, all_embeddings):
+            responses[i] = self.annotator.choose(prepared_lemma, embeddings)
+
+        return responses
+
+    def get_metrics(self) -> Dict:
+        return {
+            **self.batcher.metrics.get_summary(),
+            "lemma_cache": self.annotator.prepared_lemmas.get_info(),
+            "embedding_batches": (
+                self.annotator.disambiguator.embedder.padding_statistics.get_summary()
+            ),
+            "lemmatizer_cache": (
+                self.annotator.disambiguator.usage_preprocessor.lemmatizer.get_cache_info()
+            ),
+        }
+
+
+class DisambiguationRequestHandler(BaseHTTPRequestHandler):
+    """POST /disambiguate and POST /annotate take one JSON request each, and
+    GET /metrics returns latency percentiles and cache statistics."""
+
+    service: DisambiguationService
+
+    def _send_json(self, status: int, body: Dict) -> None:
+        encoded_body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        self._send_json(200, self.service.get_metrics())
+
+    def do_POST(self) -> None:
+        if self.path not in ["/disambiguate", "/annotate"]:
+            self._send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        try:
+            request = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            )
+
+            if not isinstance(request, dict):
+                raise ValueError("The request body must be a JSON object.")
+
+            if self.path == "/annotate":
+                request = {"text": request.get("text")}
+            else:
+                request = {
+                    "lemma": request.get("lemma"),
+                    "sentence": request.get("sentence"),
+                }
+
+            response = self.service(request)
+        except ValueError as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+
+        self._send_json(200 if "error" not in response else 404, response)
+
+    def log_message(self, format: str, *args) -> None:
+        # one line per request on stderr would cost more than the requests
+        pass
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) < 3:
+        raise ValueError("""Usage: `python server.py
+            <language>
+            <dictionary_path (test case directory or database)>
+            [--host <host>]
+            [--port <port>]
+            [--max-batch-size <n>]
+            [--max-wait-ms <ms>]
+            [--batch-tokens <n>]
+            [--sense-index <index_dir>]`""")
+
+    if args[1] not in ["korean", "english"]:
+        raise ValueError(f"Unknown language supplied '{args[1]}'")
+
+    host = get_option_value(args, "--host", "127.0.0.1")
+    port = int(get_option_value(args, "--port", "8080"))
+    sense_index_dir = get_option_value(args, "--sense-index", None)
+    batch_tokens = get_option_value(args, "--batch-tokens", None)
+
+    DisambiguationRequestHandler.service = DisambiguationService(
+        Annotator(
+            MatchingUsageHeadwordDisambiguator(
+                args[1],
+                embedding_cache_dir=DEFAULT_EMBEDDING_CACHE_DIR,
+                embedding_batch_tokens=(
+                    int(batch_tokens) if batch_tokens is not None else None
+                ),
+            ),
+            open_headword_lookup(args[2]),
+            sense_embedding_index=(
+                SenseEmbeddingIndex(sense_index_dir)
+                if sense_index_dir is not None
+                else None
+            ),
+        ),
+        max_batch_size=int(get_option_value(args, "--max-batch-size", "32")),
+        max_wait_seconds=float(get_option_value(args, "--max-wait-ms", "10")) / 1000,
+    )
+
+    server = ThreadingHTTPServer((host, port), DisambiguationRequestHandler)
+    print(f"Listening on http://{host}:{port}", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        DisambiguationRequestHandler.service.batcher.close()
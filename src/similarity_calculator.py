@@ -1,6 +1,86 @@
-from typing import List
+from typing import Tuple
+from prepared_lemma import UsageClusters
 from similarity_flattener import SimilarityFlatteningStrategy
-import torch
+import numpy as np
+
+# Same lower bound on norms that `torch.cosine_similarity` uses.
+NORM_EPSILON = 1e-8
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalizes the last dimension of `embeddings` so that cosine
+    similarities become dot products."""
+
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+    return embeddings / np.maximum(norms, NORM_EPSILON)
+
+
+def get_cosine_similarities(
+    normalized_unknown_usage_embedding: np.ndarray,
+    normalized_embeddings: np.ndarray,
+) -> np.ndarray:
+    """Cosine similarity of the unknown usage with every row of
+    `normalized_embeddings`, computed as one matrix-vector product."""
+
+    return (normalized_embeddings @ normalized_unknown_usage_embedding).astype(
+        np.float64
+    )
+
+
+def get_approximate_cosine_similarities(
+    normalized_unknown_usage_embedding: np.ndarray,
+    normalized_usage_embeddings: np.ndarray,
+    usage_clusters: UsageClusters,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Like `get_cosine_similarities`, but only the usages of the
+    `num_probes` clusters closest to the unknown usage are compared with it.
+    Every other usage is given the mean similarity of its cluster's usages,
+    computed exactly from the cluster's sum, so the result still has one
+    score per usage for the flatteners. Also returns which scores are exact
+    rather than such means."""
+
+    centroid_similarities = get_cosine_similarities(
+        normalized_unknown_usage_embedding, usage_clusters.centroids
+    )
+
+    cluster_sizes = np.diff(usage_clusters.member_offsets)
+    # the mean of the dot products with the usages is the dot product with
+    # their mean
+    mean_similarities = np.divide(
+        (usage_clusters.sums @ normalized_unknown_usage_embedding).astype(np.float64),
+        cluster_sizes,
+        out=np.zeros(len(cluster_sizes), dtype=np.float64),
+        where=cluster_sizes > 0,
+    )
+
+    similarities = np.empty(len(normalized_usage_embeddings), dtype=np.float64)
+    similarities[usage_clusters.members] = np.repeat(mean_similarities, cluster_sizes)
+
+    num_probes = min(usage_clusters.num_probes, usage_clusters.num_clusters)
+    probed_clusters = np.argpartition(-centroid_similarities, num_probes - 1)[
+        :num_probes
+    ]
+
+    offsets = usage_clusters.member_offsets
+    probed_usages = np.sort(
+        np.concatenate(
+            [
+                usage_clusters.members[offsets[cluster] : offsets[cluster + 1]]
+                for cluster in probed_clusters
+            ]
+        )
+    )
+
+    similarities[probed_usages] = get_cosine_similarities(
+        normalized_unknown_usage_embedding,
+        normalized_usage_embeddings[probed_usages],
+    )
+
+    is_exact = np.zeros(len(normalized_usage_embeddings), dtype=bool)
+    is_exact[probed_usages] = True
+
+    return similarities, is_exact
 
 
 class SimilarityCalculator:
@@ -15,65 +95,51 @@ class SimilarityCalculator:
         self.known_usage_second_similarity_flattener = known_usage_second_similarity_flattener()
         self.definition_similarity_flattener = definition_similarity_flattener()
 
-    def _get_similarity_of_tensors(self, t1: torch.Tensor, t2: torch.Tensor) -> float:
-        t1, t2 = t1.squeeze(0), t2.squeeze(0)
-        similarity = torch.cosine_similarity(t1, t2, dim=0)
-        return similarity.item()
-
     def get_similarities_of_sense_definitions(
         self,
-        unknown_usage_embedding: torch.Tensor,
-        sense_definition_embeddings: List[torch.Tensor],
-    ) -> List[float]:
-        before_flattening = [
-            [
-                self._get_similarity_of_tensors(
-                    unknown_usage_embedding, definition_embedding
-                )
-                for definition_embedding in sense_definition_set_embeddings
-            ]
-            for sense_definition_set_embeddings in sense_definition_embeddings
-        ]
+        normalized_unknown_usage_embedding: np.ndarray,
+        normalized_definition_embeddings: np.ndarray,
+        headword_sense_offsets: np.ndarray,
+    ) -> np.ndarray:
+        similarities = get_cosine_similarities(
+            normalized_unknown_usage_embedding, normalized_definition_embeddings
+        )
 
-        return [
-            self.definition_similarity_flattener.flatten_to_single_score(similarities)
-            for similarities in before_flattening
-        ]
+        return self.definition_similarity_flattener.flatten_segments(
+            similarities, headword_sense_offsets
+        )
 
     def get_similarities_of_sense_known_usages(
         self,
-        unknown_usage_embedding: torch.Tensor,
-        sense_known_usage_embeddings: List[List[List[torch.Tensor]]],
-    ) -> List[float]:
-
-        headword_similarities = []
-
-        for headword in sense_known_usage_embeddings:
-            sense_similarities = []
-
-            for known_sense in headword:
-                # Calculate similarities for all usage examples of this sense.
-                usage_similarities = [
-                    self._get_similarity_of_tensors(
-                        unknown_usage_embedding, known_embedding
-                    )
-                    for known_embedding in known_sense
-                ]
-
-                # Flatten similarities for this sense.
-                sense_similarity = (
-                    self.known_usage_similarity_flattener.flatten_to_single_score(
-                        usage_similarities
-                    )
-                )
-                sense_similarities.append(sense_similarity)
+        normalized_unknown_usage_embedding: np.ndarray,
+        normalized_usage_embeddings: np.ndarray,
+        sense_usage_offsets: np.ndarray,
+        headword_sense_offsets: np.ndarray,
+        usage_clusters: UsageClusters | None = None,
+    ) -> np.ndarray:
+        # Flatten similarities of the usage examples of each sense.
+        if usage_clusters is None:
+            similarities = get_cosine_similarities(
+                normalized_unknown_usage_embedding, normalized_usage_embeddings
+            )
+
+            sense_similarities = self.known_usage_similarity_flattener.flatten_segments(
+                similarities, sense_usage_offsets
+            )
+        else:
+            similarities, is_exact = get_approximate_cosine_similarities(
+                normalized_unknown_usage_embedding,
+                normalized_usage_embeddings,
+                usage_clusters,
+            )
 
-            # Flatten sense similarities for this headword.
-            headword_similarity = (
-                self.known_usage_second_similarity_flattener.flatten_to_single_score(
-                    sense_similarities
+            sense_similarities = (
+                self.known_usage_similarity_flattener.flatten_segments_with_estimates(
+                    similarities, is_exact, sense_usage_offsets
                 )
             )
-            headword_similarities.append(headword_similarity)
 
-        return headword_similarities
+        # Flatten sense similarities for each headword.
+        return self.known_usage_second_similarity_flattener.flatten_segments(
+            sense_similarities, headword_sense_offsets
+        )
@@ -12,6 +12,42 @@ class SimilarityFlatteningStrategy(ABC):
     def flatten_to_single_score(self, scores: List[float]) -> float:
         pass
 
+    @abstractmethod
+    def flatten_segments(self, scores: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """Flattens each segment `scores[offsets[i]:offsets[i + 1]]` to a single
+        score the same way `flatten_to_single_score` would."""
+        pass
+
+    def flatten_segments_with_estimates(
+        self, scores: np.ndarray, is_exact: np.ndarray, offsets: np.ndarray
+    ) -> np.ndarray:
+        """`flatten_segments` of scores of which only those where `is_exact`
+        are exact, and the others are estimates such as the mean score of a
+        group. Estimates are used like exact scores unless overridden."""
+
+        return self.flatten_segments(scores, offsets)
+
+    def _reduce_non_empty_segments(
+        self, reduction: np.ufunc, values: np.ndarray, offsets: np.ndarray
+    ) -> np.ndarray:
+        """Applies `reduction.reduceat` to every non-empty segment. Empty
+        segments are left as `similarity_for_empty_list`."""
+
+        segment_lengths = np.diff(offsets)
+        reduced = np.full(
+            len(segment_lengths), self.similarity_for_empty_list, dtype=np.float64
+        )
+
+        non_empty = segment_lengths > 0
+
+        # Empty segments add nothing between the starts of the non-empty
+        # ones, so reducing from each non-empty start to the next covers
+        # exactly that segment.
+        if np.any(non_empty):
+            reduced[non_empty] = reduction.reduceat(values, offsets[:-1][non_empty])
+
+        return reduced
+
 
 class AverageStrategy(SimilarityFlatteningStrategy):
 
@@ -26,6 +62,28 @@ class AverageStrategy(SimilarityFlatteningStrategy):
 
         return np.mean(np.array(nonzeroes))
 
+    def flatten_segments(self, scores: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        is_positive = scores > 0.0
+
+        sums_of_positives = self._reduce_non_empty_segments(
+            np.add, np.where(is_positive, scores, 0.0), offsets
+        )
+        numbers_of_positives = self._reduce_non_empty_segments(
+            np.add, is_positive.astype(np.float64), offsets
+        )
+
+        averages = np.divide(
+            sums_of_positives,
+            numbers_of_positives,
+            out=np.zeros_like(sums_of_positives),
+            where=numbers_of_positives > 0,
+        )
+
+        is_empty = np.diff(offsets) == 0
+        averages[is_empty] = self.similarity_for_empty_list
+
+        return averages
+
 
 class MaxStrategy(SimilarityFlatteningStrategy):
 
@@ -34,3 +92,26 @@ class MaxStrategy(SimilarityFlatteningStrategy):
             return self.similarity_for_empty_list
 
         return np.max(np.array(scores))
+
+    def flatten_segments(self, scores: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        return self._reduce_non_empty_segments(np.maximum, scores, offsets)
+
+    def flatten_segments_with_estimates(
+        self, scores: np.ndarray, is_exact: np.ndarray, offsets: np.ndarray
+    ) -> np.ndarray:
+        """An estimate can be above every exact score of the usages it is
+        given to, as a group's mean is raised by the usages of other senses in
+        it, so estimates are left out of segments with an exact score.
+        Segments without one use their largest estimate."""
+
+        exact_maxima = self._reduce_non_empty_segments(
+            np.maximum, np.where(is_exact, scores, -np.inf), offsets
+        )
+        has_exact = (
+            self._reduce_non_empty_segments(
+                np.add, is_exact.astype(np.float64), offsets
+            )
+            > 0
+        )
+
+        return np.where(has_exact, exact_maxima, self.flatten_segments(scores, offsets))
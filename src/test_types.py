@@ -4,25 +4,25 @@ from dataclasses import dataclass
 type Language = Literal["english", "korean"]
 
 
-@dataclass
+@dataclass(slots=True)
 class UnknownUsageExample:
     usage: str
     source: str
     index_of_correct_headword: int
 
 
-@dataclass
+@dataclass(slots=True)
 class KnownSenseInformation:
     definition: str
     known_usages: List[str]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class KnownHeadwordInformation:
     known_senses: List[KnownSenseInformation]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TestCaseForMatchingKnownUsages:
     lemma: str
     unknown_usage_examples: List[UnknownUsageExample]
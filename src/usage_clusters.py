@@ -0,0 +1,51 @@
+import numpy as np
+from prepared_lemma import UsageClusters
+from similarity_calculator import normalize_embeddings
+
+
+def build_usage_clusters(
+    normalized_usage_embeddings: np.ndarray,
+    num_clusters: int,
+    *,
+    num_iterations: int = 10,
+    seed: int = 0,
+) -> UsageClusters:
+    """Spherical k-means over the rows of `normalized_usage_embeddings`."""
+
+    # float16 embeddings would be converted in every product below
+    normalized_usage_embeddings = normalized_usage_embeddings.astype(
+        np.float32, copy=False
+    )
+    num_usages = len(normalized_usage_embeddings)
+    num_clusters = max(1, min(num_clusters, num_usages))
+
+    rng = np.random.default_rng(seed)
+    centroids = normalized_usage_embeddings[
+        rng.choice(num_usages, num_clusters, replace=False)
+    ].astype(np.float32)
+
+    for _ in range(num_iterations):
+        assignments = np.argmax(normalized_usage_embeddings @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, normalized_usage_embeddings)
+
+        # clusters that lost every usage keep their previous centroid
+        is_empty = np.bincount(assignments, minlength=num_clusters) == 0
+        sums[is_empty] = centroids[is_empty]
+
+        centroids = normalize_embeddings(sums).astype(np.float32)
+
+    assignments = np.argmax(normalized_usage_embeddings @ centroids.T, axis=1)
+
+    sums = np.zeros(centroids.shape, dtype=np.float64)
+    np.add.at(sums, assignments, normalized_usage_embeddings)
+
+    return UsageClusters(
+        centroids=centroids,
+        sums=sums.astype(np.float32),
+        member_offsets=np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=num_clusters))]
+        ).astype(np.int32),
+        members=np.argsort(assignments, kind="stable").astype(np.int32),
+    )
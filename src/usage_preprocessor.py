@@ -1,69 +1,130 @@
 import re
-from typing import List
-from lemmatizer import Lemmatizer
+from typing import List, Tuple
+from lemmatizer import Lemmatizer, find_index_of_lemma
 from test_types import KnownHeadwordInformation
 
+CURLY_PATTERN = re.compile(r"\{(.*)?\}")
+
+TGT = "[TGT]"
+END_TGT = "[/TGT]"
+
+
+# The known usages of every sense of every headword, with [TGT] and [/TGT]
+# around their targets.
+type TaggedKnownUsages = Tuple[Tuple[Tuple[str, ...], ...], ...]
+
+
+def _is_already_tagged(text: str) -> bool:
+    tgt_index = text.find(TGT)
+
+    return tgt_index != -1 and text.find(END_TGT, tgt_index) != -1
+
 
 class UsagePreprocessor:
 
-    def __init__(self, lemmatizer):
+    def __init__(self, lemmatizer: Lemmatizer):
         self.lemmatizer = lemmatizer
 
     def get_tagged_unknown_usage(
         self,
         target_lemma: str,
         unknown_usage: str,
-    ):
-        return self._find_lemma_and_mark_with_tgt(unknown_usage, target_lemma)
+    ) -> str:
+        return self._find_lemma_and_mark_with_tgt(
+            unknown_usage, target_lemma, self.lemmatizer.get_lemmas(unknown_usage)
+        )
+
+    def get_tagged_unknown_usages_batch(
+        self, target_lemmas: List[str], unknown_usages: List[str]
+    ) -> List[str]:
+        """`get_tagged_unknown_usage` of every unknown usage for the target
+        lemma at the same index, lemmatizing the usages together."""
+
+        return [
+            self._find_lemma_and_mark_with_tgt(unknown_usage, target_lemma, lemmas)
+            for target_lemma, unknown_usage, lemmas in zip(
+                target_lemmas,
+                unknown_usages,
+                self.lemmatizer.get_lemmas_batch(unknown_usages),
+            )
+        ]
 
-    def tag_headwords_with_targets(
+    def tag_known_usages(
         self,
         target_lemma: str,
         known_headwords: List[KnownHeadwordInformation],
-    ) -> None:
-        """Mutates known_headwords in place."""
+    ) -> TaggedKnownUsages:
+        """Returns the known usages of every sense of every headword with the
+        target marked, leaving `known_headwords` untouched. Usages that
+        already contain [TGT]...[/TGT] are not tagged again."""
+
+        # Usages without curly braces have to be lemmatized to find the
+        # target, so they are lemmatized together up front.
+        usages_to_lemmatize = [
+            usage
+            for headword in known_headwords
+            for sense in headword["known_senses"]
+            for usage in sense["known_usages"]
+            if not _is_already_tagged(usage) and CURLY_PATTERN.search(usage) is None
+        ]
+        lemmas_by_usage = dict(
+            zip(
+                usages_to_lemmatize,
+                self.lemmatizer.get_lemmas_batch(usages_to_lemmatize),
+            )
+        )
+
+        return tuple(
+            tuple(
+                tuple(
+                    self._tag_usage(usage, target_lemma, lemmas_by_usage.get(usage))
+                    for usage in sense["known_usages"]
+                )
+                for sense in headword["known_senses"]
+            )
+            for headword in known_headwords
+        )
+
+    def _tag_usage(
+        self, usage: str, target_lemma: str, lemmas: List[List[str]] | None
+    ) -> str:
+        """`lemmas` are those of `usage`, or `None` if it does not need
+        lemmatizing because it is already tagged or has curly braces."""
 
-        self._replace_curly_in_all_known_usages(known_headwords, target_lemma)
+        if _is_already_tagged(usage):
+            return usage
 
-    def _find_lemma_and_mark_with_tgt(self, text: str, target_lemma: str) -> str:
-        """Finds the lemma that is to be disambiguated. If it does not exist
-        in the string, then `None` is returned."""
+        return self._replace_curly_with_tgt(usage, target_lemma, lemmas)
 
-        index_of_target_lemma = self.lemmatizer.find_index_of_lemma(text, target_lemma)
+    def _find_lemma_and_mark_with_tgt(
+        self, text: str, target_lemma: str, lemmas: List[List[str]]
+    ) -> str:
+        """Finds the lemma that is to be disambiguated and surrounds its token
+        with [TGT] and [/TGT]. If it does not exist in the string, then the
+        whole string is surrounded. `lemmas` are those of `text`."""
+
+        index_of_target_lemma = find_index_of_lemma(lemmas, target_lemma)
 
         if index_of_target_lemma == -1:
             # if cannot find lemma exactly, the whole text is target
-            return "[TGT]" + text + "[/TGT]"
+            return TGT + text + END_TGT
 
         individual_tokens = text.split(" ")
 
         with_replaced = [
-            "[TGT]" + token + "[/TGT]" if i == index_of_target_lemma else token
+            TGT + token + END_TGT if i == index_of_target_lemma else token
             for i, token in enumerate(individual_tokens)
         ]
 
         return " ".join(with_replaced)
 
-    def _replace_curly_with_tgt(self, text: str, target_lemma: str) -> str:
-        pattern = r"\{(.*)?\}"
-        replacer = re.compile(pattern)
-
-        replaced = replacer.sub(r"[TGT]\1[/TGT]", text)
+    def _replace_curly_with_tgt(
+        self, text: str, target_lemma: str, lemmas: List[List[str]] | None
+    ) -> str:
+        replaced = CURLY_PATTERN.sub(r"[TGT]\1[/TGT]", text)
 
         # saw a change
         if text != replaced:
             return replaced
 
-        return self._find_lemma_and_mark_with_tgt(text, target_lemma)
-
-    def _replace_curly_in_all_known_usages(
-        self, known_headwords: List[KnownHeadwordInformation], target_lemma: str
-    ) -> None:
-
-        for headword in known_headwords:
-            for sense in headword["known_senses"]:
-
-                sense["known_usages"] = [
-                    self._replace_curly_with_tgt(usage, target_lemma)
-                    for usage in sense["known_usages"]
-                ]
+        return self._find_lemma_and_mark_with_tgt(text, target_lemma, lemmas)
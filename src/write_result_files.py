@@ -1,8 +1,8 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib import rc
 import os
-import plotly.express as px
+
+# matplotlib and plotly are imported by the functions that plot, so that
+# writing the CSV of results does not wait for them to load
 
 
 def write_csv(results, columns_in_results, path_to_dir):
@@ -10,7 +10,25 @@ def write_csv(results, columns_in_results, path_to_dir):
     df.to_csv(f"{path_to_dir}/aggregated.csv", index=False)
 
 
+class CsvResultWriter:
+    """Writes results to `aggregated.csv` in `path_to_dir` as they are
+    produced, one batch of rows at a time. The file starts with only the
+    header, and appending every batch gives the same file as `write_csv` of
+    all of them."""
+
+    def __init__(self, path_to_dir, columns_in_results):
+        self.path = f"{path_to_dir}/aggregated.csv"
+        self.columns_in_results = columns_in_results
+
+        pd.DataFrame(columns=columns_in_results).to_csv(self.path, index=False)
+
+    def write(self, results):
+        df = pd.DataFrame(results, columns=self.columns_in_results)
+        df.to_csv(self.path, mode="a", header=False, index=False)
+
+
 def write_pngs(path_to_dir):
+    from matplotlib import rc
 
     df = pd.read_csv(f"{path_to_dir}/aggregated.csv")
 
@@ -23,6 +41,7 @@ def write_pngs(path_to_dir):
 
 
 def write_all_lemma_files(df: pd.DataFrame, path_to_dir: str):
+    import matplotlib.pyplot as plt
 
     lemmas = df["lemma"].unique()
 
@@ -47,6 +66,8 @@ def write_all_lemma_files(df: pd.DataFrame, path_to_dir: str):
 
 
 def do_bar_plot(df, title: str):
+    import matplotlib.pyplot as plt
+
     df.plot(
         kind="bar",
         title=title,
@@ -69,7 +90,9 @@ def combine_config_columns(df: pd.DataFrame):
 
     def format_config(column_config):
         return (
-            f"{column_config['definition_weight']}"
+            # only results of a layer sweep have layers
+            (f"L{column_config['layers']}/" if "layers" in column_config else "")
+            + f"{column_config['definition_weight']}"
             + f"/{column_config['known_usage_similarity_flattener'][0]}"
             + f"/{column_config['known_usage_second_similarity_flattener'][0]}"
             + f"/{column_config['definition_similarity_flattener'][0]}"
@@ -80,7 +103,7 @@ def combine_config_columns(df: pd.DataFrame):
         "known_usage_similarity_flattener",
         "known_usage_second_similarity_flattener",
         "definition_similarity_flattener",
-    ]
+    ] + (["layers"] if "layers" in df.columns else [])
 
     new_df["combined_config"] = new_df[columns_to_combine].apply(format_config, axis=1)
 
@@ -106,6 +129,7 @@ def add_correct_statistics(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def write_aggregated_file(df: pd.DataFrame, path_to_dir: str):
+    import matplotlib.pyplot as plt
 
     aggregated_df = add_correct_statistics(df)
 
@@ -131,7 +155,8 @@ def combine_config_plus_choice_value_columns(df: pd.DataFrame) -> pd.DataFrame:
 
     def format_column(column_config):
         return (
-            f"{column_config['definition_weight']}"
+            (f"L{column_config['layers']}/" if "layers" in column_config else "")
+            + f"{column_config['definition_weight']}"
             + f"/{column_config['known_usage_similarity_flattener'][0]}"
             + f"/{column_config['known_usage_second_similarity_flattener'][0]}"
             + f"/{column_config['definition_similarity_flattener'][0]}"
@@ -146,7 +171,7 @@ def combine_config_plus_choice_value_columns(df: pd.DataFrame) -> pd.DataFrame:
         "definition_similarity_flattener",
         "min_acceptance",
         "min_delta",
-    ]
+    ] + (["layers"] if "layers" in df.columns else [])
 
     new_df["combined_config_and_choice_values"] = new_df[columns_to_combine].apply(
         format_column, axis=1
@@ -174,6 +199,8 @@ def add_choice_result_statistics(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def write_choice_result_scatter_plot(df: pd.DataFrame, path_to_dir: str):
+    import matplotlib.pyplot as plt
+    import plotly.express as px
 
     df = combine_config_plus_choice_value_columns(df)
     df = add_choice_result_statistics(df)
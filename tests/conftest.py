@@ -0,0 +1,44 @@
+import os
+import string
+import sys
+import pytest
+
+# the modules of the project import each other by their flat names
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture
+def make_tiny_bert(tmp_path):
+    """Saves a small randomly initialized BERT with `max_position_embeddings`
+    positions and a vocabulary of ASCII letters and digits, and returns its
+    directory, which `Embedder` loads like a pretrained model name."""
+
+    def make(max_position_embeddings: int = 512) -> str:
+        import torch
+        from transformers import BertConfig, BertModel, BertTokenizerFast
+
+        model_dir = tmp_path / f"tiny-bert-{max_position_embeddings}"
+        model_dir.mkdir()
+
+        characters = string.ascii_lowercase + string.digits
+        vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+        vocab += list(characters) + [f"##{character}" for character in characters]
+        (model_dir / "vocab.txt").write_text("\n".join(vocab) + "\n")
+
+        BertTokenizerFast(str(model_dir / "vocab.txt")).save_pretrained(model_dir)
+
+        torch.manual_seed(0)
+        BertModel(
+            BertConfig(
+                vocab_size=len(vocab),
+                hidden_size=16,
+                num_hidden_layers=2,
+                num_attention_heads=2,
+                intermediate_size=32,
+                max_position_embeddings=max_position_embeddings,
+            )
+        ).save_pretrained(model_dir)
+
+        return str(model_dir)
+
+    return make
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from async_disambiguator import AsyncDisambiguator
+
+
+class FakeDisambiguator:
+    usage_preprocessor = SimpleNamespace(
+        lemmatizer=SimpleNamespace(max_parsers=1),
+        get_tagged_unknown_usage=lambda lemma, sentence: f"[TGT] {sentence} [/TGT]",
+    )
+
+    def embed_tagged_unknown_usages_batch(self, unknown_usages, tagged_unknown_usages):
+        if "bad" in unknown_usages:
+            raise RuntimeError("cannot embed 'bad'")
+
+        return unknown_usages
+
+
+class FakeAnnotator:
+    disambiguator = FakeDisambiguator()
+
+    def get_prepared_lemma(self, lemma):
+        return None if lemma == "unknown" else lemma
+
+    def choose(self, prepared_lemma, embeddings):
+        return {"lemma": prepared_lemma, "sentence": embeddings}
+
+
+def test_a_failing_request_only_fails_itself():
+    async def run():
+        async with AsyncDisambiguator(
+            FakeAnnotator(), max_batch_size=8
+        ) as disambiguator:
+            return await asyncio.gather(
+                disambiguator.disambiguate("a", "good"),
+                disambiguator.disambiguate("b", "bad"),
+                disambiguator.disambiguate("unknown", "good"),
+                disambiguator.disambiguate("c", "also good"),
+                return_exceptions=True,
+            )
+
+    good, bad, unknown, also_good = asyncio.run(run())
+
+    assert good == {"lemma": "a", "sentence": "good"}
+    assert isinstance(bad, RuntimeError)
+    assert unknown == {"error": "Unknown lemma 'unknown'"}
+    assert also_good == {"lemma": "c", "sentence": "also good"}
+
+
+def test_a_failing_request_alone_fails():
+    async def run():
+        async with AsyncDisambiguator(FakeAnnotator()) as disambiguator:
+            await disambiguator.disambiguate("b", "bad")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
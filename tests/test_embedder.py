@@ -0,0 +1,54 @@
+import torch
+from embedder import Embedder
+
+
+def test_long_text_on_short_model_is_split_into_windows(make_tiny_bert):
+    embedder = Embedder(make_tiny_bert(max_position_embeddings=64), 8, None)
+
+    # one subword token per word, far more than fit in 62 body tokens
+    text = " ".join("abcdefghij"[i % 10] for i in range(500))
+
+    windows, text_indices = embedder._split_into_windows(embedder._tokenize([text]))
+    num_counted_tokens = sum(sum(mask) for mask in windows["counted_mask"])
+
+    assert len(text_indices) > 1
+    assert all(len(input_ids) <= 64 for input_ids in windows["input_ids"])
+    # every token, [CLS] and [SEP] included, is counted by exactly one window
+    assert num_counted_tokens == 502
+
+    [embedding] = embedder.get_average_token_embeddings([text])
+
+    assert torch.isfinite(embedding).all()
+
+
+def test_long_target_text_on_short_model(make_tiny_bert):
+    embedder = Embedder(make_tiny_bert(max_position_embeddings=64), 8, None)
+
+    words = ["a"] * 300
+    words[150] = "[TGT] b [/TGT]"
+
+    [embedding] = embedder.get_embeddings_from_tgt_marked_texts([" ".join(words)])
+
+    assert torch.isfinite(embedding).all()
+
+
+def test_float16_embedding_cache(make_tiny_bert, tmp_path):
+    pretrained_model = make_tiny_bert()
+    cache_dir = str(tmp_path / "cache")
+    texts = ["abc def", "gh [TGT] ij [/TGT] k"]
+
+    def embed(embedder):
+        return embedder.get_average_token_embeddings(
+            texts[:1]
+        ) + embedder.get_embeddings_from_tgt_marked_texts(texts[1:])
+
+    uncached = embed(Embedder(pretrained_model, 8, None))
+    embed(Embedder(pretrained_model, 8, cache_dir, embedding_cache_dtype="float16"))
+    cached = embed(
+        Embedder(pretrained_model, 8, cache_dir, embedding_cache_dtype="float16")
+    )
+
+    assert (tmp_path / "cache" / "float16" / "embeddings.bin").exists()
+    for cached_embedding, embedding in zip(cached, uncached):
+        assert torch.allclose(cached_embedding, embedding, atol=1e-2)
+        assert torch.equal(cached_embedding, embedding.half().float())
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+from grid_evaluator import GridEvaluator
+from headword_chooser import choose_headword
+from headword_ranker import rank_headwords
+from prepared_lemma import PreparedLemma, UnknownUsageEmbeddings
+from run_all_tests import choice_values_combinations, config_combinations
+from similarity_calculator import SimilarityCalculator, normalize_embeddings
+
+HIDDEN_SIZE = 8
+
+
+def _make_prepared_lemma(rng, num_senses_by_headword, num_usages_by_sense):
+    return PreparedLemma(
+        lemma="lemma",
+        tagged_known_usages=(),
+        definition_embeddings=normalize_embeddings(
+            rng.normal(size=(sum(num_senses_by_headword), HIDDEN_SIZE))
+        ).astype(np.float32),
+        usage_embeddings=normalize_embeddings(
+            rng.normal(size=(sum(num_usages_by_sense), HIDDEN_SIZE))
+        ).astype(np.float32),
+        headword_sense_offsets=np.concatenate(
+            [[0], np.cumsum(num_senses_by_headword)]
+        ).astype(np.int32),
+        sense_usage_offsets=np.concatenate(
+            [[0], np.cumsum(num_usages_by_sense)]
+        ).astype(np.int32),
+    )
+
+
+def _evaluate_with_loops(
+    prepared_lemma, unknown_usage_embeddings, index_of_correct_headword
+):
+    """The rows of `GridEvaluator.evaluate`, from ranking and choosing under
+    one configuration and choice values pair at a time."""
+
+    rows = []
+
+    for definition_weight, *flatteners in config_combinations:
+        ranking = rank_headwords(
+            prepared_lemma,
+            unknown_usage_embeddings,
+            definition_weight,
+            SimilarityCalculator(*flatteners),
+        )
+        score_of = dict(ranking)
+        incorrect_scores = [
+            score for index, score in ranking if index != index_of_correct_headword
+        ]
+        correct_score = score_of[index_of_correct_headword]
+
+        for min_acceptance, min_delta in choice_values_combinations:
+            chosen = choose_headword(
+                ranking, min_acceptance=min_acceptance, min_delta=min_delta
+            )
+
+            rows.append(
+                (
+                    correct_score - np.mean(incorrect_scores),
+                    correct_score - max(incorrect_scores),
+                    (
+                        0
+                        if chosen is None
+                        else 1 if chosen == index_of_correct_headword else -1
+                    ),
+                )
+            )
+
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_grid_matches_ranking_and_choosing_each_config(seed):
+    rng = np.random.default_rng(seed)
+
+    num_senses_by_headword = [3, 1, 2, 0]
+    # a sense without any known usages is scored as an empty list
+    num_usages_by_sense = [2, 0, 4, 1, 3, 2]
+    prepared_lemma = _make_prepared_lemma(
+        rng, num_senses_by_headword, num_usages_by_sense
+    )
+
+    unknown_usage_embeddings = UnknownUsageEmbeddings(
+        average_token_embedding=normalize_embeddings(
+            rng.normal(size=HIDDEN_SIZE)
+        ).astype(np.float32),
+        lemma_embedding=normalize_embeddings(rng.normal(size=HIDDEN_SIZE)).astype(
+            np.float32
+        ),
+    )
+    grid_evaluator = GridEvaluator(config_combinations, choice_values_combinations)
+
+    # every headword in turn, so that both correct and incorrect choices
+    # are made
+    for index_of_correct_headword in range(len(num_senses_by_headword)):
+        results = grid_evaluator.evaluate(
+            "lemma",
+            prepared_lemma,
+            unknown_usage_embeddings,
+            index_of_correct_headword,
+        )
+        expected_rows = _evaluate_with_loops(
+            prepared_lemma, unknown_usage_embeddings, index_of_correct_headword
+        )
+
+        assert len(results["choice_result"]) == len(expected_rows)
+        np.testing.assert_allclose(
+            results["correct_minus_average_incorrect"],
+            [row[0] for row in expected_rows],
+            atol=1e-12,
+        )
+        np.testing.assert_allclose(
+            results["correct_minus_best_incorrect"],
+            [row[1] for row in expected_rows],
+            atol=1e-12,
+        )
+        assert results["choice_result"].tolist() == [row[2] for row in expected_rows]
@@ -0,0 +1,62 @@
+import json
+from dictionary_store import DictionaryStore
+from import_dictionary import import_dictionary, read_urimalsaem_export
+
+
+def _write_export(path, items):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"channel": {"item": items}}, file, ensure_ascii=False)
+
+
+def _item(word, group_code, sense_no, definition, examples=()):
+    return {
+        "group_code": group_code,
+        "wordinfo": {"word": word},
+        "senseinfo": {
+            "sense_no": sense_no,
+            "definition": definition,
+            "example_info": [{"example": example} for example in examples],
+        },
+    }
+
+
+def test_senses_spread_over_files_are_grouped_into_headwords(tmp_path):
+    _write_export(
+        tmp_path / "1.json",
+        [
+            _item("가다01", "1", 2, "go (2)", ["b"]),
+            _item("가다02", "2", 1, "grind"),
+        ],
+    )
+    _write_export(tmp_path / "2.json", [_item("가다01", "1", 1, "go (1)", ["a"])])
+
+    [(lemma, headwords, source_ids)] = read_urimalsaem_export(str(tmp_path))
+
+    assert lemma == "가다"
+    assert source_ids == ["1", "2"]
+    assert headwords == [
+        {
+            "known_senses": [
+                {"definition": "go (1)", "known_usages": ["a"]},
+                {"definition": "go (2)", "known_usages": ["b"]},
+            ]
+        },
+        {"known_senses": [{"definition": "grind", "known_usages": []}]},
+    ]
+
+
+def test_importing_again_does_not_duplicate_headwords(tmp_path):
+    export_path = tmp_path / "export.json"
+    _write_export(export_path, [_item("하늘", "1", 1, "sky", ["a"])])
+
+    store = DictionaryStore(str(tmp_path / "dictionary.sqlite"))
+
+    for _ in range(2):
+        import_dictionary(store, read_urimalsaem_export(str(export_path)))
+
+    assert store.get_num_headwords_by_lemma() == {"하늘": 1}
+    assert store.get_known_headwords("하늘") == [
+        {"known_senses": [{"definition": "sky", "known_usages": ["a"]}]}
+    ]
+
+    store.close()
@@ -0,0 +1,37 @@
+import threading
+import time
+from typing import List
+from lemmatizer import Lemmatizer
+
+
+class CountingLemmatizer(Lemmatizer):
+    def __init__(self, max_parsers: int):
+        super().__init__(max_parsers=max_parsers)
+        self.num_created = 0
+
+    def _create_parser(self):
+        self.num_created += 1
+
+        return object()
+
+    def _compute_lemmas(self, text: str) -> List[List[str]]:
+        with self._borrow_parser():
+            time.sleep(0.01)
+
+            return [[token] for token in text.split()]
+
+
+def test_parsers_are_limited_to_max_parsers():
+    lemmatizer = CountingLemmatizer(max_parsers=2)
+
+    threads = [
+        threading.Thread(target=lemmatizer.get_lemmas, args=(f"text {i}",))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 1 <= lemmatizer.num_created <= 2
+    assert lemmatizer.get_lemmas("text 3") == [["text"], ["3"]]
@@ -0,0 +1,39 @@
+import shutil
+import torch
+from embedder import Embedder
+from model_bundle import read_model_bundle_info, save_model_bundle
+
+
+def test_moved_bundle_loads_its_model_and_dictionary(make_tiny_bert, tmp_path):
+    pretrained_model = make_tiny_bert()
+    embedder = Embedder(pretrained_model, 8, None)
+
+    dictionary_dir = tmp_path / "dictionary"
+    dictionary_dir.mkdir()
+    (dictionary_dir / "sys.dic").write_bytes(b"dictionary")
+
+    save_model_bundle(
+        str(tmp_path / "bundle"),
+        "korean",
+        pretrained_model,
+        embedder.tokenizer,
+        embedder.model,
+        str(dictionary_dir),
+    )
+    shutil.move(tmp_path / "bundle", tmp_path / "moved")
+    shutil.rmtree(dictionary_dir)
+
+    bundle_info = read_model_bundle_info(str(tmp_path / "moved"))
+
+    with open(f"{bundle_info['mecab_dictionary_path']}/sys.dic", "rb") as file:
+        assert file.read() == b"dictionary"
+
+    bundled_embedder = Embedder(
+        pretrained_model, 8, None, bundle_dir=str(tmp_path / "moved")
+    )
+    text = "abc [TGT] de [/TGT] f"
+
+    assert torch.allclose(
+        bundled_embedder.get_embeddings_from_tgt_marked_texts([text])[0],
+        embedder.get_embeddings_from_tgt_marked_texts([text])[0],
+    )
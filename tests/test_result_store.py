@@ -0,0 +1,126 @@
+import os
+import numpy as np
+from grid_evaluator import columns_in_results
+from result_store import MANIFEST_FILENAME, PARTS_DIRNAME, ResultStore
+
+RUN = "{}"
+
+
+def _make_results(lemma, min_acceptances, min_deltas):
+    """Rows of `lemma` with one unit per pair of choice values."""
+
+    units = [
+        (min_acceptance, min_delta)
+        for min_acceptance in min_acceptances
+        for min_delta in min_deltas
+    ]
+    num_rows = len(units)
+
+    return {
+        "lemma": np.full(num_rows, lemma, dtype=object),
+        "definition_weight": np.full(num_rows, 0.2),
+        "known_usage_similarity_flattener": np.full(
+            num_rows, "MaxStrategy", dtype=object
+        ),
+        "known_usage_second_similarity_flattener": np.full(
+            num_rows, "MaxStrategy", dtype=object
+        ),
+        "definition_similarity_flattener": np.full(
+            num_rows, "AverageStrategy", dtype=object
+        ),
+        "correct_minus_average_incorrect": np.arange(num_rows, dtype=np.float64),
+        "correct_minus_best_incorrect": np.zeros(num_rows),
+        "min_acceptance": np.array([unit[0] for unit in units]),
+        "min_delta": np.array([unit[1] for unit in units]),
+        "choice_result": np.ones(num_rows, dtype=np.int64),
+    }
+
+
+def _get_units(results):
+    return [
+        (0.2, "MaxStrategy", "MaxStrategy", "AverageStrategy", *unit)
+        for unit in zip(results["min_acceptance"], results["min_delta"])
+    ]
+
+
+def _read_all_rows(store):
+    return [
+        tuple(row)
+        for df in store.iterate_results([RUN])
+        for row in df[["lemma", "min_acceptance", "min_delta"]].itertuples(index=False)
+    ]
+
+
+def test_truncated_manifest_line_is_dropped_on_resume(tmp_path):
+    store = ResultStore(str(tmp_path), columns_in_results)
+    first = _make_results("a", [0.3], [0.0, 0.1])
+    second = _make_results("b", [0.3], [0.0, 0.1])
+    store.write(RUN, first)
+    store.write(RUN, second)
+
+    # a run killed while writing its third part and manifest line
+    stray_part = tmp_path / PARTS_DIRNAME / "part-000002.parquet"
+    stray_part.write_bytes(b"PAR1")
+    with open(tmp_path / MANIFEST_FILENAME, "a", encoding="utf-8") as file:
+        file.write('{"part":"part-000002.parquet","run":"{}","lem')
+
+    resumed = ResultStore(str(tmp_path), columns_in_results, resume=True)
+
+    assert len(resumed.records) == 2
+    assert not stray_part.exists()
+    assert resumed.is_completed(RUN, "a", _get_units(first))
+    assert resumed.is_completed(RUN, "b", _get_units(second))
+    with open(tmp_path / MANIFEST_FILENAME, encoding="utf-8") as file:
+        assert file.read().endswith("\n")
+
+    resumed.write(RUN, _make_results("c", [0.3], [0.0]))
+
+    assert _read_all_rows(resumed) == [
+        ("a", 0.3, 0.0),
+        ("a", 0.3, 0.1),
+        ("b", 0.3, 0.0),
+        ("b", 0.3, 0.1),
+        ("c", 0.3, 0.0),
+    ]
+    assert sorted(os.listdir(tmp_path / PARTS_DIRNAME)) == [
+        "part-000000.parquet",
+        "part-000001.parquet",
+        "part-000002.parquet",
+    ]
+
+
+def test_resuming_a_partly_run_lemma_only_adds_the_missing_units(tmp_path):
+    store = ResultStore(str(tmp_path), columns_in_results)
+    store.write(RUN, _make_results("a", [0.3], [0.0, 0.1]))
+
+    all_results = _make_results("a", [0.3, 0.4], [0.0, 0.1])
+    resumed = ResultStore(str(tmp_path), columns_in_results, resume=True)
+
+    assert not resumed.is_completed(RUN, "a", _get_units(all_results))
+    assert not resumed.is_completed("other run", "a", _get_units(all_results)[:2])
+
+    resumed.write(RUN, all_results)
+
+    assert resumed.is_completed(RUN, "a", _get_units(all_results))
+    assert _read_all_rows(resumed) == [
+        ("a", 0.3, 0.0),
+        ("a", 0.3, 0.1),
+        ("a", 0.4, 0.0),
+        ("a", 0.4, 0.1),
+    ]
+
+    # writing units that are all stored already adds nothing
+    resumed.write(RUN, all_results)
+
+    assert len(resumed.records) == 2
+
+
+def test_without_resume_earlier_results_are_removed(tmp_path):
+    store = ResultStore(str(tmp_path), columns_in_results)
+    store.write(RUN, _make_results("a", [0.3], [0.0]))
+
+    restarted = ResultStore(str(tmp_path), columns_in_results)
+
+    assert restarted.records == []
+    assert os.listdir(tmp_path / PARTS_DIRNAME) == []
+    assert _read_all_rows(restarted) == []
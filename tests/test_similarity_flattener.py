@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from similarity_flattener import AverageStrategy, MaxStrategy
+
+
+@pytest.mark.parametrize("strategy_class", [AverageStrategy, MaxStrategy])
+def test_flatten_segments_matches_flatten_to_single_score(strategy_class):
+    strategy = strategy_class()
+    rng = np.random.default_rng(0)
+
+    # empty segments at the start, in the middle and at the end, and
+    # segments without any positive score
+    segment_lengths = [0, 3, 1, 0, 0, 5, 2, 0, 4, 0]
+    offsets = np.concatenate([[0], np.cumsum(segment_lengths)]).astype(np.int32)
+    scores = rng.uniform(-1.0, 1.0, offsets[-1])
+    scores[offsets[2]] = 0.0
+    scores[offsets[6] : offsets[7]] = -np.abs(scores[offsets[6] : offsets[7]])
+
+    flattened = strategy.flatten_segments(scores, offsets)
+
+    assert flattened.shape == (len(segment_lengths),)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        assert flattened[i] == pytest.approx(
+            strategy.flatten_to_single_score(scores[start:end].tolist())
+        )
+
+
+@pytest.mark.parametrize("strategy_class", [AverageStrategy, MaxStrategy])
+def test_flatten_segments_of_only_empty_segments(strategy_class):
+    strategy = strategy_class()
+
+    flattened = strategy.flatten_segments(np.zeros(0), np.zeros(4, dtype=np.int32))
+
+    assert flattened.tolist() == [strategy.similarity_for_empty_list] * 3